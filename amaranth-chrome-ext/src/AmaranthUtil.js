@@ -10,16 +10,18 @@ class AmaranthUtil {
   }
 
   /**
-   * Removes special characters from a string. The characters to remove are
-   * defined in `AmaranthUtil.specialCharacters`.
+   * Removes special characters from a string. By default, the characters to
+   * remove are defined in `AmaranthUtil.specialCharacters`.
    * @param {string} str String to remove special characters from
+   * @param {string=} specialCharacters The characters to remove
    * @return {string} A new string with all characters in `str` except
-   * characters defined in `AmaranthUtil.specialCharacters`
+   * characters in `specialCharacters`
    */
-  static removeSpecialCharacters(str) {
+  static removeSpecialCharacters(
+      str, specialCharacters = AmaranthUtil.specialCharacters) {
     let newStr = '';
     for (const char of str) {
-      if (!AmaranthUtil.specialCharacters.includes(char)) {
+      if (!specialCharacters.includes(char)) {
         newStr += char;
       }
     }
@@ -49,6 +51,43 @@ class AmaranthUtil {
     }
     return arr;
   }
+
+  /**
+   * Computes the CRC-32 checksum of a string's UTF-8 bytes, the same checksum
+   * as Python's `zlib.crc32(str.encode('utf-8'))`.
+   * @param {string} str The string to checksum
+   * @return {number} The checksum, an unsigned 32-bit integer
+   */
+  static crc32(str) {
+    let crc = 0xFFFFFFFF;
+    const update = (byte) => {
+      crc ^= byte;
+      for (let bit = 0; bit < 8; bit++) {
+        crc = (crc >>> 1) ^ (0xEDB88320 & -(crc & 1));
+      }
+    };
+
+    for (const char of str) {
+      const codePoint = char.codePointAt(0);
+      if (codePoint < 0x80) {
+        update(codePoint);
+      } else if (codePoint < 0x800) {
+        update(0xC0 | (codePoint >> 6));
+        update(0x80 | (codePoint & 0x3F));
+      } else if (codePoint < 0x10000) {
+        update(0xE0 | (codePoint >> 12));
+        update(0x80 | ((codePoint >> 6) & 0x3F));
+        update(0x80 | (codePoint & 0x3F));
+      } else {
+        update(0xF0 | (codePoint >> 18));
+        update(0x80 | ((codePoint >> 12) & 0x3F));
+        update(0x80 | ((codePoint >> 6) & 0x3F));
+        update(0x80 | (codePoint & 0x3F));
+      }
+    }
+
+    return (crc ^ 0xFFFFFFFF) >>> 0;
+  }
 }
 
 if (typeof module !== 'undefined') {
@@ -2,15 +2,21 @@
 class CalorieLabeller {
   /**
    * Creates a CalorieLabeller object.
-   * @param {Map<string, number>} tokenizer A mapping from dish name tokens to
-   * unique integers
+   * @param {Tokenizer} tokenizer Converts dish names into model inputs
    * @param {tf.LayersModel} model Tensorflow.js layers ML model
+   * @param {number=} cacheSize The most labels to cache for repeated dish names
    */
-  constructor(tokenizer, model) {
-    /** @private @const @type {Map<string, number>} */
+  constructor(tokenizer, model, cacheSize = 1000) {
+    /** @private @const @type {Tokenizer} */
     this.tokenizer_ = tokenizer;
     /** @private @const @type {tf.LayersModel} */
     this.model_ = model;
+    /**
+     * Labels keyed on the normalized tokens of dish names, so repeated dish
+     * names skip the model entirely.
+     * @private @const @type {LruCache<string, CalorieLabel>}
+     */
+    this.cache_ = new LruCache(cacheSize);
   }
 
   /**
@@ -19,22 +25,25 @@ class CalorieLabeller {
    * @return {CalorieLabel} The calorie label for the dish named dishName
    */
   label(dishName) {
-    dishName = AmaranthUtil.removeSpecialCharacters(dishName).toLowerCase();
-    const splitDishName = dishName.split(/\s+/);
+    const cacheKey = this.tokenizer_.tokenize(dishName).join(' ');
+    let calorieLabel = this.cache_.get(cacheKey);
+    if (calorieLabel === undefined) {
+      calorieLabel = this.labelUncached_(dishName);
+      this.cache_.set(cacheKey, calorieLabel);
+    }
 
-    const tokenizedDishName = splitDishName.map((word) => {
-      if (this.tokenizer_.has(word)) {
-        return this.tokenizer_.get(word);
-      } else {
-        return this.tokenizer_.get('OOV');
-      }
-    });
+    return calorieLabel;
+  }
 
-    // Ensure tokenizedDishName.length === 43 for input into ML model. This is
-    // because the number 43 was the largest input in our original dataset
-    const inputLength = 43;
-    const input = AmaranthUtil.padArray(tokenizedDishName, inputLength, 0)
-        .slice(0, inputLength);
+  /**
+   * Labels a single dish as high or low calorie using the ML model.
+   * @private
+   * @param {string} dishName The name of the dish to label
+   * @return {CalorieLabel} The calorie label for the dish named dishName
+   */
+  labelUncached_(dishName) {
+    // The tokenizer pads/truncates inputs to the length the ML model expects
+    const input = this.tokenizer_.encode(dishName);
     const inputTensor = tf.tensor([input]);
     const calorieLabels = this.model_.predict(inputTensor);
 
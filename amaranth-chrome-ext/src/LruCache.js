@@ -0,0 +1,67 @@
+/**
+ * A bounded cache which evicts its least recently used entry when full.
+ * @template K, V Generic types for keys and values
+ */
+class LruCache {
+  /**
+   * Creates an LruCache object.
+   * @param {number} maxSize The maximum number of entries to cache
+   */
+  constructor(maxSize) {
+    /** @private @const @type {number} */
+    this.maxSize_ = maxSize;
+    /**
+     * Maps iterate in insertion order, so the first key is the least recently
+     * used one.
+     * @private @const @type {Map<K, V>}
+     */
+    this.entries_ = new Map();
+    /** @public @type {number} */
+    this.hits = 0;
+    /** @public @type {number} */
+    this.misses = 0;
+  }
+
+  /**
+   * The number of cached entries.
+   * @public @const @type {number}
+   */
+  get size() {
+    return this.entries_.size;
+  }
+
+  /**
+   * Looks up a cached value, marking it as most recently used.
+   * @param {K} key The key of the value to look up
+   * @return {V|undefined} The cached value, or undefined if it isn't cached
+   */
+  get(key) {
+    if (!this.entries_.has(key)) {
+      this.misses++;
+      return undefined;
+    }
+
+    this.hits++;
+    const value = this.entries_.get(key);
+    this.entries_.delete(key);
+    this.entries_.set(key, value);
+    return value;
+  }
+
+  /**
+   * Caches a value, evicting the least recently used one if full.
+   * @param {K} key The key of the value to cache
+   * @param {V} value The value to cache
+   */
+  set(key, value) {
+    this.entries_.delete(key);
+    this.entries_.set(key, value);
+    while (this.entries_.size > this.maxSize_) {
+      this.entries_.delete(this.entries_.keys().next().value);
+    }
+  }
+}
+
+if (typeof module !== 'undefined') {
+  module.exports = LruCache;
+}
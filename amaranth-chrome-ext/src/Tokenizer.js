@@ -0,0 +1,143 @@
+/**
+ * Converts dish names into the token ids the ML model takes as input.
+ *
+ * Tokenizers are loaded from the same versioned JSON format that
+ * `amaranth.ml.tokenizer.Tokenizer` saves, so dish names are encoded exactly
+ * the same way in the Chrome extension as they are in Python. Tokens are
+ * either looked up in a vocabulary or, if the tokenizer has `num_buckets`,
+ * split into character n-grams that are hashed into that many ids.
+ */
+class Tokenizer {
+  /**
+   * Creates a Tokenizer object from its saved JSON format.
+   * @param {{
+   *   version: number,
+   *   filters: string,
+   *   max_length: number,
+   *   oov_id: number,
+   *   vocab: string[],
+   *   num_buckets: ?number,
+   *   ngram_size: ?number
+   * }} config A tokenizer saved by `amaranth.ml.tokenizer.Tokenizer.save`
+   */
+  constructor(config) {
+    if (!(config.version >= Tokenizer.minFormatVersion &&
+          config.version <= Tokenizer.formatVersion)) {
+      throw new Error(`Unsupported tokenizer format version ` +
+          `${config.version}, expected ${Tokenizer.minFormatVersion} to ` +
+          `${Tokenizer.formatVersion}`);
+    }
+
+    /** @private @const @type {string} */
+    this.filters_ = config.filters;
+    /** @private @const @type {number} */
+    this.maxLength_ = config.max_length;
+    /** @private @const @type {number} */
+    this.oovId_ = config.oov_id;
+    /** @private @const @type {Map<string, number>} */
+    this.vocab_ = new Map();
+    config.vocab.forEach((token, id) => {
+      if (token) {
+        this.vocab_.set(token, id);
+      }
+    });
+    /** @private @const @type {?number} */
+    this.numBuckets_ = config.num_buckets || null;
+    /** @private @const @type {number} */
+    this.ngramSize_ = config.ngram_size || 3;
+  }
+
+  /** @public @const @type {number} */
+  static get formatVersion() {
+    return 2;
+  }
+
+  /**
+   * The oldest saved format that can still be loaded.
+   * @public @const @type {number}
+   */
+  static get minFormatVersion() {
+    return 1;
+  }
+
+  /** @public @const @type {number} */
+  static get paddingId() {
+    return 0;
+  }
+
+  /**
+   * The number of token ids in each encoded dish name.
+   * @public @const @type {number}
+   */
+  get maxLength() {
+    return this.maxLength_;
+  }
+
+  /**
+   * Lowercases a dish name and removes filtered characters from it.
+   * @param {string} dishName The dish name to normalize
+   * @return {string} The normalized dish name
+   */
+  normalize(dishName) {
+    return AmaranthUtil.removeSpecialCharacters(
+        dishName.toLowerCase(), this.filters_);
+  }
+
+  /**
+   * Normalizes a dish name and splits it into whitespace-separated tokens.
+   * @param {string} dishName The dish name to tokenize
+   * @return {string[]} The tokens of the normalized dish name
+   */
+  tokenize(dishName) {
+    return this.normalize(dishName).split(/\s+/).filter((token) => token);
+  }
+
+  /**
+   * Splits a token into overlapping character n-grams, after wrapping it in
+   * '<' and '>'.
+   * @param {string} token The token to split
+   * @return {string[]} The n-grams of the wrapped token, in order
+   */
+  ngrams(token) {
+    // Split by code point, like Python does
+    const chars = Array.from(`<${token}>`);
+    const ngrams = [];
+    for (let start = 0;
+      start <= Math.max(chars.length - this.ngramSize_, 0); start++) {
+      ngrams.push(chars.slice(start, start + this.ngramSize_).join(''));
+    }
+    return ngrams;
+  }
+
+  /**
+   * Encodes a dish name as an array of exactly `maxLength` token ids.
+   * @param {string} dishName The dish name to encode
+   * @return {number[]} The token (or n-gram) ids of `dishName`, truncated or
+   * padded with `Tokenizer.paddingId` to `maxLength` ids
+   */
+  encode(dishName) {
+    let ids = [];
+    if (this.numBuckets_ !== null) {
+      for (const token of this.tokenize(dishName)) {
+        for (const ngram of this.ngrams(token)) {
+          ids.push(AmaranthUtil.crc32(ngram) % this.numBuckets_ + 1);
+        }
+      }
+    } else {
+      ids = this.tokenize(dishName).map((token) => {
+        if (this.vocab_.has(token)) {
+          return this.vocab_.get(token);
+        } else {
+          return this.oovId_;
+        }
+      });
+    }
+
+    return AmaranthUtil.padArray(ids, this.maxLength_, Tokenizer.paddingId)
+        .slice(0, this.maxLength_);
+  }
+}
+
+if (typeof module !== 'undefined') {
+  module.exports = Tokenizer;
+}
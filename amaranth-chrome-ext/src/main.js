@@ -4,10 +4,9 @@ async function main() {
   const tokenizerPath = chrome.runtime.getURL('assets/tokenizer.json');
   const dishNameSelector = '.menuItem-name';
 
-  // Load tokenizer dictionary
+  // Load tokenizer
   const response = await fetch(tokenizerPath);
-  const tokenizerObj = await response.json();
-  const tokenizer = new Map(Object.entries(tokenizerObj));
+  const tokenizer = new Tokenizer(await response.json());
 
   // Attempt to load ML model
   const model = await tf.loadLayersModel(mlModelPath);
@@ -32,3 +32,11 @@ test('padArray: does not pad [1,2,3,4,5] which is longer than desired length',
       expect(AmaranthUtil.padArray([1, 2, 3, 4, 5], 3, 0))
           .toStrictEqual([1, 2, 3, 4, 5]);
     });
+
+test('crc32: matches zlib.crc32 of the UTF-8 bytes of "cheese"', () => {
+  expect(AmaranthUtil.crc32('cheese')).toBe(3989721539);
+});
+
+test('crc32: encodes non-ASCII characters as UTF-8', () => {
+  expect(AmaranthUtil.crc32('crème brûlée')).toBe(3329169063);
+});
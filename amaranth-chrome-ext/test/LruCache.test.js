@@ -0,0 +1,21 @@
+const LruCache = require('../src/LruCache');
+
+test('LruCache: returns cached values and counts hits and misses', () => {
+  const cache = new LruCache(2);
+  cache.set('cheeseburger', 'High Calorie');
+  expect(cache.get('cheeseburger')).toBe('High Calorie');
+  expect(cache.get('caesar salad')).toBeUndefined();
+  expect([cache.hits, cache.misses]).toStrictEqual([1, 1]);
+});
+
+test('LruCache: evicts the least recently used value when full', () => {
+  const cache = new LruCache(2);
+  cache.set('a', 1);
+  cache.set('b', 2);
+  cache.get('a');
+  cache.set('c', 3);
+  expect(cache.size).toBe(2);
+  expect(cache.get('a')).toBe(1);
+  expect(cache.get('b')).toBeUndefined();
+  expect(cache.get('c')).toBe(3);
+});
@@ -0,0 +1,67 @@
+global.AmaranthUtil = require('../src/AmaranthUtil');
+const Tokenizer = require('../src/Tokenizer');
+
+const config = {
+  version: 2,
+  filters: '!,.',
+  max_length: 4,
+  oov_id: 0,
+  vocab: ['', 'cheese', 'burger', 'salad'],
+  num_buckets: null,
+  ngram_size: null,
+};
+
+const hashedConfig = {
+  version: 2,
+  filters: '!,.',
+  max_length: 6,
+  oov_id: 0,
+  vocab: [],
+  num_buckets: 16,
+  ngram_size: 3,
+};
+
+test('Tokenizer: throws on unsupported format versions', () => {
+  const badConfig = Object.assign({}, config, {version: 0});
+  expect(() => new Tokenizer(badConfig)).toThrow();
+});
+
+test('Tokenizer: loads version 1 configs', () => {
+  const oldConfig = Object.assign({}, config, {version: 1});
+  delete oldConfig.num_buckets;
+  delete oldConfig.ngram_size;
+  expect(new Tokenizer(oldConfig).encode('Cheese Burger'))
+      .toStrictEqual([1, 2, 0, 0]);
+});
+
+test('Tokenizer: normalizes "Cheese, Burger!" to "cheese burger"', () => {
+  expect(new Tokenizer(config).normalize('Cheese, Burger!'))
+      .toBe('cheese burger');
+});
+
+test('Tokenizer: tokenizes " cheese   burger " to ["cheese", "burger"]',
+    () => {
+      expect(new Tokenizer(config).tokenize(' cheese   burger '))
+          .toStrictEqual(['cheese', 'burger']);
+    });
+
+test('Tokenizer: encodes "Cheese Burger Fries" to [1, 2, 0, 0]', () => {
+  expect(new Tokenizer(config).encode('Cheese Burger Fries'))
+      .toStrictEqual([1, 2, 0, 0]);
+});
+
+test('Tokenizer: truncates encodings to maxLength', () => {
+  expect(new Tokenizer(config).encode('salad salad salad salad salad'))
+      .toStrictEqual([3, 3, 3, 3]);
+});
+
+test('Tokenizer: splits "fries" into ["<fr", "fri", "rie", "ies", "es>"]',
+    () => {
+      expect(new Tokenizer(hashedConfig).ngrams('fries'))
+          .toStrictEqual(['<fr', 'fri', 'rie', 'ies', 'es>']);
+    });
+
+test('Tokenizer: hashes n-grams of "Cheese, Fries" like Python does', () => {
+  expect(new Tokenizer(hashedConfig).encode('Cheese, Fries'))
+      .toStrictEqual([9, 4, 16, 14, 12, 3]);
+});
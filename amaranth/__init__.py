@@ -5,3 +5,14 @@ The only current use of this class is to define common constants.
 
 LOW_CALORIE_THRESHOLD = 100
 HIGH_CALORIE_THRESHOLD = 300
+
+# Default training hyperparameters, shared by training and the hyperparameter
+# sweep (neither of which this module imports, so it stays TensorFlow-free)
+# Units in each of the model's hidden dense layers
+HIDDEN_UNITS = (32, 10)
+# Adam's learning rate (Keras' default)
+LEARNING_RATE = 0.001
+# Number of examples in each batch
+BATCH_SIZE = 32
+# Number of passes over the training set
+NUM_EPOCHS = 10
@@ -6,9 +6,9 @@ HIGH_CALORIE_THRESHOLD in the amaranth module.
 """
 
 import os
-import pandas as pd
 
 import amaranth
+from amaranth.ml import ingest
 from amaranth.ml import lib
 
 FDC_DATA_DIR = '../../data/fdc/'
@@ -19,37 +19,19 @@ def main():
   current_dir = os.path.dirname(__file__)
   abs_fdc_data_dir = os.path.join(current_dir, FDC_DATA_DIR)
 
-  food = pd.read_csv(os.path.join(abs_fdc_data_dir, 'food.csv'))
-  nutrient = pd.read_csv(os.path.join(
-      abs_fdc_data_dir, 'nutrient.csv')).rename(columns={'id': 'nutrient_id'})
-  food_nutrient = pd.read_csv(
-      os.path.join(abs_fdc_data_dir, 'food_nutrient.csv'))
-  combined = lib.combine_dataframes('fdc_id', food, food_nutrient)
-  combined = lib.combine_dataframes('nutrient_id', combined, nutrient)
-
-  calorie_data = lib.get_calorie_data(combined, 'kcal')
-  calorie_data = calorie_data[[
-      'description', 'data_type', 'name', 'amount', 'unit_name'
-  ]]  # Keep only relevant cols
-  calorie_data = lib.clean_data(calorie_data)
-
-  # Count rows with low, avg, or high calorie labels
-  low_cal_cnt = 0
-  avg_cal_cnt = 0
-  hi_cal_cnt = 0
-  for _, row in calorie_data.iterrows():
-    cal = row['amount']
-    if cal < amaranth.LOW_CALORIE_THRESHOLD:
-      low_cal_cnt += 1
-    elif cal < amaranth.HIGH_CALORIE_THRESHOLD:
-      avg_cal_cnt += 1
-    else:
-      hi_cal_cnt += 1
+  calorie_data = ingest.load_calorie_data(abs_fdc_data_dir)
+
+  # Compute fraction of rows with low, avg, or high calorie labels
+  calorie_labels, _ = lib.label_calories(
+      calorie_data['amount'],
+      low_calorie_threshold=amaranth.LOW_CALORIE_THRESHOLD,
+      high_calorie_threshold=amaranth.HIGH_CALORIE_THRESHOLD)
+  low_cal_frac, avg_cal_frac, hi_cal_frac = lib.class_balance(calorie_labels)
 
   print('Class balance in FDC Dataset:')
-  print(f'Low calorie:     {low_cal_cnt/len(calorie_data)}')
-  print(f'Average calorie: {avg_cal_cnt/len(calorie_data)}')
-  print(f'High calorie:    {hi_cal_cnt/len(calorie_data)}')
+  print(f'Low calorie:     {low_cal_frac}')
+  print(f'Average calorie: {avg_cal_frac}')
+  print(f'High calorie:    {hi_cal_frac}')
 
 
 if __name__ == '__main__':
@@ -1,20 +1,31 @@
 # Lint as: python3
 """This script is used to run the amaranth.ml module as an executable.
 
-For now, this script just delegates it's main to amaranth.ml.train
+It prompts for one of the module's scripts (training, interactive
+classification, batch prediction, or the prediction server) and runs its main.
 """
 
-from amaranth.ml import train
 from amaranth.ml import interactive
+from amaranth.ml import batch_predict
+from amaranth.ml import server
+
+
+def train_main():
+  # Only training needs TensorFlow, so the other options don't import it
+  from amaranth.ml import train  # pylint: disable=import-outside-toplevel
+  train.main()
 
 
 def main():
   # List of possible functions this module can perform
   # List elements should be tuples of str titles and functions to call
   options = [
-      ('Training: Train ML model on the dataset', train.main),
+      ('Training: Train ML model on the dataset', train_main),
       (('Interactive: Interact with the ML model by giving it strings to '
         'classify'), interactive.main),
+      (('Batch prediction: Classify every dish name in a CSV or JSON Lines '
+        'file'), batch_predict.main),
+      ('Server: Serve the ML model over a local HTTP/JSON API', server.main),
   ]
 
   # Prompt user
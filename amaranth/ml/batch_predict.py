@@ -0,0 +1,300 @@
+# Lint as: python3
+"""This script classifies every dish name in a CSV or JSON Lines file.
+
+Dish names are streamed from the input file in batches, classified by the ML
+model on a pool of worker threads, and written to the output file (CSV or JSON
+Lines) in their original order as soon as each batch is done. So even files with
+millions of dish names are scored with bounded memory.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from amaranth.ml import classifier
+from amaranth.ml import prediction_cache
+from amaranth.ml import registry
+
+# Number of dish names to classify at a time
+BATCH_SIZE = 8192
+# Column (CSV) or key (JSON Lines) holding dish names
+DISH_NAME_COLUMN = 'dish_name'
+# Columns of the output file
+OUTPUT_COLUMNS = [
+    'dish_name', 'label', 'low_calorie_confidence',
+    'average_calorie_confidence', 'high_calorie_confidence'
+]
+# Number of batches between progress reports
+PROGRESS_INTERVAL = 10
+
+
+def is_json_lines(path: str):
+  """Checks whether a file should be read or written as JSON Lines.
+
+  Args:
+    path (str): The file's path
+
+  Returns:
+    is_json_lines (bool): Whether path ends in '.jsonl' (any other file is CSV)
+
+  Raises:
+    ValueError: If path ends in '.json', since JSON arrays can't be streamed
+  """
+
+  extension = os.path.splitext(path)[1].lower()
+  if extension == '.json':
+    raise ValueError(f'{path} would be a JSON array, which is unsupported. '
+                     'Use JSON Lines (.jsonl) instead')
+  return extension == '.jsonl'
+
+
+def _chunk_dish_names(chunk: pd.DataFrame, path: str, column: str):
+  if column not in chunk:
+    raise ValueError(f'Column {column} not found in {path}, expected one of '
+                     f'{list(chunk.columns)}')
+  return chunk[column].fillna('').astype(str).tolist()
+
+
+def read_dish_names(path: str, column: str, batch_size: int):
+  """Streams batches of dish names from a CSV or JSON Lines file.
+
+  Args:
+    path (str): The CSV or JSON Lines file to read
+    column (str): The column (CSV) or key (JSON Lines) holding dish names
+    batch_size (int): The number of dish names in each batch
+
+  Returns:
+    batches (Iterator[List[str]]): Batches of dish names, read as they're
+    iterated over. Missing dish names are replaced with empty strings.
+
+  Raises:
+    ValueError: If a CSV file has no such column (checked right away), or a
+      batch of JSON Lines has no such key (checked as it's read)
+  """
+
+  if is_json_lines(path):
+    chunks = pd.read_json(path, lines=True, chunksize=batch_size)
+  else:
+    header = pd.read_csv(path, nrows=0)
+    _chunk_dish_names(header, path, column)
+    chunks = pd.read_csv(
+        path, usecols=[column], dtype={column: str}, chunksize=batch_size)
+
+  return (_chunk_dish_names(chunk, path, column) for chunk in chunks)
+
+
+def format_predictions(dish_names, confidences: np.ndarray):
+  """Formats a batch of predictions as rows of the output file.
+
+  Args:
+    dish_names (List[str]): A batch of dish names
+    confidences (np.ndarray): The model's (n, 3) confidences for dish_names
+
+  Returns:
+    predictions (pd.DataFrame): A DataFrame with OUTPUT_COLUMNS
+  """
+
+  labels = np.asarray(classifier.CALORIE_LABELS)[confidences.argmax(axis=-1)]
+  return pd.DataFrame(
+      {
+          'dish_name': dish_names,
+          'label': labels,
+          'low_calorie_confidence': confidences[:, 0],
+          'average_calorie_confidence': confidences[:, 1],
+          'high_calorie_confidence': confidences[:, 2],
+      },
+      columns=OUTPUT_COLUMNS)
+
+
+def write_predictions(output_file, predictions: pd.DataFrame, json_lines: bool,
+                      header: bool):
+  """Appends formatted predictions to an open output file.
+
+  Args:
+    output_file (TextIO): The output file
+    predictions (pd.DataFrame): Predictions as returned by format_predictions
+    json_lines (bool): Whether to write JSON Lines rather than CSV
+    header (bool): Whether to write a CSV header first
+  """
+
+  if json_lines:
+    if len(predictions):  # pylint: disable=len-as-condition
+      # Only some pandas versions end JSON Lines with a newline, and batches
+      # need exactly one between them
+      records = predictions.to_json(orient='records', lines=True)
+      output_file.write(records if records.endswith('\n') else records + '\n')
+  else:
+    predictions.to_csv(output_file, header=header, index=False)
+
+
+def predict_file(calorie_classifier: classifier.CalorieClassifier,
+                 input_path: str,
+                 output_path: str,
+                 column: str = DISH_NAME_COLUMN,
+                 batch_size: int = BATCH_SIZE,
+                 num_workers: int = None,
+                 log_file=sys.stderr):
+  """Classifies every dish name in a file, writing results incrementally.
+
+  At most 2 * num_workers batches are in flight at once, so memory use stays
+  bounded no matter how large the input file is.
+
+  Args:
+    calorie_classifier (classifier.CalorieClassifier): The classifier to use
+    input_path (str): The CSV or JSON Lines file of dish names
+    output_path (str): The CSV or JSON Lines file to write predictions to
+    column (str): The column (CSV) or key (JSON Lines) holding dish names
+    batch_size (int): The number of dish names to classify at a time
+    num_workers (int): The number of threads to classify with. Defaults to the
+      number of CPUs
+    log_file (TextIO): Where to report progress and throughput
+
+  Returns:
+    num_rows (int): The number of dish names classified
+    rows_per_sec (float): The number of dish names classified per second
+  """
+
+  if num_workers is None:
+    num_workers = os.cpu_count() or 1
+  json_lines = is_json_lines(output_path)
+  # Bad inputs are rejected before the output file is created
+  batches = read_dish_names(input_path, column, batch_size)
+
+  start_time = time.perf_counter()
+  num_rows = 0
+  num_batches = 0
+
+  def report():
+    elapsed = time.perf_counter() - start_time
+    rows_per_sec = num_rows / elapsed if elapsed > 0 else 0.0
+    print(f'{num_rows} rows in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec)',
+          file=log_file)
+    return rows_per_sec
+
+  def write_batch(future, dish_names):
+    nonlocal num_rows, num_batches
+    write_predictions(output_file, format_predictions(dish_names,
+                                                      future.result()),
+                      json_lines, header=num_batches == 0)
+    num_rows += len(dish_names)
+    num_batches += 1
+    if num_batches % PROGRESS_INTERVAL == 0:
+      report()
+
+  with open(output_path, 'w', newline='') as output_file, \
+      concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+    # Batches are written in the order they were submitted
+    pending = collections.deque()
+    for dish_names in batches:
+      pending.append((executor.submit(calorie_classifier.predict, dish_names),
+                      dish_names))
+      if len(pending) >= 2 * num_workers:
+        write_batch(*pending.popleft())
+
+    while pending:
+      write_batch(*pending.popleft())
+
+    if num_batches == 0 and not json_lines:
+      # Still write a header for empty inputs
+      write_predictions(output_file, format_predictions([], np.zeros((0, 3))),
+                        json_lines, header=True)
+
+  return num_rows, report()
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Classify every dish name in a CSV or JSON Lines file.')
+  parser.add_argument(
+      'input', nargs='?', help='CSV or JSON Lines (.jsonl) file of dish names')
+  parser.add_argument(
+      '-o',
+      '--output',
+      help=('CSV or JSON Lines (.jsonl) file to write predictions to '
+            '(default: INPUT with a .predictions suffix)'))
+  parser.add_argument(
+      '--column',
+      default=DISH_NAME_COLUMN,
+      help='column (CSV) or key (JSON Lines) holding dish names')
+  parser.add_argument(
+      '--batch-size',
+      type=int,
+      default=BATCH_SIZE,
+      help='number of dish names to classify at a time')
+  parser.add_argument(
+      '--workers',
+      type=int,
+      default=None,
+      help='number of threads to classify with (default: number of CPUs)')
+  parser.add_argument(
+      '--model-version',
+      help=('model registry version to classify with (default: the active '
+            'version)'))
+  parser.add_argument(
+      '--model-dir',
+      help=('directory of a saved model, or its NumPy export (.npz), to use '
+            'instead of the model registry'))
+  parser.add_argument('--tokenizer', help='saved tokenizer JSON file')
+  parser.add_argument(
+      '--cache-size',
+      type=int,
+      default=prediction_cache.MAX_SIZE,
+      help='most predictions to cache for repeated dish names (0 disables)')
+  parser.add_argument(
+      '--cache-file',
+      help='JSON file to load cached predictions from and save them to')
+
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+
+  input_path = args.input
+  if input_path is None:
+    print('Please enter the path of the file of dish names to classify: ')
+    input_path = input().strip()
+
+  output_path = args.output
+  if output_path is None:
+    root, ext = os.path.splitext(input_path)
+    output_path = f'{root}.predictions{ext or ".csv"}'
+
+  if args.model_dir is None and args.tokenizer is None:
+    calorie_classifier = registry.ModelRegistry().load_classifier(
+        args.model_version)
+  else:
+    calorie_classifier = classifier.CalorieClassifier.load(
+        args.model_dir, args.tokenizer)
+  # Saved predictions are only reused if they were made by the same model
+  if args.cache_file:
+    cache = prediction_cache.PredictionCache.load(
+        args.cache_file, args.cache_size, calorie_classifier.model_id)
+  else:
+    cache = prediction_cache.PredictionCache(args.cache_size)
+  calorie_classifier.cache = cache
+
+  num_rows, rows_per_sec = predict_file(
+      calorie_classifier,
+      input_path,
+      output_path,
+      column=args.column,
+      batch_size=args.batch_size,
+      num_workers=args.workers)
+
+  print(f'Classified {num_rows} dish names ({rows_per_sec:.0f} rows/sec)')
+  print(f'Predictions written to {output_path}')
+  print(f'Prediction cache: {cache.hits} hits, {cache.misses} misses')
+
+  if args.cache_file:
+    cache.save(args.cache_file)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,544 @@
+# Lint as: python3
+"""This script benchmarks each stage of the data and training pipeline.
+
+Each stage of the pipeline is run on synthetic FDC-shaped data at one or more
+scales: CSV parsing, the joins (one at a time, and as a single inner join with
+the calorie filter pushed down), calorie extraction, cleaning (as a stream of
+chunks and all at once), serial and parallel filtered parsing of
+food_nutrient.csv, labelling, normalization, vocabulary fitting (exactly and
+with a count-min sketch), encoding, and optionally model fitting and prediction.
+Each stage's wall time, peak RSS, and rows/sec are recorded. Calorie extraction
+is run on the joined table's string columns both as plain strings and as
+categoricals, and the size of each table is recorded too, as are the tokens the
+sketched vocabulary gains and misses compared to the exact one. The synthetic
+data is generated from a fixed seed, so results are comparable across commits:
+run the benchmark before and after a change to amaranth.ml.lib and pass the old
+results as --baseline to see how much faster or slower each stage got.
+
+Each scale is benchmarked in a fresh process, so its peak RSS isn't inflated by
+the scales before it.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import amaranth
+from amaranth.ml import corpus_stats
+from amaranth.ml import ingest
+from amaranth.ml import instrumentation
+from amaranth.ml import lib
+from amaranth.ml import tokenizer as tok
+
+# Version of the results format. Bump this whenever the format changes.
+BENCHMARK_FORMAT_VERSION = 1
+# Default numbers of food_nutrient.csv rows to benchmark with
+SCALES = [10_000, 100_000, 1_000_000]
+# Default random seed for generating synthetic data
+SEED = 0
+# Rows of food_nutrient.csv per food
+NUTRIENTS_PER_FOOD = 10
+# Fraction of foods whose calories are recorded in kcal (the rest use kJ)
+KCAL_FRAC = 0.9
+# Fraction of descriptions and amounts that are missing
+MISSING_FRAC = 0.01
+# Number of distinct words in synthetic descriptions
+NUM_WORDS = 50_000
+# Most words in a synthetic description
+MAX_DESCRIPTION_WORDS = 20
+# Foods to generate at a time, to bound memory at large scales
+FOOD_CHUNK_SIZE = 100_000
+# Rows of the calorie table to clean at a time when cleaning it as a stream
+CLEAN_CHUNK_SIZE = 10_000
+# Memory budget of the approximate vocabulary's sketch, small enough that its
+# vocabulary differs from the exact one at the larger scales
+SKETCH_MEMORY_BYTES = 2**20
+# FDC data types
+DATA_TYPES = [
+    'branded_food', 'sr_legacy_food', 'survey_fndds_food', 'foundation_food'
+]
+# Rows of nutrient.csv (id, name, unit_name, nutrient_nbr, rank)
+NUTRIENTS = [
+    (1008, 'Energy', 'KCAL', 208, 300),
+    (1062, 'Energy', 'kJ', 268, 400),
+    (1003, 'Protein', 'G', 203, 600),
+    (1004, 'Total lipid (fat)', 'G', 204, 800),
+    (1005, 'Carbohydrate, by difference', 'G', 205, 1110),
+    (1079, 'Fiber, total dietary', 'G', 291, 1200),
+    (2000, 'Sugars, total including NLEA', 'G', 269, 1510),
+    (1087, 'Calcium, Ca', 'MG', 301, 5300),
+    (1089, 'Iron, Fe', 'MG', 303, 5400),
+    (1093, 'Sodium, Na', 'MG', 307, 5800),
+    (1253, 'Cholesterol', 'MG', 601, 15700),
+    (1258, 'Fatty acids, total saturated', 'G', 606, 9700),
+]
+# Epochs to fit the model for when benchmarking training
+NUM_EPOCHS = 1
+
+
+def _generate_words(rng: np.random.Generator, num_words: int):
+  """Generates distinct, lowercase, word-like strings."""
+
+  letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+  words = {}
+  while len(words) < num_words:
+    length = int(rng.integers(2, 12))
+    word = ''.join(rng.choice(letters, length))
+    words.setdefault(word, None)
+
+  return list(words)
+
+
+def _generate_descriptions(rng: np.random.Generator, words: np.ndarray,
+                           num_foods: int):
+  """Generates dish descriptions with Zipf-distributed words."""
+
+  lengths = rng.integers(1, MAX_DESCRIPTION_WORDS + 1, num_foods)
+  word_ids = np.minimum(rng.zipf(1.3, lengths.sum()), len(words)) - 1
+  tokens = words[word_ids]
+
+  # Capitalize some words and add some punctuation, like real descriptions
+  capitalized = rng.random(len(tokens)) < 0.2
+  tokens[capitalized] = np.char.capitalize(tokens[capitalized])
+  punctuated = rng.random(len(tokens)) < 0.1
+  tokens[punctuated] = np.char.add(tokens[punctuated], ',')
+
+  boundaries = np.cumsum(lengths)[:-1]
+  return [' '.join(description) for description in np.split(tokens, boundaries)]
+
+
+def generate_fdc_data(fdc_data_dir: str, num_rows: int, seed: int = SEED):
+  """Writes synthetic FDC-shaped CSV files.
+
+  food.csv, food_nutrient.csv, and nutrient.csv have the same columns as the
+  real FDC files. Each food has NUTRIENTS_PER_FOOD nutrients, one of which is
+  its calories (in kcal for KCAL_FRAC of foods, and in kJ otherwise), and
+  MISSING_FRAC of descriptions and amounts are missing.
+
+  Args:
+    fdc_data_dir (str): The directory to write the CSV files to
+    num_rows (int): The number of rows of food_nutrient.csv
+    seed (int): The random seed to generate data with
+  """
+
+  os.makedirs(fdc_data_dir, exist_ok=True)
+  rng = np.random.default_rng(seed)
+  words = np.array(_generate_words(rng, NUM_WORDS))
+
+  pd.DataFrame(
+      NUTRIENTS, columns=['id', 'name', 'unit_name', 'nutrient_nbr',
+                          'rank']).to_csv(
+                              os.path.join(fdc_data_dir, 'nutrient.csv'),
+                              index=False)
+
+  nutrient_ids = np.array([nutrient[0] for nutrient in NUTRIENTS])
+  num_foods = -(-num_rows // NUTRIENTS_PER_FOOD)
+  food_path = os.path.join(fdc_data_dir, 'food.csv')
+  food_nutrient_path = os.path.join(fdc_data_dir, 'food_nutrient.csv')
+
+  for start in range(0, num_foods, FOOD_CHUNK_SIZE):
+    chunk_size = min(FOOD_CHUNK_SIZE, num_foods - start)
+    fdc_ids = np.arange(start, start + chunk_size) + 100_000
+    header = start == 0
+    mode = 'w' if header else 'a'
+
+    descriptions = pd.Series(_generate_descriptions(rng, words, chunk_size))
+    descriptions[rng.random(chunk_size) < MISSING_FRAC] = None
+    pd.DataFrame({
+        'fdc_id': fdc_ids,
+        'data_type': rng.choice(DATA_TYPES, chunk_size),
+        'description': descriptions,
+        'food_category_id': rng.integers(1, 30, chunk_size),
+        'publication_date': '2020-04-01',
+    }).to_csv(food_path, mode=mode, header=header, index=False)
+
+    # The first nutrient of each food is its calories
+    food_nutrient_ids = rng.choice(nutrient_ids[2:],
+                                   (chunk_size, NUTRIENTS_PER_FOOD))
+    food_nutrient_ids[:, 0] = np.where(
+        rng.random(chunk_size) < KCAL_FRAC, nutrient_ids[0], nutrient_ids[1])
+    amounts = rng.gamma(1.5, 10, (chunk_size, NUTRIENTS_PER_FOOD))
+    amounts[:, 0] = rng.gamma(2, 120, chunk_size)
+    amounts[rng.random(amounts.shape) < MISSING_FRAC] = np.nan
+
+    # Drop the last food's extra nutrients to get exactly num_rows rows
+    num_chunk_rows = min(chunk_size * NUTRIENTS_PER_FOOD,
+                         num_rows - start * NUTRIENTS_PER_FOOD)
+    pd.DataFrame({
+        'id': np.arange(num_chunk_rows) + start * NUTRIENTS_PER_FOOD,
+        'fdc_id': np.repeat(fdc_ids, NUTRIENTS_PER_FOOD)[:num_chunk_rows],
+        'nutrient_id': food_nutrient_ids.ravel()[:num_chunk_rows],
+        'amount': amounts.ravel()[:num_chunk_rows].round(1),
+        'data_points': 1,
+        'derivation_id': 71,
+    }).to_csv(food_nutrient_path, mode=mode, header=header, index=False)
+
+
+def _memory_mb(dataframe: pd.DataFrame):
+  return dataframe.memory_usage(deep=True).sum() / 2**20
+
+
+def run_stages(fdc_data_dir: str,
+               train_model: bool = False,
+               trace_memory: bool = False):
+  """Runs each stage of the pipeline on an FDC dataset.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    train_model (bool): Whether to also benchmark fitting the model for
+      NUM_EPOCHS epochs and predicting with it (this imports TensorFlow)
+    trace_memory (bool): Whether to record each stage's peak allocated memory
+      with tracemalloc
+
+  Returns:
+    stages (List[dict]): Each stage's name, number of input rows, seconds,
+    rows_per_sec, peak_rss_mb, (if trace_memory) peak_traced_mb, and (for
+    stages comparing data representations) the data_mb of their input
+  """
+
+  metrics = instrumentation.RunMetrics(trace_memory=trace_memory)
+  try:
+    _run_stages(metrics, fdc_data_dir, train_model)
+  finally:
+    metrics.close()
+
+  return metrics.stages
+
+
+def _run_stages(metrics: instrumentation.RunMetrics, fdc_data_dir: str,
+                train_model: bool):
+  with metrics.stage('parse') as stage:
+    food = ingest.read_food(fdc_data_dir)
+    nutrient = ingest.read_nutrient(fdc_data_dir)
+    food_nutrient = pd.read_csv(
+        os.path.join(fdc_data_dir, 'food_nutrient.csv'),
+        usecols=list(ingest.FOOD_NUTRIENT_DTYPES),
+        dtype=ingest.FOOD_NUTRIENT_DTYPES)
+    num_food_nutrient_rows = len(food_nutrient)
+    stage['rows'] = num_food_nutrient_rows
+
+  with metrics.stage('join_pushdown') as stage:
+    # The same joins as the next three stages, in one inner join with the
+    # calorie filter pushed down to nutrient.csv
+    stage['rows'] = num_food_nutrient_rows
+    lib.join_dataframes(
+        food, [
+            lib.Join(food_nutrient, 'fdc_id'),
+            lib.Join(
+                nutrient,
+                'nutrient_id',
+                where=lambda nutrient: lib.calorie_mask(nutrient, 'kcal')),
+        ],
+        how='inner')
+
+  with metrics.stage('join_food') as stage:
+    stage['rows'] = num_food_nutrient_rows
+    combined = lib.combine_dataframes('fdc_id', food, food_nutrient)
+  del food, food_nutrient
+
+  with metrics.stage('join_nutrient') as stage:
+    stage['rows'] = len(combined)
+    combined = lib.combine_dataframes('nutrient_id', combined, nutrient)
+
+  # The same filter on plain string columns, to compare with the categorical
+  # columns the FDC files are read as
+  combined_strings = combined.astype({
+      col: combined[col].cat.categories.dtype
+      for col in combined.select_dtypes('category').columns
+  })
+  with metrics.stage('get_calorie_data_strings') as stage:
+    stage['rows'] = len(combined)
+    stage['data_mb'] = _memory_mb(combined_strings)
+    lib.get_calorie_data(combined_strings, 'kcal')
+  del combined_strings
+
+  with metrics.stage('get_calorie_data') as stage:
+    stage['rows'] = len(combined)
+    stage['data_mb'] = _memory_mb(combined)
+    calorie_data = lib.get_calorie_data(combined, 'kcal')
+    calorie_data = calorie_data[ingest.CALORIE_DATA_COLUMNS]
+  del combined
+
+  with metrics.stage('clean_chunks') as stage:
+    # Cleaning the same rows as a stream of chunks, as they'd be read
+    stage['rows'] = len(calorie_data)
+    for _ in lib.clean_chunks(
+        calorie_data.iloc[start:start + CLEAN_CHUNK_SIZE]
+        for start in range(0, len(calorie_data), CLEAN_CHUNK_SIZE)):
+      pass
+
+  with metrics.stage('clean') as stage:
+    stage['rows'] = len(calorie_data)
+    calorie_data = lib.clean_data(calorie_data)
+
+  # Reading food_nutrient.csv serially, and in parallel with one byte range per
+  # CPU
+  food_nutrient_path = os.path.join(fdc_data_dir, 'food_nutrient.csv')
+  energy_ids = lib.get_calorie_data(nutrient, 'kcal')['nutrient_id']
+  with metrics.stage('read_food_nutrient') as stage:
+    stage['rows'] = num_food_nutrient_rows
+    ingest.read_food_nutrient(fdc_data_dir, energy_ids, num_workers=1)
+  with metrics.stage('read_food_nutrient_parallel') as stage:
+    stage['rows'] = num_food_nutrient_rows
+    ingest.read_food_nutrient(
+        fdc_data_dir,
+        energy_ids,
+        range_size=-(-os.path.getsize(food_nutrient_path) //
+                     (os.cpu_count() or 1)))
+
+  with metrics.stage('build_calorie_data') as stage:
+    # The same table, built the way train.py does it
+    stage['rows'] = num_food_nutrient_rows
+    calorie_data = ingest.build_calorie_data(fdc_data_dir)
+
+  with metrics.stage('label') as stage:
+    stage['rows'] = len(calorie_data)
+    _, calorie_classes = lib.label_calories(
+        calorie_data['amount'],
+        low_calorie_threshold=amaranth.LOW_CALORIE_THRESHOLD,
+        high_calorie_threshold=amaranth.HIGH_CALORIE_THRESHOLD)
+
+  tokenizer = tok.Tokenizer(min_count=3)
+  with metrics.stage('normalize') as stage:
+    stage['rows'] = len(calorie_data)
+    corpus = tokenizer.normalize_batch(calorie_data['description'])
+  del calorie_data
+
+  with metrics.stage('fit_vocab') as stage:
+    stage['rows'] = len(corpus)
+    stats = corpus_stats.compute(corpus)
+    vocab_size = stats.unique_words
+    tokenizer.fit_stats(stats)
+
+  with metrics.stage('fit_vocab_sketch') as stage:
+    stage['rows'] = len(corpus)
+    sketch_stats = corpus_stats.approximate(corpus, tokenizer.min_count,
+                                            SKETCH_MEMORY_BYTES)
+    # How the approximate vocabulary differs from the exact one
+    stage['extra_tokens'] = len(
+        sketch_stats.token_counts.keys() - tokenizer.vocab.keys())
+    stage['missing_tokens'] = len(
+        tokenizer.vocab.keys() - sketch_stats.token_counts.keys())
+  del sketch_stats
+
+  with metrics.stage('encode') as stage:
+    # Tokenizes, pads, and stacks every description into one matrix
+    stage['rows'] = len(corpus)
+    inputs, _ = tokenizer.encode_batch(corpus, normalize=False)
+
+  if train_model:
+    # Only import TensorFlow if it's needed
+    from amaranth.ml import dataset  # pylint: disable=import-outside-toplevel
+    from amaranth.ml import train  # pylint: disable=import-outside-toplevel
+
+    model = train.build_model(vocab_size, tokenizer.max_length)
+    train_set = dataset.make_dataset(inputs, calorie_classes, shuffle=True)
+
+    with metrics.stage('fit') as stage:
+      stage['rows'] = len(inputs) * NUM_EPOCHS
+      model.fit(train_set, epochs=NUM_EPOCHS, verbose=0)
+
+    with metrics.stage('predict') as stage:
+      stage['rows'] = len(inputs)
+      model.predict(dataset.make_dataset(inputs, calorie_classes), verbose=0)
+
+
+def benchmark_scale(num_rows: int,
+                    data_dir: str = None,
+                    seed: int = SEED,
+                    train_model: bool = False,
+                    trace_memory: bool = False):
+  """Generates synthetic data at one scale and benchmarks the pipeline on it.
+
+  Args:
+    num_rows (int): The number of rows of food_nutrient.csv
+    data_dir (str): A directory to keep the synthetic data in, so later runs
+      can reuse it. Defaults to a temporary directory
+    seed (int): The random seed to generate data with
+    train_model (bool): Whether to benchmark fitting and predicting too
+    trace_memory (bool): Whether to record peak allocated memory too
+
+  Returns:
+    result (dict): The scale's food_nutrient_rows, seconds taken to generate
+    its data (0 if it was reused), and stages (see run_stages)
+  """
+
+  with contextlib.ExitStack() as stack:
+    if data_dir is None:
+      data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+    fdc_data_dir = os.path.join(data_dir, f'rows-{num_rows}-seed-{seed}')
+
+    start_time = time.perf_counter()
+    if not all(
+        os.path.exists(os.path.join(fdc_data_dir, f))
+        for f in ingest.FDC_FILES):
+      generate_fdc_data(fdc_data_dir, num_rows, seed)
+    generate_seconds = time.perf_counter() - start_time
+
+    stages = run_stages(fdc_data_dir, train_model, trace_memory)
+
+  return {
+      'food_nutrient_rows': num_rows,
+      'generate_seconds': generate_seconds,
+      'stages': stages,
+  }
+
+
+def _git_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                          cwd=os.path.dirname(__file__),
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL,
+                          check=True,
+                          universal_newlines=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run_benchmark(scales=None,
+                  data_dir: str = None,
+                  seed: int = SEED,
+                  train_model: bool = False,
+                  trace_memory: bool = False):
+  """Benchmarks the pipeline at each scale, each in a fresh process.
+
+  Args:
+    scales (List[int]): The numbers of food_nutrient.csv rows to benchmark
+      with. Defaults to SCALES
+    data_dir (str): A directory to keep the synthetic data in
+    seed (int): The random seed to generate data with
+    train_model (bool): Whether to benchmark fitting and predicting too
+    trace_memory (bool): Whether to record peak allocated memory too
+
+  Returns:
+    results (dict): The results, along with the commit and library versions
+    they were measured with
+  """
+
+  if scales is None:
+    scales = SCALES
+
+  results = []
+  for num_rows in scales:
+    with concurrent.futures.ProcessPoolExecutor(
+        1, mp_context=multiprocessing.get_context('spawn')) as executor:
+      results.append(
+          executor.submit(benchmark_scale, num_rows, data_dir, seed,
+                          train_model, trace_memory).result())
+
+  return {
+      'version': BENCHMARK_FORMAT_VERSION,
+      'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+      'commit': _git_commit(),
+      'platform': platform.platform(),
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'pandas': pd.__version__,
+      'seed': seed,
+      'results': results,
+  }
+
+
+def format_results(results, baseline=None):
+  """Formats benchmark results as a human-readable table.
+
+  Args:
+    results (dict): Results from run_benchmark
+    baseline (dict): Optional earlier results. If given, each stage's speedup
+      over the same stage at the same scale in baseline is shown too
+
+  Returns:
+    table (str): The formatted results
+  """
+
+  baseline_seconds = {}
+  for result in (baseline or {}).get('results', []):
+    for stage in result['stages']:
+      baseline_seconds[result['food_nutrient_rows'],
+                       stage['name']] = stage['seconds']
+
+  lines = []
+  for result in results['results']:
+    lines.append(f'\n{result["food_nutrient_rows"]} food_nutrient rows')
+    lines.append(f'{"Stage":<28}{"Rows":>12}{"Seconds":>10}{"Rows/sec":>14}'
+                 f'{"Peak RSS (MB)":>15}{"Data (MB)":>11}'
+                 f'{"Speedup" if baseline else "":>10}')
+    for stage in result['stages']:
+      speedup = ''
+      old_seconds = baseline_seconds.get(
+          (result['food_nutrient_rows'], stage['name']))
+      if old_seconds is not None and stage['seconds'] > 0:
+        speedup = f'{old_seconds / stage["seconds"]:.2f}x'
+      data_mb = f'{stage["data_mb"]:.1f}' if 'data_mb' in stage else ''
+      lines.append(f'{stage["name"]:<28}{stage["rows"]:>12}'
+                   f'{stage["seconds"]:>10.3f}{stage["rows_per_sec"]:>14.0f}'
+                   f'{stage["peak_rss_mb"]:>15.1f}{data_mb:>11}{speedup:>10}')
+
+  return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Benchmark the data and training pipeline on synthetic data.')
+  parser.add_argument(
+      '--rows',
+      type=int,
+      nargs='+',
+      default=SCALES,
+      help='numbers of food_nutrient.csv rows to benchmark with')
+  parser.add_argument(
+      '-o',
+      '--output',
+      default='benchmark_results.json',
+      help='JSON file to write the results to')
+  parser.add_argument(
+      '--baseline', help='earlier results (JSON) to compare against')
+  parser.add_argument(
+      '--data-dir',
+      help=('directory to keep the synthetic data in, so later runs can reuse '
+            'it (default: a temporary directory)'))
+  parser.add_argument(
+      '--seed', type=int, default=SEED, help='seed to generate data with')
+  parser.add_argument(
+      '--train',
+      action='store_true',
+      help='also benchmark fitting and predicting with the model')
+  parser.add_argument(
+      '--trace-memory',
+      action='store_true',
+      help='also record peak allocated memory per stage (much slower)')
+
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+
+  results = run_benchmark(args.rows, args.data_dir, args.seed, args.train,
+                          args.trace_memory)
+  with open(args.output, 'w') as file:
+    json.dump(results, file, indent=2)
+
+  baseline = None
+  if args.baseline:
+    with open(args.baseline) as file:
+      baseline = json.load(file)
+
+  print(format_results(results, baseline))
+  print(f'\nResults written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,155 @@
+# Lint as: python3
+"""This module wraps the trained ML model for classifying dish names.
+
+A CalorieClassifier pairs the model with the tokenizer it was trained with, so
+callers can classify raw dish names without encoding them first. The model can
+either be the Keras SavedModel or its NumPy export (see numpy_model), which
+gives identical predictions without the cost of importing TensorFlow.
+"""
+
+import os
+from typing import Iterable
+
+import numpy as np
+
+from amaranth.ml import numpy_model
+from amaranth.ml import prediction_cache
+from amaranth.ml import stage_cache
+from amaranth.ml import tokenizer as tok
+
+# Project resources directory
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), '../resources/')
+# Human-readable names of each calorie class, in order
+CALORIE_LABELS = ('Low Calorie', 'Average Calorie', 'High Calorie')
+
+
+def model_id(model_path: str, tokenizer_path: str):
+  """Computes an id of a saved model and tokenizer.
+
+  Args:
+    model_path (str): The saved model's directory, or its NumPy export
+    tokenizer_path (str): The saved tokenizer
+
+  Returns:
+    id (str): A hash of every file of the model and tokenizer, which changes
+    whenever either of them does
+  """
+
+  model_files = [model_path]
+  if os.path.isdir(model_path):
+    model_files = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(model_path)
+        for name in names)
+  return stage_cache.hash_files(model_files + [tokenizer_path])
+
+
+class CalorieClassifier:
+  """Classifies dish names as low, average, or high-calorie.
+
+  Attributes:
+    model (Union[keras.Model, numpy_model.NumpyModel]): The trained ML model
+    tokenizer (tok.Tokenizer): The tokenizer the model was trained with
+    cache (prediction_cache.PredictionCache): An optional cache of predictions.
+      If given, dish names whose normalized tokens are cached skip the model.
+    model_id (str): The id of the saved model and tokenizer (see model_id), if
+      they were loaded from disk
+  """
+
+  def __init__(self,
+               model,
+               tokenizer: tok.Tokenizer,
+               cache: prediction_cache.PredictionCache = None,
+               model_id: str = None):
+    self.model = model
+    self.tokenizer = tokenizer
+    self.cache = cache
+    self.model_id = model_id
+
+  @classmethod
+  def load(cls,
+           model_dir: str = None,
+           tokenizer_path: str = None,
+           cache: prediction_cache.PredictionCache = None):
+    """Loads a classifier from disk.
+
+    If model_dir is a .npz file, the model is loaded as a NumpyModel, without
+    importing TensorFlow. Otherwise it's loaded as a Keras SavedModel.
+
+    Args:
+      model_dir (str): The directory of the saved model, or its NumPy export.
+        Defaults to the model's NumPy export in the project resources directory
+        if there is one, and to its SavedModel otherwise
+      tokenizer_path (str): The saved tokenizer. Defaults to the tokenizer in
+        the project resources directory
+      cache (prediction_cache.PredictionCache): An optional cache of
+        predictions
+
+    Returns:
+      classifier (CalorieClassifier): The loaded classifier
+    """
+
+    if model_dir is None:
+      model_dir = os.path.join(RESOURCES_DIR, 'model.npz')
+      if not os.path.exists(model_dir):
+        model_dir = os.path.join(RESOURCES_DIR, 'model')
+    if tokenizer_path is None:
+      tokenizer_path = os.path.join(RESOURCES_DIR, 'tokenizer.json')
+
+    if model_dir.endswith('.npz'):
+      model = numpy_model.NumpyModel.load(model_dir)
+    else:
+      from tensorflow import keras  # pylint: disable=import-outside-toplevel
+      from amaranth.ml import layers  # pylint: disable=import-outside-toplevel
+      # The model is only used for inference, so there's no need to restore
+      # its optimizer, loss, or metrics
+      model = keras.models.load_model(
+          model_dir, custom_objects=layers.CUSTOM_OBJECTS, compile=False)
+    return cls(model, tok.Tokenizer.load(tokenizer_path), cache,
+               model_id(model_dir, tokenizer_path))
+
+  def predict(self, dish_names: Iterable[str]):
+    """Predicts the confidence of each calorie class for each dish name.
+
+    Args:
+      dish_names (Iterable[str]): The dish names to classify
+
+    Returns:
+      confidences (np.ndarray): An (n, 3) float32 array with the confidence
+      that each dish is low, average, and high calorie
+    """
+
+    if self.cache is None:
+      return self._predict_uncached(dish_names)
+
+    keys = [
+        self.cache.key(self.tokenizer.tokenize(dish_name))
+        for dish_name in dish_names
+    ]
+    confidences = np.empty((len(keys), len(CALORIE_LABELS)), dtype=np.float32)
+
+    # Only run the model once per distinct key that isn't cached
+    missing_keys = {}
+    for idx, key in enumerate(keys):
+      cached = self.cache.get(key)
+      if cached is None:
+        missing_keys.setdefault(key, []).append(idx)
+      else:
+        confidences[idx] = cached
+
+    if missing_keys:
+      # Keys are already normalized tokens joined by spaces
+      predictions = self._predict_uncached(list(missing_keys), normalize=False)
+      for (key, indices), prediction in zip(missing_keys.items(), predictions):
+        confidences[indices] = prediction
+        self.cache.put(key, prediction)
+
+    return confidences
+
+  def _predict_uncached(self, dish_names: Iterable[str],
+                        normalize: bool = True):
+    inputs, _ = self.tokenizer.encode_batch(dish_names, normalize=normalize)
+    if not len(inputs):  # pylint: disable=len-as-condition
+      return np.zeros((0, len(CALORIE_LABELS)), dtype=np.float32)
+
+    return np.asarray(self.model.predict_on_batch(inputs), dtype=np.float32)
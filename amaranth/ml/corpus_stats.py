@@ -0,0 +1,361 @@
+# Lint as: python3
+"""This module computes statistics of a corpus of dish names in a single pass.
+
+Fitting a tokenizer needs how many times each token appears, how many distinct
+tokens there are, and how many tokens each dish name has. CorpusStats collects
+all of them while reading the corpus once, a chunk at a time, so the corpus
+never has to be split into per-row token lists or scanned again for each
+statistic.
+
+CorpusStats of different shards of a corpus can be merged, so a large corpus
+can be split into shards whose statistics are computed on a pool of worker
+processes (see compute) and merged in order. The merged statistics are identical
+to those of the whole corpus, including the order in which tokens first appear.
+
+Exact token counts need an entry for every distinct token, and large corpora
+have millions of tokens that only appear once. approximate instead counts
+tokens in a CountMinSketch of a fixed size, and only keeps exact entries for
+the tokens frequent enough to end up in a vocabulary.
+"""
+
+import collections
+import concurrent.futures
+import math
+import multiprocessing
+from typing import Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from amaranth.ml import lib
+
+# Number of dish names to split into tokens at a time
+STATS_CHUNK_SIZE = 65536
+# Default memory budget of a CountMinSketch, in bytes
+SKETCH_MEMORY_BYTES = 64 * 2**20
+# Default number of rows (hash functions) of a CountMinSketch
+SKETCH_DEPTH = 4
+
+
+def _chunks(strings: Iterable[str]):
+  """Splits an iterable of strings into lists of STATS_CHUNK_SIZE strings."""
+
+  strings = iter(strings)
+  while True:
+    chunk = [string for _, string in zip(range(STATS_CHUNK_SIZE), strings)]
+    if not chunk:
+      return
+    yield chunk
+
+
+def _chunk_tokens(chunk: List[str]):
+  # Joining on spaces keeps every token's boundaries, so splitting the joined
+  # string yields every token of the chunk in order
+  return ' '.join(chunk).split()
+
+
+def _chunk_length_counts(chunk: List[str]):
+  return np.bincount(
+      np.fromiter(
+          map(len, map(str.split, chunk)), dtype=np.int64, count=len(chunk)))
+
+
+def _add_counts(counts: np.ndarray, more_counts: np.ndarray):
+  """Adds two histograms, padding the shorter one with zeros."""
+
+  if len(more_counts) > len(counts):
+    counts = np.pad(counts, (0, len(more_counts) - len(counts)))
+  counts[:len(more_counts)] += more_counts
+  return counts
+
+
+class CorpusStats:
+  """Token counts and a token length histogram of a corpus of dish names.
+
+  Attributes:
+    token_counts (collections.Counter): The number of times each token
+      appears, in order of first appearance. If these statistics are
+      approximate, only frequent tokens are counted (see approximate)
+    length_counts (np.ndarray): How many dish names have each number of tokens
+    num_strings (int): The number of dish names
+    count_error (float): How much any count in token_counts may overestimate
+    the token's true count (with high probability). 0 if the counts are exact
+  """
+
+  def __init__(self):
+    self.token_counts = collections.Counter()
+    self.length_counts = np.zeros(0, dtype=np.int64)
+    self.num_strings = 0
+    self.count_error = 0.0
+
+  @property
+  def unique_words(self):
+    """The number of distinct (counted) tokens."""
+    return len(self.token_counts)
+
+  @property
+  def max_length(self):
+    """The number of tokens in the longest dish name (0 if there are none)."""
+    return max(len(self.length_counts) - 1, 0)
+
+  @property
+  def num_tokens(self):
+    """The total number of tokens."""
+    return int(
+        (self.length_counts * np.arange(len(self.length_counts))).sum())
+
+  def percentile_length(self, coverage: float = 1.0):
+    """Computes the shortest length that covers a fraction of dish names.
+
+    Args:
+      coverage (float): The fraction of dish names, in (0, 1], whose number of
+        tokens must be at most the returned length
+
+    Returns:
+      length (int): See lib.percentile_length_from_counts
+    """
+
+    return lib.percentile_length_from_counts(self.length_counts, coverage)
+
+  def update(self, strings: Iterable[str]):
+    """Adds the statistics of more (normalized) dish names.
+
+    Args:
+      strings (Iterable[str]): Dish names whose tokens are separated by spaces
+
+    Returns:
+      self (CorpusStats): These statistics, for chaining
+    """
+
+    for chunk in _chunks(strings):
+      self.token_counts.update(_chunk_tokens(chunk))
+      self.length_counts = _add_counts(self.length_counts,
+                                       _chunk_length_counts(chunk))
+      self.num_strings += len(chunk)
+
+    return self
+
+  def merge(self, other: 'CorpusStats'):
+    """Adds the statistics of another corpus, as if it came after this one.
+
+    Args:
+      other (CorpusStats): The statistics to add
+
+    Returns:
+      self (CorpusStats): These statistics, for chaining
+
+    Raises:
+      ValueError: If either statistics are approximate
+    """
+
+    if self.count_error or other.count_error:
+      raise ValueError('Approximate corpus statistics cannot be merged, merge '
+                       'their sketches instead')
+
+    self.token_counts.update(other.token_counts)
+    self.length_counts = _add_counts(self.length_counts, other.length_counts)
+    self.num_strings += other.num_strings
+    return self
+
+
+class CountMinSketch:
+  """Approximately counts tokens in a fixed amount of memory.
+
+  Each token is hashed to one counter in each of depth rows of width counters,
+  and a token's count is estimated as the smallest of its counters. Estimates
+  never undercount, and with probability at least 1 - exp(-depth), a token's
+  estimate exceeds its true count by at most error_bound (e / width times
+  the number of tokens counted).
+
+  Attributes:
+    table (np.ndarray): The (depth, width) uint32 counters
+    num_tokens (int): The number of tokens counted
+  """
+
+  def __init__(self, width: int, depth: int = SKETCH_DEPTH):
+    self.table = np.zeros((depth, width), dtype=np.uint32)
+    self.num_tokens = 0
+
+  @classmethod
+  def from_memory_budget(cls,
+                         memory_bytes: int = SKETCH_MEMORY_BYTES,
+                         depth: int = SKETCH_DEPTH):
+    """Creates the widest sketch whose counters fit in a memory budget.
+
+    Args:
+      memory_bytes (int): The memory budget, in bytes
+      depth (int): The number of rows
+
+    Returns:
+      sketch (CountMinSketch): An empty sketch
+
+    Raises:
+      ValueError: If memory_bytes can't fit a single column of counters
+    """
+
+    width = memory_bytes // (depth * np.dtype(np.uint32).itemsize)
+    if width < 1:
+      raise ValueError(f'{memory_bytes} bytes is too small for a sketch of '
+                       f'depth {depth}')
+    return cls(width, depth)
+
+  @property
+  def error_bound(self):
+    """The most any estimate exceeds its true count, with high probability."""
+    return math.e / self.table.shape[1] * self.num_tokens
+
+  def _columns(self, tokens: np.ndarray):
+    """Finds the counter of each token in each row."""
+
+    # Derive each row's hash from two halves of one 64-bit hash
+    hashes = pd.util.hash_array(tokens, categorize=False)
+    low = hashes & np.uint64(0xFFFFFFFF)
+    high = (hashes >> np.uint64(32)) | np.uint64(1)
+    rows = np.arange(len(self.table), dtype=np.uint64)[:, np.newaxis]
+    return (low + rows * high) % np.uint64(self.table.shape[1])
+
+  def update(self, tokens: Sequence[str]):
+    """Counts tokens.
+
+    Args:
+      tokens (Sequence[str]): The tokens to count, with repeats
+
+    Returns:
+      self (CountMinSketch): This sketch, for chaining
+    """
+
+    codes, unique_tokens = pd.factorize(np.asarray(tokens, dtype=object))
+    if not len(unique_tokens):
+      return self
+
+    counts = np.bincount(codes).astype(np.uint32)
+    for row, columns in zip(self.table, self._columns(unique_tokens)):
+      np.add.at(row, columns.astype(np.intp), counts)
+    self.num_tokens += len(tokens)
+    return self
+
+  def estimate(self, tokens: Sequence[str]):
+    """Estimates how many times each token was counted.
+
+    Args:
+      tokens (Sequence[str]): The tokens to look up
+
+    Returns:
+      counts (np.ndarray): The estimated count of each token, never less than
+      its true count
+    """
+
+    tokens = np.asarray(tokens, dtype=object)
+    if not len(tokens):
+      return np.zeros(0, dtype=np.uint32)
+
+    columns = self._columns(tokens).astype(np.intp)
+    return np.min(np.take_along_axis(self.table, columns, axis=1), axis=0)
+
+  def merge(self, other: 'CountMinSketch'):
+    """Adds the counts of another sketch of the same shape.
+
+    Args:
+      other (CountMinSketch): The sketch to add
+
+    Returns:
+      self (CountMinSketch): This sketch, for chaining
+
+    Raises:
+      ValueError: If other's shape is different from this sketch's
+    """
+
+    if other.table.shape != self.table.shape:
+      raise ValueError(f'Cannot merge a sketch of shape {other.table.shape} '
+                       f'into one of shape {self.table.shape}')
+
+    self.table += other.table
+    self.num_tokens += other.num_tokens
+    return self
+
+
+def _shard_stats(strings: List[str]):
+  return CorpusStats().update(strings)
+
+
+def compute(strings: Iterable[str],
+            num_workers: int = 1,
+            shard_size: int = STATS_CHUNK_SIZE):
+  """Computes the statistics of a corpus of (normalized) dish names.
+
+  Args:
+    strings (Iterable[str]): Dish names whose tokens are separated by spaces
+    num_workers (int): The number of worker processes to compute the
+      statistics of shards on. If 1, they're computed in this process
+    shard_size (int): The number of dish names in each shard
+
+  Returns:
+    stats (CorpusStats): The statistics of every dish name
+  """
+
+  if num_workers <= 1:
+    return CorpusStats().update(strings)
+
+  strings = list(strings)
+  shards = [
+      strings[start:start + shard_size]
+      for start in range(0, len(strings), shard_size)
+  ]
+  stats = CorpusStats()
+  # Spawn fresh workers, since this may run in a process that has imported
+  # TensorFlow, which doesn't support being forked
+  with concurrent.futures.ProcessPoolExecutor(
+      num_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+    # Results come back in order, so tokens keep their order of first
+    # appearance
+    for shard_stats in executor.map(_shard_stats, shards):
+      stats.merge(shard_stats)
+
+  return stats
+
+
+def approximate(strings: Sequence[str],
+                min_count: int,
+                memory_bytes: int = SKETCH_MEMORY_BYTES,
+                depth: int = SKETCH_DEPTH):
+  """Computes corpus statistics, only counting frequent tokens.
+
+  The first pass over strings counts every token in a CountMinSketch, and the
+  second keeps the tokens whose estimated counts are at least min_count, in
+  order of first appearance. So memory is bounded by memory_bytes plus the
+  kept tokens, rather than by every distinct token.
+
+  Every token that appears at least min_count times is kept, with the same
+  order as in exact statistics. Tokens that appear fewer times may be kept
+  too, but (with probability at least 1 - exp(-depth)) only if they appear at
+  least min_count - count_error times. Length statistics are exact.
+
+  Args:
+    strings (Sequence[str]): Dish names whose tokens are separated by spaces.
+      They're iterated over twice
+    min_count (int): The number of times a token needs to appear to be kept
+    memory_bytes (int): The memory budget of the sketch, in bytes
+    depth (int): The number of rows of the sketch
+
+  Returns:
+    stats (CorpusStats): The statistics of every dish name, with token_counts
+    holding the estimated counts of the kept tokens
+  """
+
+  sketch = CountMinSketch.from_memory_budget(memory_bytes, depth)
+  stats = CorpusStats()
+  for chunk in _chunks(strings):
+    sketch.update(_chunk_tokens(chunk))
+    stats.length_counts = _add_counts(stats.length_counts,
+                                      _chunk_length_counts(chunk))
+    stats.num_strings += len(chunk)
+
+  for chunk in _chunks(strings):
+    tokens = pd.unique(np.asarray(_chunk_tokens(chunk), dtype=object))
+    tokens = [token for token in tokens if token not in stats.token_counts]
+    for token, count in zip(tokens, sketch.estimate(tokens)):
+      if count >= min_count:
+        stats.token_counts[token] = int(count)
+
+  stats.count_error = sketch.error_bound
+  return stats
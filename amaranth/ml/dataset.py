@@ -0,0 +1,137 @@
+# Lint as: python3
+"""This module builds tf.data input pipelines for training the ML model.
+
+Model inputs are read from a token id matrix (usually a memory-mapped .npy file)
+in chunks of rows, so the whole matrix never has to be copied into memory. The
+chunks are read in parallel, then shuffled, batched, and prefetched so the model
+never has to wait for its next batch.
+
+Most dish names are much shorter than the longest one, so for models that accept
+inputs of any length (see train.build_model's 'average' pooling), each row can
+be trimmed to its unpadded length and batched with rows of similar lengths.
+Each batch is then only padded to its own longest row, instead of to the whole
+corpus' longest row.
+"""
+
+from typing import Sequence
+
+import numpy as np
+import tensorflow as tf
+
+import amaranth
+from amaranth.ml import lib
+
+# Number of rows of the token id matrix to read at a time
+CHUNK_SIZE = 4096
+# Number of examples to shuffle between at a time
+SHUFFLE_BUFFER_SIZE = 16384
+# Upper bounds (exclusive) on the lengths of rows batched together, when
+# batching by length
+BUCKET_BOUNDARIES = (2, 3, 4, 5, 6, 8, 10, 13, 17, 23, 32)
+
+
+def make_dataset(inputs: np.ndarray,
+                 calorie_classes: np.ndarray,
+                 indices: np.ndarray = None,
+                 batch_size: int = amaranth.BATCH_SIZE,
+                 shuffle: bool = False,
+                 seed: int = None,
+                 chunk_size: int = CHUNK_SIZE,
+                 shuffle_buffer_size: int = SHUFFLE_BUFFER_SIZE,
+                 lengths: np.ndarray = None,
+                 bucket_boundaries: Sequence[int] = None):
+  """Makes a dataset of batched model inputs and one-hot-encoded labels.
+
+  Rows of inputs and calorie_classes are only read when the dataset is iterated
+  over, CHUNK_SIZE rows at a time, so both can be memory-mapped arrays that are
+  larger than memory.
+
+  Args:
+    inputs (np.ndarray): An (n, max_len) matrix of token ids
+    calorie_classes (np.ndarray): An (n,) array of calorie classes, as returned
+      by lib.label_calories
+    indices (np.ndarray): The rows of inputs and calorie_classes to include in
+      the dataset, in order. Defaults to every row.
+    batch_size (int): The number of examples in each batch
+    shuffle (bool): Whether to reshuffle the examples on each iteration
+    seed (int): The random seed to shuffle with
+    chunk_size (int): The number of rows to read at a time
+    shuffle_buffer_size (int): The number of examples to shuffle between at a
+      time
+    lengths (np.ndarray): An optional (n,) array with the number of (unpadded)
+      ids in each row of inputs. If given, each batch is only padded to its
+      longest row (but at least 1 id)
+    bucket_boundaries (Sequence[int]): If given along with lengths, rows are
+      only batched with rows whose lengths fall between the same boundaries
+      (such as BUCKET_BOUNDARIES), so batches contain little padding. Batches
+      are then no longer in order, even if shuffle is False
+
+  Returns:
+    dataset (tf.data.Dataset): A dataset of (inputs, labels) batches, where
+    labels are one-hot-encoded float32 calorie classes
+  """
+
+  if indices is None:
+    indices = np.arange(len(inputs))
+  max_len = inputs.shape[1]
+
+  def read_chunk(start):
+    chunk_indices = indices[start:start + chunk_size]
+    # Reading memory-mapped rows in ascending order is much faster than
+    # reading them in a random order, so read them sorted and then restore
+    # their original order
+    order = np.argsort(chunk_indices, kind='stable')
+    chunk_inputs = np.empty((len(chunk_indices), max_len), dtype=np.int32)
+    chunk_inputs[order] = inputs[chunk_indices[order]]
+    chunk_classes = np.empty(len(chunk_indices), dtype=np.int32)
+    chunk_classes[order] = calorie_classes[chunk_indices[order]]
+    chunk_lengths = np.full(len(chunk_indices), max_len, dtype=np.int32)
+    if lengths is not None:
+      chunk_lengths[order] = lengths[chunk_indices[order]]
+    return chunk_inputs, chunk_classes, chunk_lengths
+
+  def read_chunk_tensors(start):
+    chunk_inputs, chunk_classes, chunk_lengths = tf.numpy_function(
+        read_chunk, [start], (tf.int32, tf.int32, tf.int32))
+    chunk_inputs.set_shape([None, max_len])
+    chunk_classes.set_shape([None])
+    chunk_lengths.set_shape([None])
+    if lengths is None:
+      return chunk_inputs, chunk_classes
+    return chunk_inputs, chunk_classes, chunk_lengths
+
+  def trim(row_inputs, row_class, row_length):
+    # Keep at least one id, so every batch has a nonzero width
+    return row_inputs[:tf.maximum(row_length, 1)], row_class
+
+  def row_length(row_inputs, _):
+    return tf.shape(row_inputs)[0]
+
+  def one_hot_encode(batch_inputs, batch_classes):
+    return batch_inputs, tf.one_hot(batch_classes, lib.NUM_CALORIE_CLASSES)
+
+  chunk_starts = np.arange(0, len(indices), chunk_size, dtype=np.int64)
+  dataset = tf.data.Dataset.from_tensor_slices(chunk_starts)
+  if shuffle:
+    dataset = dataset.shuffle(len(chunk_starts), seed=seed)
+  dataset = dataset.map(
+      read_chunk_tensors, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  dataset = dataset.unbatch()
+  if shuffle:
+    dataset = dataset.shuffle(shuffle_buffer_size, seed=seed)
+  if lengths is None:
+    dataset = dataset.batch(batch_size)
+  elif bucket_boundaries is None:
+    dataset = dataset.map(trim).padded_batch(
+        batch_size, padded_shapes=([None], []))
+  else:
+    dataset = dataset.map(trim).apply(
+        tf.data.experimental.bucket_by_sequence_length(
+            row_length,
+            list(bucket_boundaries),
+            [batch_size] * (len(bucket_boundaries) + 1),
+            padded_shapes=([None], [])))
+  dataset = dataset.map(
+      one_hot_encode, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+  return dataset.prefetch(tf.data.experimental.AUTOTUNE)
@@ -0,0 +1,327 @@
+# Lint as: python3
+"""This module loads calorie data from the FDC dataset's CSV files.
+
+Rather than reading every column of every FDC file and joining them all before
+filtering, this module only reads the columns it needs (with explicit dtypes),
+filters food_nutrient.csv down to the Energy nutrient while it's being read, and
+only then joins the result with food.csv. String columns are read as pandas
+categoricals, since most of them have only a handful of distinct values, so
+they're stored (and compared, see lib.map_values) as small integer codes. The
+resulting calorie table is cached on disk in a columnar format keyed on the
+contents of the CSV files, so later runs can skip parsing the CSVs altogether.
+
+food_nutrient.csv is by far the largest file, so when it's large enough it's
+split into byte ranges that each start and end on a line boundary, which are
+parsed and filtered in parallel on a pool of worker processes.
+"""
+
+import concurrent.futures
+import io
+import multiprocessing
+import os
+from typing import Iterable, List, Tuple
+
+import pandas as pd
+
+from amaranth.ml import instrumentation
+from amaranth.ml import lib
+from amaranth.ml import stage_cache
+
+# Columns (and their dtypes) to read from each FDC file
+FOOD_DTYPES = {
+    'fdc_id': 'int64',
+    'data_type': 'category',
+    'description': 'category',
+}
+FOOD_NUTRIENT_DTYPES = {
+    'fdc_id': 'int64',
+    'nutrient_id': 'int64',
+    'amount': 'float64',
+}
+NUTRIENT_DTYPES = {
+    'id': 'int64',
+    'name': 'category',
+    'unit_name': 'category',
+}
+# Columns of the calorie table, in order
+CALORIE_DATA_COLUMNS = [
+    'description', 'data_type', 'name', 'amount', 'unit_name'
+]
+# FDC files the calorie table is built from
+FDC_FILES = ['food.csv', 'food_nutrient.csv', 'nutrient.csv']
+# Rows of food_nutrient.csv to parse at a time
+FOOD_NUTRIENT_CHUNKSIZE = 1_000_000
+# Bytes of food_nutrient.csv each worker process parses at a time
+BYTE_RANGE_SIZE = 64 * 2**20
+# Bump this whenever the contents of the calorie table change, so that stale
+# caches are ignored
+CACHE_VERSION = 2
+
+
+def read_nutrient(fdc_data_dir: str):
+  """Reads the relevant columns of nutrient.csv.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+
+  Returns:
+    nutrient (pd.DataFrame): nutrient.csv with its 'id' column renamed to
+    'nutrient_id'
+  """
+
+  return pd.read_csv(
+      os.path.join(fdc_data_dir, 'nutrient.csv'),
+      usecols=list(NUTRIENT_DTYPES),
+      dtype=NUTRIENT_DTYPES,
+  ).rename(columns={'id': 'nutrient_id'})
+
+
+def read_food(fdc_data_dir: str):
+  """Reads the relevant columns of food.csv.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+
+  Returns:
+    food (pd.DataFrame): The 'fdc_id', 'data_type', and 'description' columns
+    of food.csv
+  """
+
+  return pd.read_csv(
+      os.path.join(fdc_data_dir, 'food.csv'),
+      usecols=list(FOOD_DTYPES),
+      dtype=FOOD_DTYPES,
+  )
+
+
+def line_byte_ranges(path: str, range_size: int):
+  """Splits a CSV file into byte ranges of whole lines, after its header.
+
+  This assumes no quoted field contains a line break, which holds for
+  food_nutrient.csv.
+
+  Args:
+    path (str): The CSV file to split
+    range_size (int): The approximate number of bytes in each range
+
+  Returns:
+    header (bytes): The file's header line
+    ranges (List[Tuple[int, int]]): The start (inclusive) and end (exclusive)
+    offsets of each range, in order. Every range starts at the start of a line
+    and ends just after a line break (or at the end of the file)
+  """
+
+  file_size = os.path.getsize(path)
+  with open(path, 'rb') as file:
+    header = file.readline()
+    offsets = [file.tell()]
+    while offsets[-1] < file_size:
+      # Starting one byte early finds the line break that ends the range, even
+      # if it's the last byte before the target
+      file.seek(max(offsets[-1] + range_size - 1, offsets[-1]))
+      file.readline()
+      offsets.append(min(file.tell(), file_size))
+
+  return header, list(zip(offsets[:-1], offsets[1:]))
+
+
+def _read_food_nutrient_range(path: str, header: bytes,
+                              byte_range: Tuple[int, int],
+                              nutrient_ids: List[int]):
+  """Parses one byte range of food_nutrient.csv, keeping the given nutrients."""
+
+  start, end = byte_range
+  with open(path, 'rb') as file:
+    file.seek(start)
+    data = file.read(end - start)
+
+  chunk = pd.read_csv(
+      io.BytesIO(header + data),
+      usecols=list(FOOD_NUTRIENT_DTYPES),
+      dtype=FOOD_NUTRIENT_DTYPES,
+  )
+  return chunk[chunk['nutrient_id'].isin(nutrient_ids)]
+
+
+def read_food_nutrient(fdc_data_dir: str,
+                       nutrient_ids: Iterable[int],
+                       num_workers: int = None,
+                       range_size: int = None):
+  """Reads the rows of food_nutrient.csv for the given nutrients.
+
+  If food_nutrient.csv is larger than range_size, it's split into byte ranges
+  of about range_size bytes (see line_byte_ranges), which are parsed and
+  filtered on a pool of num_workers processes. Otherwise it's read in chunks of
+  FOOD_NUTRIENT_CHUNKSIZE rows in this process. Either way, each range or
+  chunk is filtered as soon as it's parsed, so the whole file is never in
+  memory at once, and the rows are returned in the same order.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    nutrient_ids (Iterable[int]): The ids of the nutrients to keep
+    num_workers (int): The number of worker processes. Defaults to the number
+      of CPUs
+    range_size (int): The number of bytes each worker parses at a time.
+      Defaults to BYTE_RANGE_SIZE
+
+  Returns:
+    food_nutrient (pd.DataFrame): The 'fdc_id', 'nutrient_id', and 'amount'
+    columns of every row of food_nutrient.csv with a nutrient in nutrient_ids
+  """
+
+  nutrient_ids = list(nutrient_ids)
+  path = os.path.join(fdc_data_dir, 'food_nutrient.csv')
+  num_workers = num_workers or os.cpu_count() or 1
+  range_size = range_size or BYTE_RANGE_SIZE
+
+  if num_workers > 1 and os.path.getsize(path) > range_size:
+    header, byte_ranges = line_byte_ranges(path, range_size)
+    # Spawn fresh workers, since this may run in a process that has imported
+    # TensorFlow, which doesn't support being forked
+    with concurrent.futures.ProcessPoolExecutor(
+        min(num_workers, len(byte_ranges)),
+        mp_context=multiprocessing.get_context('spawn')) as executor:
+      filtered_chunks = list(
+          executor.map(_read_food_nutrient_range, [path] * len(byte_ranges),
+                       [header] * len(byte_ranges), byte_ranges,
+                       [nutrient_ids] * len(byte_ranges)))
+  else:
+    chunks = pd.read_csv(
+        path,
+        usecols=list(FOOD_NUTRIENT_DTYPES),
+        dtype=FOOD_NUTRIENT_DTYPES,
+        chunksize=FOOD_NUTRIENT_CHUNKSIZE,
+    )
+    filtered_chunks = [
+        chunk[chunk['nutrient_id'].isin(nutrient_ids)] for chunk in chunks
+    ]
+
+  if not filtered_chunks:
+    return pd.DataFrame(
+        {col: pd.Series(dtype=dtype)
+         for col, dtype in FOOD_NUTRIENT_DTYPES.items()})
+
+  return pd.concat(filtered_chunks, ignore_index=True)
+
+
+def build_calorie_data(
+    fdc_data_dir: str,
+    units: str = 'kcal',
+    metrics: instrumentation.RunMetrics = instrumentation.DISABLED,
+    num_workers: int = None):
+  """Builds the calorie table from the FDC dataset's CSV files.
+
+  The resulting table has the same rows as joining food.csv, food_nutrient.csv,
+  and nutrient.csv with lib.combine_dataframes, extracting calorie data with
+  lib.get_calorie_data, keeping only CALORIE_DATA_COLUMNS, and cleaning it with
+  lib.clean_data. The only difference is that it has a default RangeIndex.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    units (str): The desired units of the calorie data
+    metrics (instrumentation.RunMetrics): Records the time each step takes,
+      the number of rows left after each filter, and the number of rows
+      cleaning dropped by each of lib.DROP_RULES
+    num_workers (int): The number of processes to parse food_nutrient.csv with
+      (see read_food_nutrient)
+
+  Returns:
+    calorie_data (pd.DataFrame): The cleaned calorie table
+  """
+
+  # nutrient.csv is tiny, so filter it first to find which nutrient ids to keep
+  with metrics.stage('read_nutrient'):
+    nutrient = lib.get_calorie_data(read_nutrient(fdc_data_dir), units)
+  with metrics.stage('read_food_nutrient'):
+    food_nutrient = read_food_nutrient(fdc_data_dir, nutrient['nutrient_id'],
+                                       num_workers)
+  metrics.count('calorie_food_nutrient_rows', len(food_nutrient))
+
+  # Join onto food to keep the same row order as lib.combine_dataframes. Only
+  # foods with calorie data are matched
+  with metrics.stage('read_food'):
+    food = read_food(fdc_data_dir)
+  with metrics.stage('join'):
+    calorie_data = lib.join_dataframes(
+        food, [
+            lib.Join(food_nutrient, 'fdc_id'),
+            lib.Join(nutrient, 'nutrient_id'),
+        ],
+        how='inner')
+  metrics.count('joined_rows', len(calorie_data))
+
+  drop_counts = {}
+  with metrics.stage('clean'):
+    calorie_data = lib.clean_data(calorie_data[CALORIE_DATA_COLUMNS],
+                                  drop_counts=drop_counts)
+  for rule, num_dropped in drop_counts.items():
+    metrics.count(f'{rule}_dropped_rows', num_dropped)
+  metrics.count('cleaned_rows', len(calorie_data))
+
+  return calorie_data.reset_index(drop=True)
+
+
+def calorie_data_key(cache: stage_cache.StageCache,
+                     fdc_data_dir: str,
+                     units: str = 'kcal'):
+  """Computes the stage cache key of the calorie table.
+
+  Args:
+    cache (stage_cache.StageCache): The cache the calorie table is cached in
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    units (str): The desired units of the calorie data
+
+  Returns:
+    key (str): A fingerprint of the contents of the FDC files, the units, and
+    CACHE_VERSION
+  """
+
+  digest = cache.file_digest(
+      [os.path.join(fdc_data_dir, f) for f in FDC_FILES])
+  return stage_cache.fingerprint('calorie_data', digest, units.lower(),
+                                 CACHE_VERSION)
+
+
+def load_calorie_data(
+    fdc_data_dir: str,
+    cache_dir: str = None,
+    units: str = 'kcal',
+    metrics: instrumentation.RunMetrics = instrumentation.DISABLED,
+    num_workers: int = None):
+  """Loads the calorie table, using a cached copy if one exists.
+
+  The calorie table is cached in cache_dir as the 'calorie_data' stage of a
+  stage_cache.StageCache, keyed on calorie_data_key. So if the contents of the
+  FDC files, the units, or CACHE_VERSION change, the calorie table is rebuilt
+  from the CSV files and cached again.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    cache_dir (str): The directory to cache the calorie table in. Defaults to a
+      'cache' directory inside fdc_data_dir
+    units (str): The desired units of the calorie data
+    metrics (instrumentation.RunMetrics): Records whether the cache was hit and
+      the time each step takes
+    num_workers (int): The number of processes to parse food_nutrient.csv with
+      if the calorie table isn't cached (see read_food_nutrient)
+
+  Returns:
+    calorie_data (pd.DataFrame): The cleaned calorie table
+  """
+
+  if cache_dir is None:
+    cache_dir = os.path.join(fdc_data_dir, 'cache')
+  cache = stage_cache.StageCache(cache_dir, metrics)
+
+  with metrics.stage('hash_files'):
+    key = calorie_data_key(cache, fdc_data_dir, units)
+
+  return cache.memoize(
+      'calorie_data',
+      key,
+      '.parquet',
+      compute=lambda: build_calorie_data(fdc_data_dir, units, metrics,
+                                         num_workers),
+      save=lambda calorie_data, path: calorie_data.to_parquet(
+          path, index=False),
+      load=pd.read_parquet)
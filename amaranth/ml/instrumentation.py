@@ -0,0 +1,294 @@
+# Lint as: python3
+"""This module records how long each stage of a pipeline takes.
+
+A RunMetrics object times stages of a pipeline (with its stage context manager
+or timed decorator), records counts like the number of rows left after each
+filter, and times each training epoch (with its Keras callback). Its summary is
+saved as a JSON metrics file. Optionally, it also records each stage's peak
+allocated memory with tracemalloc, and profiles the whole run with cProfile.
+
+A disabled RunMetrics (such as DISABLED) records nothing, and each of its stages
+costs about a microsecond, so instrumentation can stay in place in code that
+isn't being measured.
+"""
+
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+  import resource
+except ImportError:  # resource is Unix-only
+  resource = None
+
+# Number of functions to show when printing profiler stats
+NUM_PROFILE_FUNCTIONS = 30
+
+
+def peak_rss_mb():
+  """The peak resident set size of this process so far, in MB.
+
+  Returns:
+    peak_rss_mb (float): The peak RSS, or 0.0 if it can't be measured on this
+    platform
+  """
+
+  if resource is None:
+    return 0.0
+
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+  if sys.platform == 'darwin':
+    return max_rss / 2**20
+  return max_rss / 2**10
+
+
+class _DisabledStage:
+  """A reusable, do-nothing stand-in for a stage's context manager."""
+
+  def __enter__(self):
+    return {}
+
+  def __exit__(self, *exc_info):
+    return False
+
+
+_DISABLED_STAGE = _DisabledStage()
+
+
+class RunMetrics:
+  """Records stage durations, counts, and epoch times of a pipeline run.
+
+  Attributes:
+    enabled (bool): Whether anything is recorded
+    trace_memory (bool): Whether to record the peak memory allocated during
+      each stage with tracemalloc. This is more precise than peak RSS, but
+      slows every stage down considerably.
+    stages (List[dict]): Each finished stage's name (nested stages' names are
+      prefixed with their parents' names and a '/'), seconds, number of input
+      rows and rows_per_sec (if the stage set its 'rows'), peak_rss_mb, and
+      peak_traced_mb (if trace_memory)
+    counts (Dict[str, int]): Named counts, such as rows left after a filter
+    epochs (List[dict]): Each training epoch's seconds and Keras logs
+  """
+
+  def __init__(self,
+               enabled: bool = True,
+               trace_memory: bool = False,
+               profile: bool = False):
+    self.enabled = enabled
+    self.trace_memory = enabled and trace_memory
+    self.stages = []
+    self.counts = {}
+    self.epochs = []
+    self._start_time = time.perf_counter()
+    self._stage_names = []
+    # Peak traced memory of each running stage's finished children
+    self._child_peaks = []
+
+    self._profiler = None
+    if enabled and profile:
+      self._profiler = cProfile.Profile()
+      self._profiler.enable()
+    self._started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+    if self._started_tracing:
+      tracemalloc.start()
+
+  def stage(self, name: str):
+    """Times a stage of the pipeline.
+
+    Used as a context manager, which yields the stage's record. The stage's
+    number of input rows can be set in its 'rows' key, so its throughput is
+    recorded too.
+
+    Args:
+      name (str): The stage's name
+
+    Returns:
+      stage (ContextManager[dict]): The stage's context manager
+    """
+
+    if not self.enabled:
+      return _DISABLED_STAGE
+    return self._stage(name)
+
+  @contextlib.contextmanager
+  def _stage(self, name: str):
+    self._stage_names.append(name)
+    stage = {'name': '/'.join(self._stage_names)}
+    if self.trace_memory:
+      self._start_tracing_stage()
+
+    start_time = time.perf_counter()
+    try:
+      yield stage
+    finally:
+      seconds = time.perf_counter() - start_time
+      self._stage_names.pop()
+
+      stage['seconds'] = seconds
+      if 'rows' in stage:
+        stage['rows_per_sec'] = stage['rows'] / seconds if seconds > 0 else 0.0
+      stage['peak_rss_mb'] = peak_rss_mb()
+      if self.trace_memory:
+        stage['peak_traced_mb'] = self._stop_tracing_stage() / 2**20
+      self.stages.append(stage)
+
+  def _start_tracing_stage(self):
+    if self._child_peaks:
+      # Fold the parent's peak so far in before resetting it for this stage
+      self._child_peaks[-1] = max(self._child_peaks[-1],
+                                  tracemalloc.get_traced_memory()[1])
+    self._reset_peak()
+    self._child_peaks.append(0)
+
+  def _stop_tracing_stage(self):
+    peak = max(self._child_peaks.pop(), tracemalloc.get_traced_memory()[1])
+    if self._child_peaks:
+      self._child_peaks[-1] = max(self._child_peaks[-1], peak)
+    self._reset_peak()
+    return peak
+
+  @staticmethod
+  def _reset_peak():
+    # tracemalloc.reset_peak is new in Python 3.9. Before that, peaks are
+    # measured since tracing started.
+    if hasattr(tracemalloc, 'reset_peak'):
+      tracemalloc.reset_peak()
+
+  def timed(self, name: str = None):
+    """Decorates a function so each call to it is timed as a stage.
+
+    Args:
+      name (str): The stage's name. Defaults to the function's name
+
+    Returns:
+      decorator (Callable): The decorator
+    """
+
+    def decorator(func):
+
+      @functools.wraps(func)
+      def wrapper(*args, **kwargs):
+        with self.stage(name or func.__name__):
+          return func(*args, **kwargs)
+
+      return wrapper
+
+    return decorator
+
+  def count(self, name: str, value: int):
+    """Records a named count, such as the number of rows left after a filter.
+
+    Args:
+      name (str): The count's name
+      value (int): The count
+    """
+
+    if self.enabled:
+      self.counts[name] = int(value)
+
+  def epoch_callback(self):
+    """Creates a Keras callback that records each epoch's time and logs.
+
+    Returns:
+      callback (keras.callbacks.Callback): The callback to pass to model.fit
+    """
+
+    from tensorflow import keras  # pylint: disable=import-outside-toplevel
+
+    metrics = self
+
+    class EpochTimer(keras.callbacks.Callback):
+
+      def on_epoch_begin(self, epoch, logs=None):
+        self.start_time = time.perf_counter()  # pylint: disable=attribute-defined-outside-init
+
+      def on_epoch_end(self, epoch, logs=None):
+        if metrics.enabled:
+          epoch_metrics = {
+              'epoch': epoch,
+              'seconds': time.perf_counter() - self.start_time
+          }
+          epoch_metrics.update(
+              {key: float(value) for key, value in (logs or {}).items()})
+          metrics.epochs.append(epoch_metrics)
+
+    return EpochTimer()
+
+  def summary(self):
+    """Summarizes everything recorded so far.
+
+    Returns:
+      summary (dict): The total_seconds since this object was created, the
+      process' peak_rss_mb, and the recorded stages, counts, and epochs
+    """
+
+    return {
+        'total_seconds': time.perf_counter() - self._start_time,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': self.stages,
+        'counts': self.counts,
+        'epochs': self.epochs,
+    }
+
+  def profile_stats(self, num_functions: int = NUM_PROFILE_FUNCTIONS):
+    """Formats the functions that took the most cumulative time.
+
+    Args:
+      num_functions (int): The number of functions to show
+
+    Returns:
+      stats (str): The formatted profiler stats, or '' if not profiling. Stops
+      profiling
+    """
+
+    if self._profiler is None:
+      return ''
+
+    self._profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(self._profiler, stream=output).sort_stats(
+        'cumulative').print_stats(num_functions)
+    return output.getvalue()
+
+  def save(self, path: str):
+    """Saves the summary to a JSON file.
+
+    If profiling, profiling stops and the profiler stats are saved next to it,
+    with a .prof extension. They can be explored with pstats or a viewer like
+    snakeviz.
+
+    Args:
+      path (str): The JSON file to save the summary to
+    """
+
+    if not self.enabled:
+      return
+
+    with open(path, 'w') as file:
+      json.dump(self.summary(), file, indent=2)
+
+    if self._profiler is not None:
+      self._profiler.disable()
+      self._profiler.dump_stats(f'{os.path.splitext(path)[0]}.prof')
+
+  def close(self):
+    """Stops profiling and tracing memory (if this object started it)."""
+
+    if self._profiler is not None:
+      self._profiler.disable()
+    if self._started_tracing:
+      tracemalloc.stop()
+      self._started_tracing = False
+
+
+# Records nothing. The default for code that accepts an optional RunMetrics
+DISABLED = RunMetrics(enabled=False)
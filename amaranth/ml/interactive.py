@@ -5,25 +5,41 @@ Here, you can type in any arbitrary text and the model will attempt to classify
 it as a low, average, or high-calorie dish.
 """
 
+import argparse
 import sys
-import os
 
-import tensorflow as tf
-import tensorflow_addons as tfa
-from tensorflow import keras
+from amaranth.ml import classifier
+from amaranth.ml import prediction_cache
+from amaranth.ml import registry
 
-# Project resources directory
-RESOURCES_DIR = '../resources/'
 
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Classify dish names typed into stdin.')
+  parser.add_argument(
+      '--cache-file',
+      help='JSON file to load cached predictions from and save them to')
+  parser.add_argument(
+      '--model-version',
+      help=('model registry version to classify with (default: the active '
+            'version)'))
 
-def main():
-  current_dir = os.path.dirname(__file__)
+  return parser.parse_args(argv)
 
-  model = keras.models.load_model(
-      os.path.join(current_dir, RESOURCES_DIR, 'model'),
-      custom_objects={'F1Score': tfa.metrics.F1Score(num_classes=3)})
 
-  print(model.summary())
+def main(argv=None):
+  args = parse_args(argv)
+
+  calorie_classifier = registry.ModelRegistry().load_classifier(
+      args.model_version)
+  # Saved predictions are only reused if they were made by the same model
+  if args.cache_file:
+    calorie_classifier.cache = prediction_cache.PredictionCache.load(
+        args.cache_file, model_id=calorie_classifier.model_id)
+  else:
+    calorie_classifier.cache = prediction_cache.PredictionCache()
+
+  calorie_classifier.model.summary()
 
   print('\nPress CTRL-D to end.')
 
@@ -33,15 +49,8 @@ def main():
     dish_name = sys.stdin.readline()
 
     if dish_name:
-      prediction, = model.predict([dish_name])
-      cal_label = tf.math.argmax(prediction)
-
-      if cal_label == 0:
-        print('Low Calorie')
-      elif cal_label == 1:
-        print('Average Calorie')
-      else:
-        print('High Calorie')
+      prediction, = calorie_classifier.predict([dish_name])
+      print(classifier.CALORIE_LABELS[prediction.argmax()])
 
       print('----------')
 
@@ -53,6 +62,9 @@ def main():
     else:
       end = True
 
+  if args.cache_file:
+    calorie_classifier.cache.save(args.cache_file)
+
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,44 @@
+# Lint as: python3
+"""This module defines the custom Keras layers used by the ML model.
+
+Models that use these layers need them passed as custom_objects (see
+CUSTOM_OBJECTS) when they're loaded.
+"""
+
+import tensorflow as tf
+from tensorflow import keras
+
+
+@keras.utils.register_keras_serializable(package='amaranth')
+class MaskedAveragePooling1D(keras.layers.Layer):
+  """Averages a sequence of embeddings over its unmasked (non-padding) steps.
+
+  Unlike keras.layers.GlobalAveragePooling1D, sequences with no unmasked steps
+  (such as dish names made up entirely of out-of-vocabulary tokens, which share
+  the padding id) average to zeros instead of NaNs. And since padding is
+  ignored, the output doesn't depend on how much a sequence was padded, so
+  inputs can be any length.
+  """
+
+  def __init__(self, **kwargs):
+    super().__init__(**kwargs)
+    self.supports_masking = True
+
+  def call(self, inputs, mask=None):  # pylint: disable=arguments-differ
+    if mask is None:
+      return tf.reduce_mean(inputs, axis=1)
+
+    mask = tf.cast(mask, inputs.dtype)[:, :, tf.newaxis]
+    total = tf.reduce_sum(inputs * mask, axis=1)
+    count = tf.reduce_sum(mask, axis=1)
+    return total / tf.maximum(count, 1)
+
+  def compute_output_shape(self, input_shape):
+    return (input_shape[0], input_shape[2])
+
+  def compute_mask(self, inputs, mask=None):  # pylint: disable=unused-argument
+    return None
+
+
+# Custom layers by name, for keras.models.load_model
+CUSTOM_OBJECTS = {'MaskedAveragePooling1D': MaskedAveragePooling1D}
@@ -5,9 +5,43 @@ This module is in charge of encapsulating commonly used methods or well-defined
 functions away from ml/main.py for simplicity and readability.
 """
 
-from typing import Iterable, Sized, List, Any
+import collections
+import concurrent.futures
+import itertools
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Sized
+import numpy as np
 import pandas as pd
 
+# Number of calorie classes (low, average, and high calorie)
+NUM_CALORIE_CLASSES = 3
+# Number of strings to encode at a time in encode_corpus
+ENCODE_CHUNK_SIZE = 65536
+# Number of strings to normalize at a time in normalize_strings
+NORMALIZE_CHUNK_SIZE = 65536
+# Joins the strings of a chunk in normalize_strings. Lowercasing never produces
+# it, and it isn't cased or case-ignorable, so it doesn't change how the
+# letters around it are lowercased
+NORMALIZE_SEPARATOR = '\x00'
+# Ways join_dataframes can join tables
+JOIN_MODES = ('left', 'inner')
+# Rules clean_data and clean_chunks drop rows by, in the order they're applied
+DROP_RULES = ('missing', 'duplicate')
+# Number of row hashes clean_chunks remembers by default (about 100 bytes each)
+MAX_SEEN_ROWS = 4_000_000
+
+Join = collections.namedtuple('Join', ['dataframe', 'on', 'where'],
+                              defaults=[None])
+Join.__doc__ = """A table to join in join_dataframes.
+
+Attributes:
+  dataframe (pd.DataFrame): The table
+  on (str): The key column to join the table on. The tables joined before it
+    must have exactly one column with this name
+  where (Callable[[pd.DataFrame], pd.Series]): An optional predicate, returning
+    a boolean mask of the table's rows to keep. It's applied to the table
+    before it's joined
+"""
+
 
 def combine_dataframes(index: str, *dataframes: pd.DataFrame):
   """Takes a DataFrame index, and DataFrames to join based on that index.
@@ -33,6 +67,208 @@ def combine_dataframes(index: str, *dataframes: pd.DataFrame):
   return combined_dataframe
 
 
+def _join_positions(left_keys: np.ndarray, right_keys: np.ndarray, how: str):
+  """Matches the rows of two key arrays, like a merge of the two.
+
+  Returns:
+    left_positions (np.ndarray): The row of left_keys in each joined row
+    right_positions (np.ndarray): The row of right_keys in each joined row, or
+    -1 for left rows without a match (if how is 'left')
+  """
+
+  right_index = pd.Index(right_keys)
+  if right_index.is_unique:
+    # Look up each left key in the right keys' hash table
+    right_positions = right_index.get_indexer(left_keys)
+    left_positions = np.arange(len(left_keys))
+    if how == 'inner':
+      matched = right_positions >= 0
+      return left_positions[matched], right_positions[matched]
+    return left_positions, right_positions
+
+  # Duplicate right keys produce several rows per left row. merge only keeps
+  # the left rows' order for left joins, so order the matches explicitly: by
+  # left row, then by right row
+  joined = pd.DataFrame({
+      'key': left_keys,
+      'left': np.arange(len(left_keys))
+  }).merge(
+      pd.DataFrame({
+          'key': right_keys,
+          'right': np.arange(len(right_keys))
+      }),
+      on='key',
+      how=how)
+  left_positions = joined['left'].to_numpy()
+  right_positions = joined['right'].fillna(-1).to_numpy(dtype=np.int64)
+  order = np.lexsort((right_positions, left_positions))
+  return left_positions[order], right_positions[order]
+
+
+def join_dataframes(base: pd.DataFrame,
+                    joins: Sequence[Join],
+                    how: str = 'left',
+                    where: Callable[[pd.DataFrame], pd.Series] = None):
+  """Joins several tables onto a base table, each on its own key column.
+
+  The result has the same rows as merging each table onto the result so far
+  with pd.DataFrame.merge, after filtering each table with its predicate. But
+  rather than copying every column of the growing table on each merge, each
+  join only matches rows by their keys, and each table's columns are copied
+  once, into the result.
+
+  Rows are ordered by their row of base, then by their row of each joined
+  table in turn. That's the same order as the chained merges for left joins,
+  and for inner joins whose joined tables have unique keys. Inner merges onto
+  duplicate keys order their rows differently, so for those, only the rows
+  (not their order) match the chained merges.
+
+  With how='inner', every table is also filtered down to the keys of the
+  (filtered) tables joined onto it before anything is joined, so a predicate on
+  a small table (like nutrient.csv's name) shrinks the large tables it's joined
+  with (like food_nutrient.csv) before they're matched.
+
+  Args:
+    base (pd.DataFrame): The table to join the others onto
+    joins (Sequence[Join]): The tables to join, in order
+    how (str): 'left' to keep rows of base with no match in a table, filling
+      the table's columns with NaN, or 'inner' to drop them
+    where (Callable[[pd.DataFrame], pd.Series]): An optional predicate on base,
+      returning a boolean mask of its rows to keep
+
+  Returns:
+    joined (pd.DataFrame): The joined table, with a default RangeIndex. Each key
+    column appears once, and every other column appears in the order of the
+    tables
+
+  Raises:
+    ValueError: If how isn't in JOIN_MODES, or if a column other than a key
+      appears in more than one table
+    KeyError: If a key column is missing from a table, or from every table
+      before it
+  """
+
+  if how not in JOIN_MODES:
+    raise ValueError(f'Unknown join mode {how}, expected one of {JOIN_MODES}')
+
+  tables = [base if where is None else base[where(base)]]
+  for join in joins:
+    table = join.dataframe
+    if join.where is not None:
+      table = table[join.where(table)]
+    if join.on not in table.columns:
+      raise KeyError(join.on)
+    tables.append(table)
+
+  # Find the earlier table each key column comes from, and which columns of
+  # each table end up in the result
+  key_sources = []
+  columns = [list(tables[0].columns)]
+  seen_columns = set(columns[0])
+  for idx, join in enumerate(joins, 1):
+    sources = [
+        source for source in range(idx) if join.on in tables[source].columns
+    ]
+    if not sources:
+      raise KeyError(join.on)
+    key_sources.append(sources[0])
+    columns.append([col for col in tables[idx].columns if col != join.on])
+    duplicates = seen_columns.intersection(columns[-1])
+    if duplicates:
+      raise ValueError(f'Columns {sorted(duplicates)} appear in more than one '
+                       'table')
+    seen_columns.update(columns[-1])
+
+  if how == 'inner':
+    # Semi-join reduction: drop rows whose keys can't match, last table first,
+    # so each table's filter propagates to every table before it
+    for idx in range(len(joins), 0, -1):
+      keys = tables[idx][joins[idx - 1].on]
+      source = key_sources[idx - 1]
+      tables[source] = tables[source][tables[source][joins[idx - 1].on].isin(
+          keys)]
+
+  # The row of each table in each row of the result (or -1 for no match)
+  positions = [np.arange(len(tables[0]))]
+  for idx, join in enumerate(joins, 1):
+    source = key_sources[idx - 1]
+    source_keys = tables[source][join.on].to_numpy()
+    source_positions = positions[source]
+    if (source_positions < 0).any():
+      # Rows without a match in the source table have no key
+      left_keys = pd.api.extensions.take(
+          source_keys, source_positions, allow_fill=True)
+    else:
+      left_keys = source_keys[source_positions]
+    left_positions, right_positions = _join_positions(
+        left_keys, tables[idx][join.on].to_numpy(), how)
+    positions = [
+        table_positions[left_positions] for table_positions in positions
+    ]
+    positions.append(right_positions)
+
+  joined = {}
+  for table, table_columns, table_positions in zip(tables, columns, positions):
+    for col in table_columns:
+      values = table[col].array
+      joined[col] = values.take(
+          table_positions, allow_fill=bool((table_positions < 0).any()))
+
+  return pd.DataFrame(joined, columns=[col for cols in columns for col in cols])
+
+
+def map_values(series: pd.Series, function: Callable[[pd.Series], pd.Series]):
+  """Applies an elementwise function to a Series, once per distinct value.
+
+  If series is categorical, function is only applied to its categories, and
+  the results are looked up by each row's category code, so expensive string
+  operations run once per distinct string rather than once per row.
+
+  Args:
+    series (pd.Series): The Series to apply function to
+    function (Callable[[pd.Series], pd.Series]): An elementwise function of a
+      Series, such as lambda values: values.str.lower() == 'kcal'
+
+  Returns:
+    mapped (pd.Series): function(series), with the same index as series.
+    Missing values of a categorical series map to NaN, or to False if function
+    returns booleans
+  """
+
+  if not isinstance(series.dtype, pd.CategoricalDtype):
+    return function(series)
+
+  mapped = np.asarray(function(pd.Series(series.cat.categories)))
+  # Missing values have code -1, which looks up the appended fill value
+  fill_value = False if mapped.dtype == bool else np.nan
+  mapped = np.append(mapped, np.array([fill_value], dtype=mapped.dtype))
+  return pd.Series(
+      mapped[series.cat.codes.to_numpy()], index=series.index, name=series.name)
+
+
+def calorie_mask(dataframe: pd.DataFrame, units: str):
+  """Finds the rows of a DataFrame with calorie data in the specified units.
+
+  Categorical 'name' and 'unit_name' columns are compared by their category
+  codes (see map_values), without lowercasing every row.
+
+  Args:
+    dataframe (pd.DataFrame): A DataFrame with 'name' and 'unit_name' columns
+    units (str): The desired units of the calorie data
+
+  Returns:
+    mask (pd.Series): Whether each row's 'name' is 'Energy' and its 'unit_name'
+    is 'units' (ignoring case)
+
+  Raises:
+    KeyError: If either 'name' or 'unit_name' columns are absent in 'dataframe'
+  """
+
+  return (map_values(dataframe['name'], lambda names: names == 'Energy') &
+          map_values(dataframe['unit_name'],
+                     lambda unit_names: unit_names.str.lower() == units.lower()))
+
+
 def get_calorie_data(dataframe: pd.DataFrame, units: str):
   """Gets calorie data from a DataFrame in the specified units.
 
@@ -52,26 +288,195 @@ def get_calorie_data(dataframe: pd.DataFrame, units: str):
     KeyError: If either 'name' or 'unit_name' columns are absent in 'dataframe'
   """
 
-  # Only keep rows where value of 'name' == 'Energy'
-  calorie_data = dataframe[(dataframe['name'] == 'Energy')]
-  # Only keep rows where value of 'unit_name' == units
-  calorie_data = calorie_data[(
-      calorie_data['unit_name'].str.lower() == units.lower())]
+  return dataframe[calorie_mask(dataframe, units)]
 
-  return calorie_data
 
+def _column_hashes(column: pd.Series, category_hashes: Dict[str, Any]):
+  """Hashes each value of a column to a 64-bit integer."""
 
-def clean_data(dataframe: pd.DataFrame):
+  if not isinstance(column.dtype, pd.CategoricalDtype):
+    return pd.util.hash_array(column.to_numpy())
+
+  codes = column.cat.codes.to_numpy()
+  if category_hashes is None:
+    # Within one column, equal codes mean equal values
+    return codes.astype(np.uint64)
+
+  # Chunks of a stream usually share their dtype, so their categories are only
+  # hashed once. Code -1 (a missing value) looks up the appended hash of None
+  dtype, hashes = category_hashes.get(column.name, (None, None))
+  if dtype is not column.dtype:
+    hashes = np.append(
+        pd.util.hash_array(column.cat.categories.to_numpy(), categorize=False),
+        pd.util.hash_array(np.array([None], dtype=object)))
+    category_hashes[column.name] = column.dtype, hashes
+  return hashes[codes]
+
+
+def _row_hashes(dataframe: pd.DataFrame, subset: Sequence[str],
+                category_hashes: Dict[str, Any]):
+  """Hashes each row of a DataFrame's subset columns to a 64-bit integer.
+
+  If category_hashes is None, categorical columns are hashed by their codes,
+  so hashes can only be compared within the DataFrame. Otherwise they're
+  hashed by their values, like every other column, and category_hashes caches
+  the hashes of each column's categories. Distinct rows collide with a
+  probability of about 2**-64.
+  """
+
+  columns = dataframe.columns if subset is None else list(subset)
+  hashes = pd.DataFrame({
+      idx: _column_hashes(dataframe[col], category_hashes)
+      for idx, col in enumerate(columns)
+  })
+  return pd.util.hash_pandas_object(hashes, index=False).to_numpy()
+
+
+def _drop_masks(dataframe: pd.DataFrame, subset: Sequence[str],
+                category_hashes: Dict[str, Any] = None):
+  """Finds rows with missing values and repeats of earlier rows' hashes."""
+
+  missing = dataframe.isna().any(axis=1).to_numpy()
+  hashes = _row_hashes(dataframe, subset, category_hashes)
+  duplicate = np.zeros(len(dataframe), dtype=bool)
+  duplicate[~missing] = pd.Series(hashes[~missing]).duplicated().to_numpy()
+  return missing, duplicate, hashes
+
+
+def _count_drops(drop_counts: Dict[str, int], missing: np.ndarray,
+                 duplicate: np.ndarray):
+  if drop_counts is not None:
+    for rule, mask in zip(DROP_RULES, (missing, duplicate)):
+      drop_counts[rule] = drop_counts.get(rule, 0) + int(mask.sum())
+
+
+def clean_data(dataframe: pd.DataFrame,
+               subset: Sequence[str] = None,
+               drop_counts: Dict[str, int] = None):
   """Removes missing values and duplicate rows from a DataFrame.
 
+  Rows with a missing value in any column are dropped first. Then every row
+  whose subset columns repeat those of an earlier row is dropped, comparing
+  precomputed 64-bit hashes of the rows rather than their values. Both rules
+  are found as masks, so only the cleaned rows are ever copied.
+
   Args:
     dataframe (pd.DataFrame): The DataFrame to clean
+    subset (Sequence[str]): The columns that identify duplicate rows. Defaults
+      to every column
+    drop_counts (Dict[str, int]): If given, the number of rows dropped by each
+      rule in DROP_RULES is added to it
 
   Returns:
     cleaned_dataframe (pd.DataFrame): The cleaned DataFrame
   """
 
-  return dataframe.dropna().drop_duplicates()
+  missing, duplicate, _ = _drop_masks(dataframe, subset)
+  _count_drops(drop_counts, missing, duplicate)
+  return dataframe[~(missing | duplicate)]
+
+
+def clean_chunks(chunks: Iterable[pd.DataFrame],
+                 subset: Sequence[str] = None,
+                 max_seen: int = MAX_SEEN_ROWS,
+                 drop_counts: Dict[str, int] = None):
+  """Cleans a stream of DataFrames like clean_data would clean them combined.
+
+  Only the hashes of the most recent rows kept are remembered, so memory use
+  is bounded by max_seen rather than by the length of the stream. Once more
+  than max_seen hashes are remembered, the oldest chunk's hashes are
+  forgotten, so a row is only guaranteed to be dropped if it repeats one of
+  the last max_seen rows kept. With max_seen at least the number of distinct
+  rows, the cleaned chunks have exactly the rows of clean_data on their
+  concatenation.
+
+  Args:
+    chunks (Iterable[pd.DataFrame]): The DataFrames to clean, in order
+    subset (Sequence[str]): The columns that identify duplicate rows. Defaults
+      to every column
+    max_seen (int): The number of row hashes to remember
+    drop_counts (Dict[str, int]): If given, the number of rows dropped by each
+      rule in DROP_RULES is added to it as each chunk is cleaned
+
+  Yields:
+    cleaned_chunk (pd.DataFrame): Each cleaned DataFrame, in order
+  """
+
+  seen = set()
+  seen_chunks = collections.deque()
+  category_hashes = {}
+
+  for chunk in chunks:
+    missing, duplicate, hashes = _drop_masks(chunk, subset, category_hashes)
+    # Rows that repeat rows kept from earlier chunks are duplicates too
+    candidates = np.flatnonzero(~(missing | duplicate))
+    duplicate[candidates] = np.fromiter(
+        map(seen.__contains__, hashes[candidates].tolist()),
+        dtype=bool,
+        count=len(candidates))
+    _count_drops(drop_counts, missing, duplicate)
+
+    keep = ~(missing | duplicate)
+    seen_chunks.append(hashes[keep].tolist())
+    seen.update(seen_chunks[-1])
+    while len(seen) > max_seen:
+      seen.difference_update(seen_chunks.popleft())
+
+    yield chunk[keep]
+
+
+def label_calories(amounts: Iterable[float], low_calorie_threshold: float,
+                   high_calorie_threshold: float):
+  """Labels calorie amounts as low, average, or high calorie.
+
+  An amount is low calorie if it's less than low_calorie_threshold, high
+  calorie if it's greater than high_calorie_threshold, and average calorie
+  otherwise. If an amount satisfies both conditions (which can only happen if
+  low_calorie_threshold > high_calorie_threshold), it is low calorie.
+
+  Args:
+    amounts (Iterable[float]): The calorie amounts to label
+    low_calorie_threshold (float): The boundary between low and average-calorie
+      dishes
+    high_calorie_threshold (float): The boundary between average and
+      high-calorie dishes
+
+  Returns:
+    calorie_labels (np.ndarray): An (n, 3) uint8 array with one-hot-encoded
+    labels in the order low, average, high calorie
+    calorie_classes (np.ndarray): An (n,) int64 array with the index of the one
+    in each row of calorie_labels (0 = low, 1 = average, 2 = high calorie)
+  """
+
+  amounts = np.asarray(amounts, dtype=np.float64)
+  calorie_classes = np.select(
+      [amounts < low_calorie_threshold, amounts > high_calorie_threshold],
+      [0, 2],
+      default=1,
+  ).astype(np.int64)
+  calorie_labels = np.eye(NUM_CALORIE_CLASSES, dtype=np.uint8)[calorie_classes]
+
+  return calorie_labels, calorie_classes
+
+
+def class_balance(calorie_labels: np.ndarray):
+  """Computes the fraction of one-hot-encoded labels in each calorie class.
+
+  Args:
+    calorie_labels (np.ndarray): An (n, 3) one-hot-encoded array as returned by
+      label_calories
+
+  Returns:
+    balance (np.ndarray): A (3,) float64 array with the fraction of labels that
+    are low, average, and high calorie. All zeroes if calorie_labels is empty.
+  """
+
+  counts = calorie_labels.sum(axis=0, dtype=np.int64)
+  total = counts.sum()
+  if total == 0:
+    return np.zeros(NUM_CALORIE_CLASSES)
+
+  return counts / total
 
 
 def add_calorie_labels(calorie_data: pd.DataFrame, low_calorie_threshold: float,
@@ -84,6 +489,9 @@ def add_calorie_labels(calorie_data: pd.DataFrame, low_calorie_threshold: float,
   high_calorie_threshold. The one-hot-encoding is added as an additional
   column titled 'calorie_label' to calorie_data and returned.
 
+  Each label is stored as a Python list. Prefer label_calories, which returns
+  the labels as a single array, for anything but small DataFrames.
+
   Args:
     calorie_data (pd.DataFrame): The calorie DataFrame to label
     low_calorie_threshold (float): The boundary between low and average-calorie
@@ -95,17 +503,95 @@ def add_calorie_labels(calorie_data: pd.DataFrame, low_calorie_threshold: float,
     labeled_calorie_data (pd.DataFrame): The labeled (one-hot-encoded) DataFrame
   """
 
-  def label_row(calorie_data_row):
-    if calorie_data_row['amount'] < low_calorie_threshold:
-      return [1, 0, 0]  # low calorie
-    if calorie_data_row['amount'] > high_calorie_threshold:
-      return [0, 0, 1]  # high calorie
+  calorie_labels, _ = label_calories(calorie_data['amount'],
+                                     low_calorie_threshold,
+                                     high_calorie_threshold)
+  calorie_data['calorie_label'] = pd.Series(
+      calorie_labels.tolist(), index=calorie_data.index, dtype=object)
 
-    return [0, 1, 0]  # avg calorie
+  return calorie_data
 
-  calorie_data['calorie_label'] = calorie_data.apply(label_row, axis=1)
 
-  return calorie_data
+def split_indices(num_examples: int, fractions: Sequence[float],
+                  seed: int = None):
+  """Randomly splits the indices [0, num_examples) into disjoint subsets.
+
+  Args:
+    num_examples (int): The number of indices to split
+    fractions (Sequence[float]): The fraction of indices in each subset. Should
+      sum to 1.0. Any indices left over from rounding go in the last subset.
+    seed (int): The random seed to shuffle indices with
+
+  Returns:
+    splits (List[np.ndarray]): One shuffled int64 array of indices per fraction
+  """
+
+  shuffled = np.random.default_rng(seed).permutation(num_examples)
+  boundaries = np.cumsum(
+      [int(frac * num_examples) for frac in fractions[:-1]], dtype=np.int64)
+
+  return np.split(shuffled, boundaries)
+
+
+def _normalize_chunk(strings: List[str], table: Dict[int, Any]):
+  """Lowercases and translates a chunk of strings as one joined string."""
+
+  if not strings:
+    return []
+
+  joined = NORMALIZE_SEPARATOR.join(strings)
+  if (ord(NORMALIZE_SEPARATOR) in table or
+      joined.count(NORMALIZE_SEPARATOR) != len(strings) - 1):
+    # The separator can't be told apart from the strings' own characters
+    return [string.lower().translate(table) for string in strings]
+
+  return joined.lower().translate(table).split(NORMALIZE_SEPARATOR)
+
+
+def normalize_strings(strings: Iterable[str],
+                      filters: str,
+                      num_workers: int = 1):
+  """Lowercases strings and removes filtered characters from them.
+
+  The result is exactly ''.join(c for c in s.lower() if c not in filters) for
+  each string s, but rather than lowercasing and filtering each string on its
+  own, each chunk of NORMALIZE_CHUNK_SIZE strings is joined, lowercased and
+  filtered with a single translation table in one call each, and split again.
+  If strings is a categorical pd.Series, only its categories are normalized
+  (see map_values).
+
+  Args:
+    strings (Iterable[str]): The strings to normalize
+    filters (str): The characters to remove
+    num_workers (int): The number of threads to normalize chunks on. Each chunk
+      holds the GIL while it's normalized, so this only helps when other
+      threads are waiting on I/O
+
+  Returns:
+    normalized_strings (List[str]): The normalized strings, in order
+  """
+
+  if isinstance(getattr(strings, 'dtype', None), pd.CategoricalDtype):
+    return map_values(
+        strings, lambda values: np.array(
+            normalize_strings(values, filters, num_workers), dtype=object)
+    ).tolist()
+
+  table = str.maketrans('', '', filters)
+  strings = list(strings)
+  chunks = [
+      strings[start:start + NORMALIZE_CHUNK_SIZE]
+      for start in range(0, len(strings), NORMALIZE_CHUNK_SIZE)
+  ]
+
+  if num_workers > 1 and len(chunks) > 1:
+    with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+      normalized_chunks = list(
+          executor.map(_normalize_chunk, chunks, itertools.repeat(table)))
+  else:
+    normalized_chunks = [_normalize_chunk(chunk, table) for chunk in chunks]
+
+  return list(itertools.chain.from_iterable(normalized_chunks))
 
 
 def num_unique_words(strings: Iterable[str]):
@@ -144,6 +630,61 @@ def max_sequence_length(sequences: Iterable[Sized]):
   return max_len
 
 
+def percentile_length_from_counts(length_counts: np.ndarray,
+                                  coverage: float = 1.0):
+  """Computes the shortest length that covers a fraction of sequences.
+
+  Args:
+    length_counts (np.ndarray): The number of sequences of each length, such
+      as np.bincount of their lengths
+    coverage (float): The fraction of sequences, in (0, 1], whose lengths must
+      be at most the returned length
+
+  Returns:
+    length (int): The smallest length that at least coverage of the sequences
+    fit in (0 if there are no sequences)
+
+  Raises:
+    ValueError: If coverage isn't in (0, 1]
+  """
+
+  if not 0 < coverage <= 1:
+    raise ValueError(f'Coverage must be in (0, 1], got {coverage}')
+
+  length_counts = np.asarray(length_counts, dtype=np.int64)
+  if not length_counts.sum():
+    return 0
+
+  # Round before comparing, so floating-point error in coverage * n never asks
+  # for one more sequence than intended
+  needed = np.ceil(np.round(coverage * length_counts.sum(), 6))
+  return int(np.searchsorted(np.cumsum(length_counts), needed))
+
+
+def percentile_sequence_length(lengths: Iterable[int], coverage: float = 1.0):
+  """Computes the shortest length that covers a fraction of sequences.
+
+  A coverage of 1.0 gives the longest length, like max_sequence_length. Lower
+  coverages ignore the longest (usually rare) sequences, which would otherwise
+  set the length of every padded sequence.
+
+  Args:
+    lengths (Iterable[int]): The length of each sequence
+    coverage (float): The fraction of sequences, in (0, 1], whose lengths must
+      be at most the returned length
+
+  Returns:
+    length (int): The smallest length that at least coverage of the sequences
+    fit in (0 if there are no sequences)
+
+  Raises:
+    ValueError: If coverage isn't in (0, 1]
+  """
+
+  return percentile_length_from_counts(
+      np.bincount(np.fromiter(lengths, dtype=np.int64)), coverage)
+
+
 def pad_list(lst: List[Any], desired_length: int, padding_value: Any):
   """Pads a list with a given value up to a certain length.
 
@@ -165,3 +706,66 @@ def pad_list(lst: List[Any], desired_length: int, padding_value: Any):
     lst.append(padding_value)
 
   return lst
+
+
+def encode_corpus(corpus: Iterable[str],
+                  vocab: Dict[str, int],
+                  max_len: int,
+                  oov_value: int = 0,
+                  padding_value: int = 0,
+                  out: np.ndarray = None):
+  """Encodes a corpus of strings into a matrix of token ids.
+
+  Each string is split into space-separated tokens, and each token is replaced
+  with its id in vocab (or oov_value if it's not in vocab). Row i of the
+  resulting matrix holds the ids of string i, truncated or padded with
+  padding_value to exactly max_len ids.
+
+  Rather than building a list of ids for each string, each chunk of
+  ENCODE_CHUNK_SIZE strings is split into one flat array of tokens, looked up
+  in vocab all at once, and scattered into the matrix.
+
+  Args:
+    corpus (Iterable[str]): The strings to encode
+    vocab (Dict[str, int]): A mapping from tokens to their ids
+    max_len (int): The number of ids in each row of the matrix
+    oov_value (int): The id of tokens that aren't in vocab
+    padding_value (int): The id to pad rows with
+    out (np.ndarray): An optional (n, max_len) array to write ids into, such as
+      a memory-mapped .npy file. If None, a new int32 array is allocated.
+
+  Returns:
+    ids (np.ndarray): An (n, max_len) matrix of token ids (out, if given)
+    lengths (np.ndarray): An (n,) int32 array with the number of (unpadded)
+    ids in each row of ids
+  """
+
+  corpus = list(corpus)
+  if out is None:
+    out = np.empty((len(corpus), max_len), dtype=np.int32)
+  out[:] = padding_value
+  lengths = np.empty(len(corpus), dtype=np.int32)
+
+  for start in range(0, len(corpus), ENCODE_CHUNK_SIZE):
+    chunk = corpus[start:start + ENCODE_CHUNK_SIZE]
+    chunk_lengths = np.fromiter((len(entry.split()) for entry in chunk),
+                                dtype=np.int64,
+                                count=len(chunk))
+    # Joining on spaces keeps every token's boundaries, so splitting the joined
+    # string yields every token of the chunk in order
+    tokens = ' '.join(chunk).split()
+
+    token_ids = np.fromiter(map(vocab.get, tokens, itertools.repeat(oov_value)),
+                            dtype=np.int64,
+                            count=len(tokens))
+
+    # Find the row and column of each token in the matrix
+    rows = np.repeat(np.arange(len(chunk)), chunk_lengths)
+    row_starts = np.cumsum(chunk_lengths) - chunk_lengths
+    cols = np.arange(len(tokens)) - np.repeat(row_starts, chunk_lengths)
+    in_bounds = cols < max_len
+
+    out[start + rows[in_bounds], cols[in_bounds]] = token_ids[in_bounds]
+    lengths[start:start + len(chunk)] = np.minimum(chunk_lengths, max_len)
+
+  return out, lengths
@@ -0,0 +1,208 @@
+# Lint as: python3
+"""This module runs the ML model's forward pass in pure NumPy.
+
+The model is tiny (an Embedding, pooled or flattened, followed by a few Dense
+layers), so importing TensorFlow and loading a SavedModel just to classify some
+dish names costs far more time and memory than the prediction itself. Instead,
+train.py exports the model's weights to a compact .npz file with
+export_keras_model, and NumpyModel reproduces the model's forward pass from them
+without importing TensorFlow.
+"""
+
+import json
+
+import numpy as np
+
+from amaranth.ml import tokenizer as tok
+
+# Version of the saved weights format. Bump this whenever the format changes.
+NUMPY_MODEL_FORMAT_VERSION = 1
+
+
+def _sigmoid(x):
+  # Equivalent to 1 / (1 + exp(-x)), but never overflows
+  return 0.5 * (1 + np.tanh(0.5 * x))
+
+
+def _softmax(x):
+  exp = np.exp(x - x.max(axis=-1, keepdims=True))
+  return exp / exp.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': _sigmoid,
+    'softmax': _softmax,
+    'tanh': np.tanh,
+}
+
+# Layer types of supported Keras layers, by class name
+KERAS_LAYER_TYPES = {
+    'Embedding': 'embedding',
+    'Flatten': 'flatten',
+    'MaskedAveragePooling1D': 'average_pooling',
+    'Dense': 'dense',
+}
+
+
+class NumpyModel:
+  """A NumPy implementation of a sequential Keras model's forward pass.
+
+  Supported layers are Embedding (optionally with mask_zero), Flatten,
+  MaskedAveragePooling1D (see layers), and Dense (with any activation in
+  ACTIVATIONS). Embeddings may be stored as float16, or as uint8 with the
+  'scale' and 'min' of their affine quantization in their layer's
+  'quantization' config (see quantize.quantize_embedding).
+
+  Attributes:
+    layers (List[dict]): Each layer's config: its 'type' ('embedding',
+      'flatten', 'average_pooling', or 'dense'), 'name', 'mask_zero' (for
+      embedding layers), and 'activation' (for dense layers)
+    weights (List[List[np.ndarray]]): Each layer's weights, in the same order
+      as Keras' layer.get_weights()
+  """
+
+  def __init__(self, layers, weights):
+    self.layers = layers
+    self.weights = weights
+
+  def predict_on_batch(self, inputs: np.ndarray):
+    """Runs the forward pass on a batch of inputs.
+
+    Args:
+      inputs (np.ndarray): An (n, max_len) matrix of token ids. Models without
+        a flatten layer accept any max_len
+
+    Returns:
+      outputs (np.ndarray): The model's (n, num_outputs) float32 outputs
+    """
+
+    outputs = np.asarray(inputs)
+    mask = None
+    for layer, weights in zip(self.layers, self.weights):
+      if layer['type'] == 'embedding':
+        if layer.get('mask_zero'):
+          mask = outputs != tok.PADDING_ID
+        outputs = weights[0][outputs]
+        quantization = layer.get('quantization')
+        if quantization:
+          outputs = (outputs.astype(np.float32) * quantization['scale'] +
+                     quantization['min'])
+      elif layer['type'] == 'flatten':
+        outputs = outputs.reshape(len(outputs), -1)
+      elif layer['type'] == 'average_pooling':
+        if mask is None:
+          outputs = outputs.mean(axis=1)
+        else:
+          # Like layers.MaskedAveragePooling1D, fully masked rows average to 0
+          count = np.maximum(mask.sum(axis=1, keepdims=True), 1)
+          outputs = np.einsum('nld,nl->nd', outputs,
+                              mask.astype(outputs.dtype)) / count
+        mask = None
+      elif layer['type'] == 'dense':
+        kernel, bias = weights
+        outputs = ACTIVATIONS[layer['activation']](outputs @ kernel + bias)
+      else:
+        raise ValueError(f'Unsupported layer type {layer["type"]}')
+
+    return outputs.astype(np.float32, copy=False)
+
+  def summary(self):
+    """Prints each layer's type and weight shapes."""
+
+    for layer, weights in zip(self.layers, self.weights):
+      shapes = ', '.join(str(weight.shape) for weight in weights)
+      activation = layer.get('activation')
+      print(f'{layer["name"]} ({layer["type"]}'
+            f'{", " + activation if activation else ""}) {shapes}')
+
+  def save(self, path: str):
+    """Saves this model's layers and weights to a .npz file.
+
+    Args:
+      path (str): The .npz file to save to
+    """
+
+    arrays = {
+        f'layer_{idx}_weight_{weight_idx}': weight
+        for idx, weights in enumerate(self.weights)
+        for weight_idx, weight in enumerate(weights)
+    }
+    config = {'version': NUMPY_MODEL_FORMAT_VERSION, 'layers': self.layers}
+
+    with open(path, 'wb') as file:
+      np.savez(file, config=np.array(json.dumps(config)), **arrays)
+
+  @classmethod
+  def load(cls, path: str):
+    """Loads a model saved by NumpyModel.save.
+
+    Args:
+      path (str): The .npz file to load
+
+    Returns:
+      model (NumpyModel): The loaded model
+
+    Raises:
+      ValueError: If the file's version isn't NUMPY_MODEL_FORMAT_VERSION
+    """
+
+    with np.load(path) as saved:
+      config = json.loads(str(saved['config']))
+      if config.get('version') != NUMPY_MODEL_FORMAT_VERSION:
+        raise ValueError(
+            f'Unsupported model format version {config.get("version")}, '
+            f'expected {NUMPY_MODEL_FORMAT_VERSION}')
+
+      weights = []
+      for idx in range(len(config['layers'])):
+        layer_weights = []
+        while f'layer_{idx}_weight_{len(layer_weights)}' in saved:
+          layer_weights.append(
+              saved[f'layer_{idx}_weight_{len(layer_weights)}'])
+        weights.append(layer_weights)
+
+    return cls(config['layers'], weights)
+
+  @classmethod
+  def from_keras_model(cls, model):
+    """Copies the layers and weights of a sequential Keras model.
+
+    Args:
+      model (keras.Sequential): The Keras model to copy
+
+    Returns:
+      model (NumpyModel): A NumPy model with the same forward pass
+
+    Raises:
+      ValueError: If model has a layer that NumpyModel doesn't support
+    """
+
+    layers = []
+    weights = []
+    for layer in model.layers:
+      layer_type = KERAS_LAYER_TYPES.get(type(layer).__name__)
+      if layer_type is None:
+        raise ValueError(f'Unsupported layer type {type(layer).__name__}')
+
+      layer_config = {'type': layer_type, 'name': layer.name}
+      if layer_type == 'embedding' and layer.get_config().get('mask_zero'):
+        layer_config['mask_zero'] = True
+      if layer_type == 'dense':
+        layer_config['activation'] = layer.get_config()['activation']
+      layers.append(layer_config)
+      weights.append([np.asarray(weight) for weight in layer.get_weights()])
+
+    return cls(layers, weights)
+
+
+def export_keras_model(model, path: str):
+  """Exports a sequential Keras model's weights for use with NumpyModel.
+
+  Args:
+    model (keras.Sequential): The Keras model to export
+    path (str): The .npz file to export to
+  """
+
+  NumpyModel.from_keras_model(model).save(path)
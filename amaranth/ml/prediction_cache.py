@@ -0,0 +1,161 @@
+# Lint as: python3
+"""This module defines an LRU cache of model predictions.
+
+Menus repeat the same dish names constantly, so caching the model's predictions
+lets repeated dish names skip the model entirely. Predictions are keyed on the
+normalized tokens of a dish name (see PredictionCache.key), so dish names that
+only differ in case, punctuation, or spacing share a cache entry.
+
+Predictions (and the tokens they're keyed on) are only valid for the model and
+tokenizer that made them, so saved caches record the id of their model (see
+classifier.model_id), and are discarded when loaded for any other model.
+"""
+
+import collections
+import json
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+# Version of the saved cache format. Bump this whenever the format changes.
+CACHE_FORMAT_VERSION = 2
+# Default maximum number of cached predictions
+MAX_SIZE = 100000
+
+
+class PredictionCache:
+  """A thread-safe, bounded cache of predictions with LRU eviction.
+
+  Attributes:
+    max_size (int): The maximum number of cached predictions. Once full, the
+      least recently used prediction is evicted for each new one.
+    hits (int): The number of lookups that found a cached prediction
+    misses (int): The number of lookups that didn't
+    model_id (str): The id of the model and tokenizer the predictions were
+      made with, if known
+  """
+
+  def __init__(self, max_size: int = MAX_SIZE, model_id: str = None):
+    self.max_size = max_size
+    self.model_id = model_id
+    self.hits = 0
+    self.misses = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(tokens: Iterable[str]):
+    """Computes the cache key of a dish name's normalized tokens.
+
+    Args:
+      tokens (Iterable[str]): The tokens of a normalized dish name
+
+    Returns:
+      key (str): The tokens joined by single spaces
+    """
+
+    return ' '.join(tokens)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key: str):
+    """Looks up a cached prediction, marking it as most recently used.
+
+    Args:
+      key (str): The prediction's cache key
+
+    Returns:
+      prediction (np.ndarray): The cached prediction, or None if it isn't
+      cached
+    """
+
+    with self._lock:
+      prediction = self._entries.get(key)
+      if prediction is None:
+        self.misses += 1
+        return None
+
+      self.hits += 1
+      self._entries.move_to_end(key)
+      return prediction
+
+  def put(self, key: str, prediction: np.ndarray):
+    """Caches a prediction, evicting the least recently used one if full.
+
+    Args:
+      key (str): The prediction's cache key
+      prediction (np.ndarray): The prediction to cache
+    """
+
+    if self.max_size <= 0:
+      return
+
+    with self._lock:
+      self._entries[key] = prediction
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    """Removes every cached prediction and resets the hit/miss counters."""
+
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
+
+  def save(self, path: str):
+    """Saves the cached predictions to a JSON file.
+
+    Args:
+      path (str): The file to save the cache to
+    """
+
+    with self._lock:
+      entries = [[key, prediction.tolist()]
+                 for key, prediction in self._entries.items()]
+
+    # Write to a temporary file first so a crash never corrupts the cache
+    saved = {
+        'version': CACHE_FORMAT_VERSION,
+        'model_id': self.model_id,
+        'entries': entries
+    }
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as file:
+      json.dump(saved, file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+  @classmethod
+  def load(cls, path: str, max_size: int = MAX_SIZE, model_id: str = None):
+    """Loads cached predictions saved by PredictionCache.save.
+
+    Missing files, files saved in a different format version, and files saved
+    for a different model are treated as empty caches.
+
+    Args:
+      path (str): The file to load the cache from
+      max_size (int): The maximum number of cached predictions
+      model_id (str): The id of the model the predictions will be used for
+
+    Returns:
+      cache (PredictionCache): The loaded cache
+    """
+
+    cache = cls(max_size, model_id)
+    if not os.path.exists(path):
+      return cache
+
+    with open(path) as file:
+      saved = json.load(file)
+    if (saved.get('version') != CACHE_FORMAT_VERSION or
+        saved.get('model_id') != model_id):
+      return cache
+
+    for key, prediction in saved['entries']:
+      cache.put(key, np.asarray(prediction, dtype=np.float32))
+
+    return cache
@@ -0,0 +1,203 @@
+# Lint as: python3
+"""This module turns the FDC dataset into the ML model's inputs and labels.
+
+Preprocessing is split into stages, each of which is cached on disk (see
+stage_cache) and keyed on exactly what it depends on:
+  calorie_data: The FDC files' contents (see ingest.load_calorie_data)
+  calorie_classes: calorie_data and the calorie thresholds
+  tokenizer: calorie_data, the dish name filters, the minimum token count, the
+    fraction of dish names the encoded length must cover, and how tokens are
+    counted or hashed
+  inputs, input_lengths: The tokenizer (and so calorie_data)
+
+So changing only the model or how it's trained reuses every stage, and changing
+the calorie thresholds only relabels the dishes. Stages that are cached aren't
+even loaded unless a later stage needs to be recomputed from them.
+"""
+
+import collections
+import json
+
+import numpy as np
+
+from amaranth.ml import corpus_stats
+from amaranth.ml import ingest
+from amaranth.ml import instrumentation
+from amaranth.ml import lib
+from amaranth.ml import stage_cache
+from amaranth.ml import tokenizer as tok
+
+Preprocessed = collections.namedtuple('Preprocessed', [
+    'tokenizer', 'unique_words', 'inputs', 'input_lengths', 'calorie_classes'
+])
+Preprocessed.__doc__ = """The model's inputs and labels.
+
+Attributes:
+  tokenizer (tok.Tokenizer): The tokenizer fit to the dish names
+  unique_words (int): The number of distinct words in the normalized dish names
+    (or, if the vocabulary was counted approximately, in the vocabulary, and if
+    tokens are hashed, the number of distinct n-grams)
+  inputs (np.ndarray): A read-only, memory-mapped (n, max_length) int32 matrix
+    of token ids
+  input_lengths (np.ndarray): A read-only, memory-mapped (n,) int32 array with
+    the number of (unpadded) ids in each row of inputs
+  calorie_classes (np.ndarray): A read-only, memory-mapped (n,) uint8 array of
+    calorie classes, as returned by lib.label_calories
+"""
+
+
+def _save_array(array: np.ndarray, path: str):
+  with open(path, 'wb') as file:
+    np.save(file, array)
+
+
+def _load_array(path: str):
+  return np.load(path, mmap_mode='r')
+
+
+def _save_tokenizer(fitted, path: str):
+  tokenizer, unique_words = fitted
+  with open(path, 'w') as file:
+    json.dump(
+        {
+            'tokenizer': tokenizer.to_json(),
+            'unique_words': unique_words,
+            'length_counts': tokenizer.length_counts.tolist(),
+        }, file)
+
+
+def _load_tokenizer(path: str):
+  with open(path) as file:
+    saved = json.load(file)
+  tokenizer = tok.Tokenizer.from_json(saved['tokenizer'])
+  tokenizer.length_counts = np.array(saved['length_counts'], dtype=np.int64)
+  return tokenizer, saved['unique_words']
+
+
+def preprocess(fdc_data_dir: str,
+               cache_dir: str,
+               low_calorie_threshold: float,
+               high_calorie_threshold: float,
+               filters: str = tok.DEFAULT_FILTERS,
+               min_count: int = 1,
+               length_coverage: float = 1.0,
+               vocab_memory_bytes: int = None,
+               num_hash_buckets: int = None,
+               metrics: instrumentation.RunMetrics = instrumentation.DISABLED):
+  """Computes the model's inputs and labels, reusing cached stages.
+
+  Args:
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    cache_dir (str): The directory to cache each stage's output in
+    low_calorie_threshold (float): The boundary between low and average-calorie
+      dishes
+    high_calorie_threshold (float): The boundary between average and
+      high-calorie dishes
+    filters (str): The characters to remove from dish names
+    min_count (int): The number of times a token needs to appear to be in the
+      tokenizer's vocabulary
+    length_coverage (float): The fraction of dish names that are encoded
+      without truncation (see tok.Tokenizer)
+    vocab_memory_bytes (int): If given, tokens are counted approximately in
+      this many bytes (see corpus_stats.approximate), rather than exactly
+    num_hash_buckets (int): If given, tokens are encoded as character n-grams
+      hashed into this many buckets (see tok.Tokenizer), and there's no
+      vocabulary to count
+    metrics (instrumentation.RunMetrics): Records which stages were cached and
+      the time each one takes
+
+  Returns:
+    preprocessed (Preprocessed): The model's inputs and labels
+  """
+
+  cache = stage_cache.StageCache(cache_dir, metrics)
+  with metrics.stage('hash_files'):
+    calorie_data_key = ingest.calorie_data_key(cache, fdc_data_dir)
+  calorie_classes_key = stage_cache.fingerprint(
+      'calorie_classes', calorie_data_key, low_calorie_threshold,
+      high_calorie_threshold)
+  tokenizer_key = stage_cache.fingerprint('tokenizer', calorie_data_key,
+                                          filters, min_count, length_coverage,
+                                          vocab_memory_bytes,
+                                          num_hash_buckets,
+                                          tok.TOKENIZER_FORMAT_VERSION)
+
+  # Later stages are computed from these, so they're only loaded if needed
+  calorie_data = None
+  corpus = None
+
+  def get_calorie_data():
+    nonlocal calorie_data
+    if calorie_data is None:
+      calorie_data = ingest.load_calorie_data(
+          fdc_data_dir, cache_dir, metrics=metrics)
+      metrics.count('calorie_data_rows', len(calorie_data))
+    return calorie_data
+
+  def get_corpus():
+    nonlocal corpus
+    if corpus is None:
+      with metrics.stage('normalize'):
+        corpus = tok.Tokenizer(filters).normalize_batch(
+            get_calorie_data()['description'])
+    return corpus
+
+  def label():
+    _, classes = lib.label_calories(get_calorie_data()['amount'],
+                                    low_calorie_threshold,
+                                    high_calorie_threshold)
+    return classes.astype(np.uint8)
+
+  def fit_tokenizer():
+    tokenizer = tok.Tokenizer(
+        filters=filters,
+        min_count=min_count,
+        length_coverage=length_coverage,
+        num_buckets=num_hash_buckets)
+    # One pass over the corpus gives both the vocabulary and its size
+    with metrics.stage('corpus_stats'):
+      if num_hash_buckets is not None:
+        stats = corpus_stats.compute(tokenizer.subword_batch(get_corpus()))
+      elif vocab_memory_bytes is None:
+        stats = corpus_stats.compute(get_corpus())
+      else:
+        stats = corpus_stats.approximate(get_corpus(), min_count,
+                                         vocab_memory_bytes)
+    tokenizer.fit_stats(stats)
+    return tokenizer, stats.unique_words
+
+  cache.memoize('calorie_classes', calorie_classes_key, '.npy', label,
+                _save_array, _load_array)
+  tokenizer, unique_words = cache.memoize('tokenizer', tokenizer_key, '.json',
+                                          fit_tokenizer, _save_tokenizer,
+                                          _load_tokenizer)
+
+  if not (cache.has('inputs', tokenizer_key, '.npy') and
+          cache.has('input_lengths', tokenizer_key, '.npy')):
+    metrics.count('inputs_cache_hit', False)
+    # Encode straight into a memory-mapped file, so the matrix never has to be
+    # held in memory
+    with metrics.stage('encode'), \
+        cache.writing('inputs', tokenizer_key, '.npy') as inputs_path, \
+        cache.writing('input_lengths', tokenizer_key, '.npy') as lengths_path:
+      inputs = np.lib.format.open_memmap(
+          inputs_path,
+          mode='w+',
+          dtype=np.int32,
+          shape=(len(get_corpus()), tokenizer.max_length))
+      _, input_lengths = tokenizer.encode_batch(
+          get_corpus(), normalize=False, out=inputs)
+      inputs.flush()
+      del inputs
+      _save_array(input_lengths, lengths_path)
+  else:
+    metrics.count('inputs_cache_hit', True)
+
+  return Preprocessed(
+      tokenizer=tokenizer,
+      unique_words=unique_words,
+      inputs=_load_array(cache.path('inputs', tokenizer_key, '.npy')),
+      input_lengths=_load_array(
+          cache.path('input_lengths', tokenizer_key, '.npy')),
+      calorie_classes=_load_array(
+          cache.path('calorie_classes', calorie_classes_key, '.npy')))
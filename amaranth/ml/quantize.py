@@ -0,0 +1,457 @@
+# Lint as: python3
+"""This module produces quantized variants of the ML model and compares them.
+
+Variants:
+  TFLite dynamic-range: Weights stored as int8, activations computed in float
+  TFLite full-int8: Weights and activations in int8, calibrated on a sample of
+    training inputs
+  NumPy float16/uint8 embedding: The NumPy export (see numpy_model) with its
+    embedding, by far the model's largest weight, stored as float16 or uint8
+
+Each variant's categorical accuracy, confusion matrix, file size, and CPU
+latency are reported next to the float model's, so the smallest artifact that
+stays within the accuracy budget can be picked.
+
+The Chrome extension's tfjs model can be quantized the same way by running this
+module as a script on its model directory. Only uint8 and uint16 are supported
+there, since the extension's bundled tfjs can't decode float16 weights.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import time
+
+import numpy as np
+
+from amaranth.ml import numpy_model
+
+# Number of training inputs to calibrate full-int8 quantization with
+NUM_CALIBRATION_EXAMPLES = 1000
+# Number of dish names to classify at a time when evaluating a model
+EVALUATION_BATCH_SIZE = 8192
+# Number of timed runs to take the median latency of
+NUM_LATENCY_RUNS = 50
+# Number of dish names to measure batched latency with
+LATENCY_BATCH_SIZE = 256
+# Dtypes an embedding can be quantized to
+EMBEDDING_DTYPES = ('float16', 'uint8')
+# Dtypes tfjs can dequantize weights from
+TFJS_DTYPES = {'uint8': np.uint8, 'uint16': np.uint16}
+# Names of the tfjs weights to quantize (as fnmatch patterns)
+TFJS_WEIGHT_PATTERNS = ('embedding*/embeddings',)
+# Bytes taken by each unquantized tfjs weight dtype
+TFJS_DTYPE_SIZES = {'float32': 4, 'int32': 4, 'bool': 1}
+
+
+def quantize_affine(weights: np.ndarray, dtype=np.uint8):
+  """Quantizes weights to unsigned integers with an affine mapping.
+
+  This is the scheme tfjs uses: weights are dequantized as
+  quantized * scale + min, so the error of each weight is at most scale / 2.
+
+  Args:
+    weights (np.ndarray): The float weights to quantize
+    dtype (np.dtype): The unsigned integer dtype to quantize to
+
+  Returns:
+    quantized (np.ndarray): The quantized weights
+    scale (float): The difference between consecutive quantized values
+    min (float): The value that 0 is dequantized to
+  """
+
+  min_value = float(weights.min()) if weights.size else 0.0
+  max_value = float(weights.max()) if weights.size else 0.0
+  scale = (max_value - min_value) / np.iinfo(dtype).max
+  if scale == 0:
+    # Every weight is the same, so any scale represents them exactly
+    scale = 1.0
+
+  quantized = np.round((weights - min_value) / scale)
+  return quantized.astype(dtype), scale, min_value
+
+
+def quantize_embedding(model: numpy_model.NumpyModel, dtype: str):
+  """Quantizes the embedding of a NumpyModel.
+
+  Args:
+    model (numpy_model.NumpyModel): The float model
+    dtype (str): 'float16' or 'uint8'
+
+  Returns:
+    model (numpy_model.NumpyModel): A copy of model whose embedding is stored
+    as dtype
+  """
+
+  if dtype not in EMBEDDING_DTYPES:
+    raise ValueError(f'Unsupported embedding dtype {dtype}, expected one of '
+                     f'{EMBEDDING_DTYPES}')
+
+  layers = []
+  weights = []
+  for layer, layer_weights in zip(model.layers, model.weights):
+    layer = dict(layer)
+    if layer['type'] == 'embedding':
+      if dtype == 'float16':
+        layer_weights = [layer_weights[0].astype(np.float16)]
+      else:
+        quantized, scale, min_value = quantize_affine(layer_weights[0])
+        layer_weights = [quantized]
+        layer['quantization'] = {'scale': scale, 'min': min_value}
+    layers.append(layer)
+    weights.append(layer_weights)
+
+  return numpy_model.NumpyModel(layers, weights)
+
+
+def convert_to_tflite(model, calibration_inputs: np.ndarray = None):
+  """Converts a Keras model to a quantized TFLite model.
+
+  Args:
+    model (keras.Model): The float model
+    calibration_inputs (np.ndarray): Sample inputs to calibrate activation
+      ranges with. If given, the model is fully quantized to int8. Otherwise
+      only its weights are (dynamic-range quantization).
+
+  Returns:
+    model_content (bytes): The serialized TFLite model
+  """
+
+  import tensorflow as tf  # pylint: disable=import-outside-toplevel
+
+  converter = tf.lite.TFLiteConverter.from_keras_model(model)
+  converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+  if calibration_inputs is not None:
+    input_dtype = tf.as_dtype(model.inputs[0].dtype).as_numpy_dtype
+
+    def representative_dataset():
+      for example in calibration_inputs:
+        yield [np.asarray(example[np.newaxis], dtype=input_dtype)]
+
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+  return converter.convert()
+
+
+class TfliteModel:
+  """Runs a TFLite model with the same interface as a Keras model.
+
+  Attributes:
+    interpreter (tf.lite.Interpreter): The interpreter running the model
+  """
+
+  def __init__(self, model_content: bytes):
+    import tensorflow as tf  # pylint: disable=import-outside-toplevel
+
+    self.interpreter = tf.lite.Interpreter(model_content=model_content)
+    self._input = self.interpreter.get_input_details()[0]
+    self._output = self.interpreter.get_output_details()[0]
+    self._batch_size = None
+
+  def predict_on_batch(self, inputs: np.ndarray):
+    """Runs the model on a batch of inputs.
+
+    Args:
+      inputs (np.ndarray): An (n, max_len) matrix of token ids
+
+    Returns:
+      outputs (np.ndarray): The model's (n, num_outputs) outputs
+    """
+
+    if len(inputs) != self._batch_size:
+      self.interpreter.resize_tensor_input(self._input['index'],
+                                           [len(inputs), inputs.shape[1]])
+      self.interpreter.allocate_tensors()
+      self._batch_size = len(inputs)
+
+    self.interpreter.set_tensor(self._input['index'],
+                                np.asarray(inputs, dtype=self._input['dtype']))
+    self.interpreter.invoke()
+    return self.interpreter.get_tensor(self._output['index'])
+
+  def summary(self):
+    for tensor in self.interpreter.get_tensor_details():
+      print(f'{tensor["name"]} {tensor["dtype"].__name__} {tensor["shape"]}')
+
+
+def evaluate_model(model,
+                   inputs: np.ndarray,
+                   calorie_classes: np.ndarray,
+                   indices: np.ndarray = None,
+                   batch_size: int = EVALUATION_BATCH_SIZE):
+  """Computes a model's categorical accuracy and confusion matrix.
+
+  Args:
+    model: The model to evaluate. Anything with predict_on_batch
+    inputs (np.ndarray): The (n, max_len) matrix of token ids (can be
+      memory-mapped)
+    calorie_classes (np.ndarray): The n calorie classes
+    indices (np.ndarray): The examples to evaluate on. Defaults to all of them
+    batch_size (int): The number of examples to classify at a time
+
+  Returns:
+    accuracy (float): The fraction of examples classified correctly
+    confusion (np.ndarray): The confusion matrix, with actual classes as rows
+    and predicted classes as columns
+  """
+
+  if indices is None:
+    indices = np.arange(len(inputs))
+  # Sorted indices read memory-mapped inputs sequentially
+  indices = np.sort(indices)
+
+  num_classes = None
+  confusion = 0
+  for start in range(0, len(indices), batch_size):
+    batch_indices = indices[start:start + batch_size]
+    outputs = np.asarray(model.predict_on_batch(inputs[batch_indices]))
+    num_classes = outputs.shape[-1]
+    confusion = confusion + np.bincount(
+        calorie_classes[batch_indices].astype(np.int64) * num_classes +
+        outputs.argmax(axis=-1),
+        minlength=num_classes**2).reshape(num_classes, num_classes)
+
+  if num_classes is None:
+    return 0.0, np.zeros((0, 0), dtype=np.int64)
+
+  return float(np.trace(confusion) / confusion.sum()), confusion
+
+
+def measure_latency(model, inputs: np.ndarray,
+                    num_runs: int = NUM_LATENCY_RUNS):
+  """Measures the median time a model takes to classify a batch of inputs.
+
+  Args:
+    model: The model to time. Anything with predict_on_batch
+    inputs (np.ndarray): The batch of inputs to classify
+    num_runs (int): The number of timed runs to take the median of
+
+  Returns:
+    latency_ms (float): The median latency, in milliseconds
+  """
+
+  inputs = np.ascontiguousarray(inputs)
+  model.predict_on_batch(inputs)  # Warm up
+
+  latencies_ms = []
+  for _ in range(num_runs):
+    start_time = time.perf_counter()
+    model.predict_on_batch(inputs)
+    latencies_ms.append((time.perf_counter() - start_time) * 1000)
+
+  return float(np.median(latencies_ms))
+
+
+def compare_models(models,
+                   inputs: np.ndarray,
+                   calorie_classes: np.ndarray,
+                   indices: np.ndarray = None):
+  """Reports the accuracy, size, and latency of each variant of a model.
+
+  Args:
+    models (List[Tuple[str, Any, str]]): Each variant's name, model, and saved
+      file. The first is the baseline the others are compared against
+    inputs (np.ndarray): The (n, max_len) matrix of token ids
+    calorie_classes (np.ndarray): The n calorie classes
+    indices (np.ndarray): The examples to evaluate on. Defaults to all of them
+
+  Returns:
+    report (List[dict]): Each variant's name, path, size_bytes, accuracy,
+    accuracy_delta from the baseline, confusion_matrix, latency_ms for one
+    example, and batch_latency_ms for LATENCY_BATCH_SIZE examples
+  """
+
+  if indices is None:
+    indices = np.arange(len(inputs))
+  latency_inputs = inputs[np.sort(indices[:LATENCY_BATCH_SIZE])]
+
+  report = []
+  for name, model, path in models:
+    accuracy, confusion = evaluate_model(model, inputs, calorie_classes,
+                                         indices)
+    report.append({
+        'name': name,
+        'path': path,
+        'size_bytes': os.path.getsize(path),
+        'accuracy': accuracy,
+        'accuracy_delta': accuracy - (report[0]['accuracy']
+                                      if report else accuracy),
+        'confusion_matrix': confusion.tolist(),
+        'latency_ms': measure_latency(model, latency_inputs[:1]),
+        'batch_latency_ms': measure_latency(model, latency_inputs),
+    })
+
+  return report
+
+
+def format_report(report):
+  """Formats a report from compare_models as a human-readable table."""
+
+  lines = [
+      f'{"Model":<28}{"Size (KB)":>12}{"Accuracy":>10}{"Delta":>9}'
+      f'{"1 (ms)":>9}{f"{LATENCY_BATCH_SIZE} (ms)":>10}'
+  ]
+  for variant in report:
+    lines.append(f'{variant["name"]:<28}{variant["size_bytes"] / 1024:>12.1f}'
+                 f'{variant["accuracy"]:>10.4f}'
+                 f'{variant["accuracy_delta"]:>+9.4f}'
+                 f'{variant["latency_ms"]:>9.3f}'
+                 f'{variant["batch_latency_ms"]:>10.3f}')
+
+  return '\n'.join(lines)
+
+
+def export_quantized_models(model,
+                            output_dir: str,
+                            inputs: np.ndarray,
+                            calorie_classes: np.ndarray,
+                            calibration_indices: np.ndarray,
+                            test_indices: np.ndarray):
+  """Saves every quantized variant of a model and reports how they compare.
+
+  The report is also saved to quantization_report.json in output_dir.
+
+  Args:
+    model (keras.Model): The trained float model
+    output_dir (str): The directory to save the variants to
+    inputs (np.ndarray): The (n, max_len) matrix of token ids
+    calorie_classes (np.ndarray): The n calorie classes
+    calibration_indices (np.ndarray): The (training) examples to calibrate
+      full-int8 quantization with. At most NUM_CALIBRATION_EXAMPLES are used
+    test_indices (np.ndarray): The examples to evaluate the variants on
+
+  Returns:
+    report (List[dict]): The report from compare_models
+  """
+
+  os.makedirs(output_dir, exist_ok=True)
+  calibration_inputs = inputs[np.sort(
+      np.random.default_rng(0).permutation(calibration_indices)
+      [:NUM_CALIBRATION_EXAMPLES])]
+
+  float_model = numpy_model.NumpyModel.from_keras_model(model)
+  models = [('float32', float_model, os.path.join(output_dir, 'model.npz'))]
+  for dtype in EMBEDDING_DTYPES:
+    models.append(
+        (f'numpy_{dtype}_embedding', quantize_embedding(float_model, dtype),
+         os.path.join(output_dir, f'model_{dtype}_embedding.npz')))
+  for _, variant, path in models:
+    variant.save(path)
+
+  for name, tflite_inputs in (('dynamic_range', None),
+                              ('int8', calibration_inputs)):
+    path = os.path.join(output_dir, f'model_{name}.tflite')
+    model_content = convert_to_tflite(model, tflite_inputs)
+    with open(path, 'wb') as file:
+      file.write(model_content)
+    models.append((f'tflite_{name}', TfliteModel(model_content), path))
+
+  report = compare_models(models, inputs, calorie_classes, test_indices)
+  with open(os.path.join(output_dir, 'quantization_report.json'), 'w') as file:
+    json.dump(report, file, indent=2)
+
+  return report
+
+
+def quantize_tfjs_model(model_dir: str,
+                        output_dir: str,
+                        dtype: str = 'uint8',
+                        weight_patterns=TFJS_WEIGHT_PATTERNS):
+  """Quantizes weights of a tfjs layers model, such as its embedding.
+
+  Args:
+    model_dir (str): The directory of the float tfjs model (model.json and its
+      weight shards)
+    output_dir (str): The directory to save the quantized model to
+    dtype (str): The dtype to quantize to, 'uint8' or 'uint16'
+    weight_patterns (Iterable[str]): fnmatch patterns of the names of the
+      weights to quantize
+
+  Returns:
+    sizes (Tuple[int, int]): The total size in bytes of the float and quantized
+    weights
+  """
+
+  if dtype not in TFJS_DTYPES:
+    raise ValueError(f'Unsupported tfjs dtype {dtype}, expected one of '
+                     f'{tuple(TFJS_DTYPES)}')
+
+  with open(os.path.join(model_dir, 'model.json')) as file:
+    model_json = json.load(file)
+
+  weight_specs = []
+  buffers = []
+  float_size = 0
+  for group in model_json['weightsManifest']:
+    shards = []
+    for path in group['paths']:
+      with open(os.path.join(model_dir, path), 'rb') as file:
+        shards.append(file.read())
+    data = b''.join(shards)
+    float_size += len(data)
+
+    offset = 0
+    for spec in group['weights']:
+      if 'quantization' in spec:
+        raise ValueError(f'Weight {spec["name"]} is already quantized')
+      num_bytes = int(np.prod(spec['shape'])) * TFJS_DTYPE_SIZES[spec['dtype']]
+      weight = data[offset:offset + num_bytes]
+      offset += num_bytes
+
+      spec = dict(spec)
+      if any(fnmatch.fnmatch(spec['name'], pattern)
+             for pattern in weight_patterns):
+        quantized, scale, min_value = quantize_affine(
+            np.frombuffer(weight, dtype='<f4'), TFJS_DTYPES[dtype])
+        weight = quantized.astype(quantized.dtype.newbyteorder('<')).tobytes()
+        spec['quantization'] = {'dtype': dtype, 'scale': scale, 'min': min_value}
+      weight_specs.append(spec)
+      buffers.append(weight)
+
+  # Everything is written to a single shard
+  os.makedirs(output_dir, exist_ok=True)
+  shard_path = 'group1-shard1of1.bin'
+  data = b''.join(buffers)
+  with open(os.path.join(output_dir, shard_path), 'wb') as file:
+    file.write(data)
+
+  model_json['weightsManifest'] = [{
+      'paths': [shard_path],
+      'weights': weight_specs
+  }]
+  with open(os.path.join(output_dir, 'model.json'), 'w') as file:
+    json.dump(model_json, file)
+
+  return float_size, len(data)
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description="Quantize the weights of the Chrome extension's tfjs model.")
+  parser.add_argument('model_dir', help='directory of the float tfjs model')
+  parser.add_argument(
+      'output_dir', help='directory to save the quantized tfjs model to')
+  parser.add_argument(
+      '--dtype',
+      choices=tuple(TFJS_DTYPES),
+      default='uint8',
+      help='dtype to quantize the weights to')
+
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+
+  float_size, quantized_size = quantize_tfjs_model(args.model_dir,
+                                                   args.output_dir, args.dtype)
+  print(f'Weights: {float_size / 1024:.1f} KB -> '
+        f'{quantized_size / 1024:.1f} KB ({args.dtype})')
+  print(f'Quantized model written to {args.output_dir}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,373 @@
+# Lint as: python3
+"""This module stores trained models as versioned, switchable artifacts.
+
+Every model train.py produces is published to a new version directory instead
+of overwriting the previous model, so older models can still be inspected,
+compared, or switched back to. A registry directory looks like:
+  CURRENT: The name of the active version
+  v0001/
+    model/: The Keras SavedModel
+    model.npz: Its NumPy export (see numpy_model)
+    tokenizer.json: The tokenizer the model was trained with
+    metadata.json: The version, when it was created, and whatever train.py
+      recorded (such as the calorie thresholds, max length, and test metrics)
+  v0002/
+    ...
+
+Versions are written to a temporary directory that's only renamed into place
+once every artifact is written, and the active version is switched by
+atomically replacing CURRENT (see ModelRegistry.activate), so readers never see
+a partially written version or pointer.
+
+LazyClassifier only loads the active version on its first prediction, and can
+switch to a newly activated version while it keeps serving predictions with the
+old one. get_classifier keeps one LazyClassifier per registry directory for the
+whole process, so repeated calls from a long-running service or notebook only
+pay the load cost once.
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Callable, Iterable
+
+from amaranth.ml import classifier
+from amaranth.ml import prediction_cache
+
+# Default directory to store model versions in
+REGISTRY_DIR = os.path.join(classifier.RESOURCES_DIR, 'registry')
+# File holding the name of the active version
+CURRENT_FILE = 'CURRENT'
+# Names of each version's artifacts
+KERAS_MODEL_DIR = 'model'
+NUMPY_MODEL_FILE = 'model.npz'
+TOKENIZER_FILE = 'tokenizer.json'
+METADATA_FILE = 'metadata.json'
+# Version directory names: 'v' followed by a zero-padded, increasing number
+VERSION_PATTERN = re.compile(r'v(\d+)')
+
+# The LazyClassifier of each registry directory (see get_classifier)
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def _write_atomically(path: str, contents: str):
+  # Readers see either the old contents or the new, never a partial write
+  tmp_path = f'{path}.{os.getpid()}.tmp'
+  try:
+    with open(tmp_path, 'w') as file:
+      file.write(contents)
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+
+class ModelRegistry:
+  """A directory of versioned models, one of which is active.
+
+  Attributes:
+    registry_dir (str): The directory versions are stored in
+  """
+
+  def __init__(self, registry_dir: str = REGISTRY_DIR):
+    self.registry_dir = registry_dir
+
+  def path(self, version: str, artifact: str = ''):
+    """The directory of a version, or of one of its artifacts.
+
+    Args:
+      version (str): The version's name, such as 'v0001'
+      artifact (str): The artifact's file name, such as TOKENIZER_FILE
+
+    Returns:
+      path (str): The version's (or artifact's) path
+    """
+
+    return os.path.join(self.registry_dir, version, artifact)
+
+  def versions(self):
+    """Lists every published version, oldest first."""
+
+    if not os.path.isdir(self.registry_dir):
+      return []
+
+    return sorted(
+        (name for name in os.listdir(self.registry_dir)
+         if VERSION_PATTERN.fullmatch(name) and
+         os.path.isdir(os.path.join(self.registry_dir, name))),
+        key=lambda name: int(name[1:]))
+
+  def current_version(self):
+    """The name of the active version, or None if none has been activated."""
+
+    try:
+      with open(os.path.join(self.registry_dir, CURRENT_FILE)) as file:
+        return file.read().strip() or None
+    except FileNotFoundError:
+      return None
+
+  def activate(self, version: str):
+    """Atomically makes a version the active one.
+
+    Args:
+      version (str): The version to activate
+
+    Raises:
+      ValueError: If the version hasn't been published
+    """
+
+    if version not in self.versions():
+      raise ValueError(f'Unknown model version {version}, expected one of '
+                       f'{self.versions()}')
+
+    _write_atomically(
+        os.path.join(self.registry_dir, CURRENT_FILE), version + '\n')
+
+  def publish(self,
+              write_artifacts: Callable[[str], None],
+              metadata: dict = None,
+              activate: bool = True):
+    """Publishes a new version.
+
+    Args:
+      write_artifacts (Callable[[str], None]): Writes the version's model and
+        TOKENIZER_FILE into the directory it's passed
+      metadata (dict): JSON-serializable information about the version, such
+        as how it was trained and how it scored
+      activate (bool): Whether to make the new version the active one
+
+    Returns:
+      version (str): The new version's name
+    """
+
+    versions = self.versions()
+    number = int(versions[-1][1:]) + 1 if versions else 1
+    version = f'v{number:04d}'
+
+    os.makedirs(self.registry_dir, exist_ok=True)
+    tmp_dir = os.path.join(self.registry_dir,
+                           f'.{version}.{os.getpid()}.tmp')
+    try:
+      os.makedirs(tmp_dir)
+      write_artifacts(tmp_dir)
+      with open(os.path.join(tmp_dir, METADATA_FILE), 'w') as file:
+        json.dump(
+            {
+                'version': version,
+                'created': datetime.datetime.now(
+                    datetime.timezone.utc).isoformat(timespec='seconds'),
+                **(metadata or {}),
+            },
+            file,
+            indent=2)
+      # Renaming fails if another process published this version first
+      os.rename(tmp_dir, self.path(version))
+    finally:
+      if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+    if activate:
+      self.activate(version)
+    return version
+
+  def metadata(self, version: str = None):
+    """Loads a version's metadata.
+
+    Args:
+      version (str): The version. Defaults to the active version
+
+    Returns:
+      metadata (dict): The metadata the version was published with, plus its
+      'version' and when it was 'created'
+
+    Raises:
+      ValueError: If no version is given and none is active
+    """
+
+    version = version or self.current_version()
+    if version is None:
+      raise ValueError(f'No model version is active in {self.registry_dir}')
+
+    with open(self.path(version, METADATA_FILE)) as file:
+      return json.load(file)
+
+  def load_classifier(self,
+                      version: str = None,
+                      cache: prediction_cache.PredictionCache = None):
+    """Loads a version's model and tokenizer.
+
+    The model's NumPy export is loaded if the version has one (so TensorFlow
+    isn't imported), and its Keras SavedModel otherwise.
+
+    Args:
+      version (str): The version to load. Defaults to the active version, or
+        if none is active, to the model and tokenizer in the project resources
+        directory (see classifier.CalorieClassifier.load)
+      cache (prediction_cache.PredictionCache): An optional cache of
+        predictions
+
+    Returns:
+      classifier (classifier.CalorieClassifier): The version's classifier
+    """
+
+    version = version or self.current_version()
+    if version is None:
+      return classifier.CalorieClassifier.load(cache=cache)
+
+    model_path = self.path(version, NUMPY_MODEL_FILE)
+    if not os.path.exists(model_path):
+      model_path = self.path(version, KERAS_MODEL_DIR)
+    return classifier.CalorieClassifier.load(
+        model_path, self.path(version, TOKENIZER_FILE), cache)
+
+
+class LazyClassifier:
+  """Classifies dish names with a registry's active version, loaded lazily.
+
+  The active version is only loaded on the first prediction. refresh loads a
+  newly activated version while predictions keep using the old one, and only
+  swaps it in once it has loaded, so switching versions never interrupts
+  predictions. If check_seconds is given, predict starts a refresh on a
+  background thread every check_seconds, so it never waits for a load itself.
+  A version that fails to load is logged, and the old one is kept.
+
+  If the registry has no active version, the model and tokenizer in the
+  project resources directory are loaded instead (see
+  ModelRegistry.load_classifier).
+
+  Attributes:
+    registry (ModelRegistry): The registry to load versions from
+    cache_size (int): The most predictions to cache for each loaded version
+      (0 disables caching). Each version gets its own cache, so predictions
+      of an old version are never returned after switching
+    check_seconds (float): If not None, how often predict checks for a newly
+      activated version
+  """
+
+  def __init__(self,
+               registry: ModelRegistry,
+               cache_size: int = 0,
+               check_seconds: float = None):
+    self.registry = registry
+    self.cache_size = cache_size
+    self.check_seconds = check_seconds
+    # The loaded (version, classifier) pair, replaced as a whole when switching
+    self._loaded = None
+    self._last_check = 0.0
+    self._load_lock = threading.Lock()
+    self._refresh_thread = None
+
+  @property
+  def version(self):
+    """The name of the loaded version (None if not loaded or unversioned)."""
+    return self._loaded[0] if self._loaded else None
+
+  @property
+  def loaded(self):
+    """Whether a model has been loaded."""
+    return self._loaded is not None
+
+  def _load(self, version: str):
+    cache = (
+        prediction_cache.PredictionCache(self.cache_size)
+        if self.cache_size else None)
+    return self.registry.load_classifier(version, cache)
+
+  def get(self):
+    """Returns the loaded classifier, loading the active version if needed.
+
+    Returns:
+      classifier (classifier.CalorieClassifier): The loaded classifier
+    """
+
+    loaded = self._loaded
+    if loaded is None:
+      with self._load_lock:
+        # Another thread may have loaded it while this one waited
+        if self._loaded is None:
+          version = self.registry.current_version()
+          self._loaded = (version, self._load(version))
+          self._last_check = time.monotonic()
+        loaded = self._loaded
+
+    return loaded[1]
+
+  def refresh(self):
+    """Switches to the active version, if it isn't the loaded one.
+
+    The new version is loaded before it replaces the old one, which keeps
+    serving predictions in the meantime. If it fails to load, the error is
+    logged and the old one is kept.
+
+    Returns:
+      switched (bool): Whether a new version was loaded
+    """
+
+    with self._load_lock:
+      self._last_check = time.monotonic()
+      version = self.registry.current_version()
+      if self._loaded is not None and version == self._loaded[0]:
+        return False
+      try:
+        loaded = (version, self._load(version))
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Failed to load model version %s, keeping %s',
+                          version, self.version)
+        return False
+      self._loaded = loaded
+      return True
+
+  def _refresh_in_background(self):
+    # At most one refresh runs at a time, and predictions never wait for it
+    thread = self._refresh_thread
+    if thread is None or not thread.is_alive():
+      self._refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+      self._refresh_thread.start()
+
+  def predict(self, dish_names: Iterable[str]):
+    """Predicts the confidence of each calorie class for each dish name.
+
+    Args:
+      dish_names (Iterable[str]): The dish names to classify
+
+    Returns:
+      confidences (np.ndarray): See classifier.CalorieClassifier.predict
+    """
+
+    now = time.monotonic()
+    if (self.check_seconds is not None and self._loaded is not None and
+        now - self._last_check >= self.check_seconds):
+      self._last_check = now
+      self._refresh_in_background()
+    return self.get().predict(dish_names)
+
+
+def get_classifier(registry_dir: str = REGISTRY_DIR,
+                   cache_size: int = 0,
+                   check_seconds: float = None):
+  """Returns this process' LazyClassifier of a registry directory.
+
+  The first call for a directory creates it (without loading anything), and
+  every later call returns the same one, whatever its arguments.
+
+  Args:
+    registry_dir (str): The registry's directory
+    cache_size (int): See LazyClassifier
+    check_seconds (float): See LazyClassifier
+
+  Returns:
+    classifier (LazyClassifier): The directory's classifier
+  """
+
+  key = os.path.abspath(registry_dir)
+  with _classifiers_lock:
+    if key not in _classifiers:
+      _classifiers[key] = LazyClassifier(
+          ModelRegistry(registry_dir), cache_size, check_seconds)
+    return _classifiers[key]
@@ -0,0 +1,362 @@
+# Lint as: python3
+"""This script serves the ML model over a local HTTP/JSON API.
+
+The model registry's active version (see registry) is loaded once at startup,
+and with --check-seconds, the server switches to a newly activated version
+without dropping any requests. Concurrent requests are coalesced into
+micro-batches (of at most --max-batch-size dish names, waiting at most
+--max-wait-ms for a batch to fill up), each of which is classified with a single
+call to the model, so throughput stays high under load.
+
+Endpoints:
+  POST /predict: Classifies {"dish_name": "..."} or {"dish_names": ["...", ...]}
+  GET /metrics: Latency percentiles (of successful and failed requests), the
+    number of failed requests, and a histogram of batch sizes
+  GET /healthz: Returns {"status": "ok"} once the model is loaded
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import http.server
+import json
+import queue
+import threading
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from amaranth.ml import classifier
+from amaranth.ml import prediction_cache
+from amaranth.ml import registry
+
+# Default address to serve on
+HOST = '127.0.0.1'
+PORT = 8080
+# Most dish names to classify in one call to the model
+MAX_BATCH_SIZE = 64
+# Longest time to wait for a batch to fill up, in milliseconds
+MAX_WAIT_MS = 5.0
+# Number of recent request latencies to compute percentiles over
+LATENCY_WINDOW = 10000
+
+
+class MicroBatcher:
+  """Coalesces individual predictions into batched calls to a predict function.
+
+  A background thread takes pending dish names off a queue, waiting until
+  max_batch_size of them are pending or max_wait_ms has passed since the first
+  one arrived, and then classifies them all with one call to predict_fn.
+  """
+
+  def __init__(self,
+               predict_fn: Callable[[List[str]], np.ndarray],
+               max_batch_size: int = MAX_BATCH_SIZE,
+               max_wait_ms: float = MAX_WAIT_MS,
+               metrics: 'ServerMetrics' = None):
+    self.predict_fn = predict_fn
+    self.max_batch_size = max_batch_size
+    self.max_wait_ms = max_wait_ms
+    self.metrics = metrics
+    self._queue = queue.Queue()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def submit(self, dish_name: str):
+    """Queues a dish name to be classified in the next batch.
+
+    Args:
+      dish_name (str): The dish name to classify
+
+    Returns:
+      future (concurrent.futures.Future): A future whose result will be the
+      dish's (3,) array of confidences
+    """
+
+    future = concurrent.futures.Future()
+    self._queue.put((dish_name, future))
+    return future
+
+  def close(self):
+    """Stops the background thread once every queued dish is classified."""
+
+    self._queue.put(None)
+    self._thread.join()
+
+  def _next_batch(self):
+    item = self._queue.get()
+    if item is None:
+      return None
+
+    batch = [item]
+    deadline = time.perf_counter() + self.max_wait_ms / 1000
+    while len(batch) < self.max_batch_size:
+      timeout = deadline - time.perf_counter()
+      if timeout <= 0:
+        break
+      try:
+        item = self._queue.get(timeout=timeout)
+      except queue.Empty:
+        break
+      if item is None:
+        # Finish this batch, then stop
+        self._queue.put(None)
+        break
+      batch.append(item)
+
+    return batch
+
+  def _run(self):
+    while True:
+      batch = self._next_batch()
+      if batch is None:
+        return
+
+      dish_names = [dish_name for dish_name, _ in batch]
+      try:
+        confidences = self.predict_fn(dish_names)
+      except Exception as error:  # pylint: disable=broad-except
+        for _, future in batch:
+          future.set_exception(error)
+        continue
+
+      if self.metrics is not None:
+        self.metrics.record_batch(len(batch))
+      for (_, future), confidence in zip(batch, confidences):
+        future.set_result(confidence)
+
+
+class ServerMetrics:
+  """Thread-safe request latency and batch size statistics."""
+
+  def __init__(self, latency_window: int = LATENCY_WINDOW):
+    self._lock = threading.Lock()
+    self._latencies_ms = collections.deque(maxlen=latency_window)
+    self._batch_sizes = collections.Counter()
+    self._num_requests = 0
+    self._num_errors = 0
+
+  def record_latency(self, latency_ms: float, error: bool = False):
+    with self._lock:
+      self._latencies_ms.append(latency_ms)
+      self._num_requests += 1
+      self._num_errors += error
+
+  def record_batch(self, batch_size: int):
+    with self._lock:
+      self._batch_sizes[batch_size] += 1
+
+  def snapshot(self):
+    """Summarizes the metrics recorded so far.
+
+    Returns:
+      metrics (dict): The number of requests and of failed requests, p50/p90/
+      p99 latencies (in milliseconds) over the most recent requests (failed or
+      not), and a histogram mapping batch sizes to the number of batches of
+      that size
+    """
+
+    with self._lock:
+      latencies_ms = np.array(self._latencies_ms)
+      batch_sizes = dict(sorted(self._batch_sizes.items()))
+      num_requests = self._num_requests
+      num_errors = self._num_errors
+
+    if len(latencies_ms):  # pylint: disable=len-as-condition
+      p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+    else:
+      p50 = p90 = p99 = 0.0
+
+    num_batches = sum(batch_sizes.values())
+    return {
+        'num_requests': num_requests,
+        'num_errors': num_errors,
+        'latency_ms': {
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99)
+        },
+        'num_batches': num_batches,
+        'mean_batch_size': (sum(size * cnt for size, cnt in batch_sizes.items())
+                            / num_batches if num_batches else 0.0),
+        'batch_size_histogram': {
+            str(size): cnt for size, cnt in batch_sizes.items()
+        },
+    }
+
+
+def format_prediction(dish_name: str, confidence: np.ndarray):
+  """Formats one dish's prediction as a JSON-serializable dict."""
+
+  return {
+      'dish_name': dish_name,
+      'label': classifier.CALORIE_LABELS[int(np.argmax(confidence))],
+      'confidence': {
+          label: float(conf)
+          for label, conf in zip(classifier.CALORIE_LABELS, confidence)
+      },
+  }
+
+
+class PredictionHandler(http.server.BaseHTTPRequestHandler):
+  """Handles HTTP requests to a PredictionServer."""
+
+  def _send_json(self, status: int, body):
+    payload = json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+
+  def _record_latency(self, start_time: float, error: bool = False):
+    self.server.metrics.record_latency(
+        (time.perf_counter() - start_time) * 1000, error)
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    if self.path == '/metrics':
+      self._send_json(200, self.server.metrics.snapshot())
+    elif self.path == '/healthz':
+      self._send_json(200, {'status': 'ok'})
+    else:
+      self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    if self.path != '/predict':
+      self._send_json(404, {'error': f'Unknown path {self.path}'})
+      return
+
+    start_time = time.perf_counter()
+    try:
+      length = int(self.headers.get('Content-Length', 0))
+      request = json.loads(self.rfile.read(length))
+      if not isinstance(request, dict):
+        raise TypeError('The body must be a JSON object')
+      if 'dish_name' in request:
+        dish_names = [request['dish_name']]
+      else:
+        dish_names = request['dish_names']
+      # A string would otherwise be classified one character at a time
+      if not isinstance(dish_names, list):
+        raise TypeError('dish_names must be a list')
+      if not all(isinstance(name, str) for name in dish_names):
+        raise TypeError('Dish names must be strings')
+    except (ValueError, KeyError, TypeError) as error:
+      self._send_json(400, {'error': f'Invalid request: {error}'})
+      self._record_latency(start_time, error=True)
+      return
+
+    futures = [self.server.batcher.submit(name) for name in dish_names]
+    try:
+      predictions = [
+          format_prediction(name, future.result())
+          for name, future in zip(dish_names, futures)
+      ]
+    except Exception as error:  # pylint: disable=broad-except
+      self._send_json(500, {'error': str(error)})
+      self._record_latency(start_time, error=True)
+      return
+
+    if 'dish_name' in request:
+      self._send_json(200, predictions[0])
+    else:
+      self._send_json(200, {'predictions': predictions})
+    self._record_latency(start_time)
+
+  def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+    # Don't log every request to stderr
+    pass
+
+
+class PredictionServer(http.server.ThreadingHTTPServer):
+  """A threaded HTTP server that classifies dish names in micro-batches.
+
+  Attributes:
+    batcher (MicroBatcher): Coalesces requests into batches
+    metrics (ServerMetrics): Latency and batch size statistics
+  """
+
+  daemon_threads = True
+
+  def __init__(self,
+               address,
+               predict_fn: Callable[[List[str]], np.ndarray],
+               max_batch_size: int = MAX_BATCH_SIZE,
+               max_wait_ms: float = MAX_WAIT_MS):
+    super().__init__(address, PredictionHandler)
+    self.metrics = ServerMetrics()
+    self.batcher = MicroBatcher(
+        predict_fn,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        metrics=self.metrics)
+
+  def server_close(self):
+    super().server_close()
+    self.batcher.close()
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Serve the ML model over a local HTTP/JSON API.')
+  parser.add_argument('--host', default=HOST, help='address to serve on')
+  parser.add_argument('--port', type=int, default=PORT, help='port to serve on')
+  parser.add_argument(
+      '--max-batch-size',
+      type=int,
+      default=MAX_BATCH_SIZE,
+      help='most dish names to classify in one call to the model')
+  parser.add_argument(
+      '--max-wait-ms',
+      type=float,
+      default=MAX_WAIT_MS,
+      help='longest time to wait for a batch to fill up, in milliseconds')
+  parser.add_argument(
+      '--check-seconds',
+      type=float,
+      help=('check the model registry for a newly activated version this '
+            'often, and switch to it without restarting'))
+  parser.add_argument(
+      '--model-dir',
+      help=('directory of a saved model, or its NumPy export (.npz), to serve '
+            'instead of the model registry'))
+  parser.add_argument('--tokenizer', help='saved tokenizer JSON file')
+  parser.add_argument(
+      '--cache-size',
+      type=int,
+      default=prediction_cache.MAX_SIZE,
+      help='most predictions to cache for repeated dish names (0 disables)')
+
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+
+  if args.model_dir is None and args.tokenizer is None:
+    calorie_classifier = registry.get_classifier(
+        cache_size=args.cache_size, check_seconds=args.check_seconds)
+    # Load the model now, rather than on the first request
+    calorie_classifier.get()
+  else:
+    calorie_classifier = classifier.CalorieClassifier.load(
+        args.model_dir, args.tokenizer,
+        prediction_cache.PredictionCache(args.cache_size))
+  server = PredictionServer((args.host, args.port),
+                            calorie_classifier.predict,
+                            max_batch_size=args.max_batch_size,
+                            max_wait_ms=args.max_wait_ms)
+
+  host, port = server.server_address[:2]
+  print(f'Serving on http://{host}:{port} (press CTRL-C to stop)')
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+if __name__ == '__main__':
+  main()
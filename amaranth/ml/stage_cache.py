@@ -0,0 +1,280 @@
+# Lint as: python3
+"""This module caches the output of each preprocessing stage on disk.
+
+Each cached output is stored in a single file named after its stage and a key:
+a fingerprint of everything the output depends on, such as the hashes of the
+input files, the config it was computed with, and the keys of the stages it was
+computed from. So when an input or config value changes, the stages that depend
+on it get new keys and are recomputed, while every other stage is reused.
+
+Hashing large input files takes a while, so each file's hash is remembered
+along with its size and modification time, and only recomputed when either
+changes.
+
+Cached outputs can be listed and cleared by running this module as a script.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+from typing import Any, Callable, Iterable, List
+
+from amaranth.ml import instrumentation
+
+# Default directory to cache stage outputs in
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '../../data/fdc/cache/')
+# File remembering the hashes of input files
+FILE_HASHES_FILE = 'file_hashes.json'
+# Number of hex digits of a key to put in file names
+KEY_LENGTH = 16
+
+
+def hash_files(paths: List[str], block_size: int = 1 << 20):
+  """Computes a hash of the contents of a list of files.
+
+  Args:
+    paths (List[str]): The files to hash, in order
+    block_size (int): The number of bytes to read from a file at a time
+
+  Returns:
+    digest (str): The hex digest of the SHA-256 hash of the files' contents
+  """
+
+  sha = hashlib.sha256()
+  for path in paths:
+    with open(path, 'rb') as file:
+      for block in iter(lambda f=file: f.read(block_size), b''):
+        sha.update(block)
+    # Separate files so moving bytes between two files changes the hash
+    sha.update(b'\0')
+
+  return sha.hexdigest()
+
+
+@contextlib.contextmanager
+def _replacing(path: str, ext: str = ''):
+  """Yields a temporary path to write to, which then replaces path.
+
+  Writing to a temporary file first means an interrupted run never leaves a
+  partially written file behind. The temporary path ends in ext, so libraries
+  that infer a file's format from its extension still work.
+  """
+
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp_path = f'{path}.{os.getpid()}.tmp{ext}'
+  try:
+    yield tmp_path
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+
+def fingerprint(*parts: Any):
+  """Computes a key from everything a stage's output depends on.
+
+  Args:
+    *parts (Any): JSON-serializable values, such as config values, file
+      hashes, and the keys of earlier stages
+
+  Returns:
+    key (str): The hex digest of the SHA-256 hash of parts
+  """
+
+  return hashlib.sha256(
+      json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class StageCache:
+  """A directory of cached stage outputs.
+
+  Attributes:
+    cache_dir (str): The directory outputs are cached in
+    metrics (instrumentation.RunMetrics): Records whether each stage was
+      cached, as a '<stage>_cache_hit' count
+  """
+
+  def __init__(self,
+               cache_dir: str = CACHE_DIR,
+               metrics: instrumentation.RunMetrics = instrumentation.DISABLED):
+    self.cache_dir = cache_dir
+    self.metrics = metrics
+
+  def file_digest(self, paths: List[str]):
+    """Computes a hash of the contents of a list of files.
+
+    Each file's hash is remembered in the cache directory, and only recomputed
+    if the file's size or modification time has changed.
+
+    Args:
+      paths (List[str]): The files to hash, in order
+
+    Returns:
+      digest (str): A hex digest of the files' contents
+    """
+
+    hashes_path = os.path.join(self.cache_dir, FILE_HASHES_FILE)
+    file_hashes = {}
+    if os.path.exists(hashes_path):
+      with open(hashes_path) as file:
+        file_hashes = json.load(file)
+
+    digests = []
+    changed = False
+    for path in paths:
+      path = os.path.abspath(path)
+      stat = os.stat(path)
+      size, mtime_ns, digest = file_hashes.get(path, (None, None, None))
+      if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        digest = hash_files([path])
+        file_hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        changed = True
+      digests.append(digest)
+
+    if changed:
+      with _replacing(hashes_path) as tmp_path, open(tmp_path, 'w') as file:
+        json.dump(file_hashes, file, indent=2)
+
+    return fingerprint(*digests)
+
+  def path(self, stage: str, key: str, ext: str):
+    """The file a stage's output is cached in.
+
+    Args:
+      stage (str): The stage's name
+      key (str): The output's key
+      ext (str): The file's extension, such as '.npy'
+
+    Returns:
+      path (str): The cached output's path
+    """
+
+    return os.path.join(self.cache_dir, f'{stage}-{key[:KEY_LENGTH]}{ext}')
+
+  def has(self, stage: str, key: str, ext: str):
+    """Checks whether a stage's output is cached."""
+
+    return os.path.exists(self.path(stage, key, ext))
+
+  def writing(self, stage: str, key: str, ext: str):
+    """Writes a stage's output atomically.
+
+    Args:
+      stage (str): The stage's name
+      key (str): The output's key
+      ext (str): The file's extension
+
+    Returns:
+      writing (ContextManager[str]): Yields a temporary path to write to, which
+      replaces the cached output once the context exits without an exception
+    """
+
+    return _replacing(self.path(stage, key, ext), ext)
+
+  def memoize(self, stage: str, key: str, ext: str, compute: Callable[[], Any],
+              save: Callable[[Any, str], None], load: Callable[[str], Any]):
+    """Loads a stage's cached output, or computes and caches it.
+
+    Args:
+      stage (str): The stage's name
+      key (str): The output's key
+      ext (str): The cached file's extension
+      compute (Callable[[], Any]): Computes the output
+      save (Callable[[Any, str], None]): Saves an output to a path
+      load (Callable[[str], Any]): Loads an output from a path
+
+    Returns:
+      output (Any): The loaded or computed output
+    """
+
+    path = self.path(stage, key, ext)
+    self.metrics.count(f'{stage}_cache_hit', os.path.exists(path))
+    if os.path.exists(path):
+      with self.metrics.stage(f'load_{stage}'):
+        return load(path)
+
+    with self.metrics.stage(stage):
+      output = compute()
+    with self.metrics.stage(f'save_{stage}'), \
+        self.writing(stage, key, ext) as tmp_path:
+      save(output, tmp_path)
+
+    return output
+
+  def entries(self):
+    """Lists the cached outputs.
+
+    Returns:
+      entries (List[Tuple[str, str, int]]): Each cached output's stage, file
+      name, and size in bytes, sorted by stage
+    """
+
+    if not os.path.isdir(self.cache_dir):
+      return []
+
+    entries = []
+    for name in sorted(os.listdir(self.cache_dir)):
+      stage, sep, _ = name.rpartition('-')
+      if sep and '.tmp' not in name:
+        entries.append(
+            (stage, name, os.path.getsize(os.path.join(self.cache_dir, name))))
+
+    return sorted(entries)
+
+  def invalidate(self, stages: Iterable[str] = None):
+    """Removes cached outputs, so they're recomputed the next time.
+
+    Args:
+      stages (Iterable[str]): The stages whose outputs to remove. Defaults to
+        every stage (also forgetting the remembered file hashes)
+
+    Returns:
+      num_removed (int): The number of files removed
+    """
+
+    stages = None if stages is None else set(stages)
+    num_removed = 0
+    for stage, name, _ in self.entries():
+      if stages is None or stage in stages:
+        os.remove(os.path.join(self.cache_dir, name))
+        num_removed += 1
+
+    hashes_path = os.path.join(self.cache_dir, FILE_HASHES_FILE)
+    if stages is None and os.path.exists(hashes_path):
+      os.remove(hashes_path)
+      num_removed += 1
+
+    return num_removed
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='List or clear cached preprocessing stage outputs.')
+  parser.add_argument(
+      'command', choices=('list', 'clear'), help='what to do with the cache')
+  parser.add_argument(
+      'stages',
+      nargs='*',
+      help='stages to clear, such as calorie_data or inputs (default: all)')
+  parser.add_argument(
+      '--cache-dir', default=CACHE_DIR, help='directory of the cache')
+
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+  cache = StageCache(args.cache_dir)
+
+  if args.command == 'list':
+    for stage, name, size in cache.entries():
+      print(f'{stage:<20}{size / 2**20:>10.1f} MB  {name}')
+  else:
+    num_removed = cache.invalidate(args.stages or None)
+    print(f'Removed {num_removed} cached files from {args.cache_dir}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,478 @@
+# Lint as: python3
+"""This script searches for the best model hyperparameters in parallel.
+
+Configurations from a grid or random search space are trained concurrently on
+a pool of worker processes, each of which limits how many threads TensorFlow
+uses, so the workers share the CPU's cores instead of fighting over them. The
+data is preprocessed once (see preprocess), and every worker memory-maps the
+same read-only token id matrix, so it's only ever in memory once.
+
+Each configuration is trained on the same training split and scored on the same
+validation split, and the results are written to a leaderboard sorted by
+validation accuracy. Note that configurations with different calorie thresholds
+are scored against different labels, so their accuracies aren't directly
+comparable.
+
+The search space is a JSON object mapping each hyperparameter to a list of
+values to try, such as:
+  {"embedding_dim": [8, 13, 16], "hidden_units": [[32, 10], [64]],
+   "epochs": [5, 10]}
+or the name of one of SPACES. For example, the 'batching' space compares the
+flatten model trained on fully padded batches with the average-pooled model
+trained on padded and length-bucketed batches (see dataset.make_dataset), and
+the 'encoding' space compares the vocabulary tokenizer with character n-grams
+hashed into a fixed number of buckets (see tokenizer.Tokenizer) by accuracy,
+model size (Params), and inference throughput (Val ex/s).
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import amaranth
+from amaranth.ml import lib
+from amaranth.ml import preprocess
+
+# Hyperparameters that can be searched over, and their defaults (the same as
+# train.py's, so the default configuration is the model train.py trains)
+DEFAULT_CONFIG = {
+    'embedding_dim': None,  # Fourth root of the vocabulary size
+    # A list, like the hidden_units of results read back from JSON
+    'hidden_units': list(amaranth.HIDDEN_UNITS),
+    'learning_rate': amaranth.LEARNING_RATE,
+    'batch_size': amaranth.BATCH_SIZE,
+    'epochs': amaranth.NUM_EPOCHS,
+    'pooling': 'flatten',
+    'bucket_batches': False,
+    'hash_buckets': None,  # Look tokens up in a vocabulary instead
+    'low_calorie_threshold': amaranth.LOW_CALORIE_THRESHOLD,
+    'high_calorie_threshold': amaranth.HIGH_CALORIE_THRESHOLD,
+}
+# Named search spaces
+SPACES = {
+    # Used when no space is given
+    'default': {
+        'embedding_dim': [None, 16, 32],
+        'hidden_units': [[32, 10], [64, 16], [32]],
+        'learning_rate': [0.001, 0.003],
+    },
+    # How token embeddings are combined and how examples are batched
+    'batching': {
+        'pooling': ['flatten', 'average'],
+        'bucket_batches': [False, True],
+    },
+    # How dish names are encoded as token ids
+    'encoding': {
+        'hash_buckets': [None, 4096, 16384],
+        'pooling': ['flatten', 'average'],
+    },
+}
+# Fractions of data used for training and validation (the rest is left out for
+# testing the final model)
+TRAIN_FRAC = 0.6
+VALIDATION_FRAC = 0.2
+# Threads each worker's TensorFlow runtime may use
+THREADS_PER_WORKER = 2
+# Default random seed for splitting data and sampling configurations
+SEED = 0
+
+# Data each worker trains on, loaded once per worker process
+_worker_data = {}
+
+
+def grid_search(space):
+  """Lists every combination of values in a search space.
+
+  Args:
+    space (Dict[str, List]): The values to try for each hyperparameter
+
+  Returns:
+    configs (List[dict]): Every combination, with unsearched hyperparameters
+    set to their defaults
+  """
+
+  names = list(space)
+  configs = [
+      dict(DEFAULT_CONFIG, **dict(zip(names, values)))
+      for values in itertools.product(*(space[name] for name in names))
+  ]
+  # Only models that accept inputs of any length can be trained on buckets
+  return [
+      config for config in configs
+      if not config['bucket_batches'] or config['pooling'] != 'flatten'
+  ]
+
+
+def random_search(space, num_trials: int, seed: int = SEED):
+  """Samples distinct combinations of values from a search space.
+
+  Args:
+    space (Dict[str, List]): The values to try for each hyperparameter
+    num_trials (int): The number of combinations to sample. At most every
+      combination is returned
+    seed (int): The random seed to sample with
+
+  Returns:
+    configs (List[dict]): The sampled combinations, with unsearched
+    hyperparameters set to their defaults
+  """
+
+  configs = grid_search(space)
+  order = np.random.default_rng(seed).permutation(len(configs))
+  return [configs[idx] for idx in order[:num_trials]]
+
+
+def _init_worker(threads_per_worker: int, data_paths):
+  # Thread counts can only be set before TensorFlow's runtime starts
+  os.environ['OMP_NUM_THREADS'] = str(threads_per_worker)
+  import tensorflow as tf  # pylint: disable=import-outside-toplevel
+
+  tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+  tf.config.threading.set_inter_op_parallelism_threads(threads_per_worker)
+  _worker_data.clear()
+  _worker_data.update(data_paths)
+
+
+def _load(path: str):
+  return np.load(path, mmap_mode='r')
+
+
+def run_trial(config, data_paths=None):
+  """Trains and validates one configuration.
+
+  Args:
+    config (dict): The configuration's hyperparameters
+    data_paths (dict): The data to train on: 'vocab_size', 'inputs', and
+      'input_lengths' dicts mapping each hash_buckets value (as a string) to
+      the largest token id and the paths of the inputs matrix and its lengths,
+      the paths of the 'train_indices' and 'validation_indices' .npy files,
+      and a 'calorie_classes' dict mapping each 'low,high' threshold pair to a
+      .npy file of labels. Defaults to the data the worker was started with
+
+  Returns:
+    result (dict): The config, its validation_accuracy, validation_loss,
+    train_seconds, the training and validation examples processed per second,
+    the model's number of parameters, and the worker's process id
+  """
+
+  # Only import TensorFlow in worker processes
+  from amaranth.ml import dataset  # pylint: disable=import-outside-toplevel
+  from amaranth.ml import train  # pylint: disable=import-outside-toplevel
+
+  data_paths = data_paths or _worker_data
+  encoding = str(config['hash_buckets'])
+  inputs = _load(data_paths['inputs'][encoding])
+  calorie_classes = _load(data_paths['calorie_classes'][
+      f'{config["low_calorie_threshold"]},{config["high_calorie_threshold"]}'])
+  train_indices = _load(data_paths['train_indices'])
+  validation_indices = _load(data_paths['validation_indices'])
+
+  bucketing = {}
+  if config['bucket_batches']:
+    bucketing = {
+        'lengths': _load(data_paths['input_lengths'][encoding]),
+        'bucket_boundaries': dataset.BUCKET_BOUNDARIES
+    }
+
+  model = train.build_model(
+      data_paths['vocab_size'][encoding],
+      inputs.shape[1],
+      embedding_dim=config['embedding_dim'],
+      hidden_units=config['hidden_units'],
+      learning_rate=config['learning_rate'],
+      pooling=config['pooling'])
+  train_set = dataset.make_dataset(
+      inputs,
+      calorie_classes,
+      train_indices,
+      batch_size=config['batch_size'],
+      shuffle=True,
+      seed=SEED,
+      **bucketing)
+  validation_set = dataset.make_dataset(
+      inputs,
+      calorie_classes,
+      validation_indices,
+      batch_size=config['batch_size'],
+      **bucketing)
+
+  start_time = time.perf_counter()
+  model.fit(train_set, epochs=config['epochs'], verbose=0)
+  train_seconds = time.perf_counter() - start_time
+  start_time = time.perf_counter()
+  results = model.evaluate(validation_set, verbose=0, return_dict=True)
+  validation_seconds = time.perf_counter() - start_time
+
+  return {
+      'config': config,
+      'validation_accuracy': float(results['categorical_accuracy']),
+      'validation_loss': float(results['loss']),
+      'train_seconds': train_seconds,
+      'train_examples_per_sec':
+          len(train_indices) * config['epochs'] / train_seconds,
+      'validation_examples_per_sec':
+          len(validation_indices) / validation_seconds,
+      'num_params': model.count_params(),
+      'pid': os.getpid(),
+  }
+
+
+def prepare_data(configs, output_dir: str, fdc_data_dir: str, cache_dir: str,
+                 seed: int = SEED):
+  """Preprocesses the data every configuration needs, once.
+
+  Args:
+    configs (List[dict]): The configurations to be trained
+    output_dir (str): The directory to save the data splits to
+    fdc_data_dir (str): The directory containing the FDC dataset's CSV files
+    cache_dir (str): The preprocessing stage cache directory
+    seed (int): The random seed to split the data with
+
+  Returns:
+    data_paths (dict): The data to pass to run_trial
+  """
+
+  from amaranth.ml import train  # pylint: disable=import-outside-toplevel
+
+  data_paths = {
+      'calorie_classes': {},
+      'inputs': {},
+      'input_lengths': {},
+      'vocab_size': {}
+  }
+  thresholds = sorted({(config['low_calorie_threshold'],
+                        config['high_calorie_threshold'])
+                       for config in configs})
+  encodings = {config['hash_buckets'] for config in configs}
+  # Only the labels differ between thresholds, and only the tokenizer and
+  # inputs between encodings, and every other stage is cached, so this is
+  # cheap after the first of each
+  for low, high in thresholds:
+    for hash_buckets in encodings:
+      preprocessed = preprocess.preprocess(
+          fdc_data_dir,
+          cache_dir,
+          low_calorie_threshold=low,
+          high_calorie_threshold=high,
+          filters=train.DISH_NAME_FILTERS,
+          min_count=train.MIN_TOKEN_APPEARANCE,
+          length_coverage=train.LENGTH_COVERAGE,
+          num_hash_buckets=hash_buckets)
+      data_paths['calorie_classes'][f'{low},{high}'] = (
+          preprocessed.calorie_classes.filename)
+      data_paths['inputs'][str(hash_buckets)] = preprocessed.inputs.filename
+      data_paths['input_lengths'][str(hash_buckets)] = (
+          preprocessed.input_lengths.filename)
+      data_paths['vocab_size'][str(hash_buckets)] = (
+          preprocessed.tokenizer.num_ids - 1)
+
+  # Every encoding has one row per dish, so they share the same splits
+  data_paths.update(save_splits(len(preprocessed.inputs), output_dir, seed))
+
+  return data_paths
+
+
+def save_splits(num_examples: int, output_dir: str, seed: int = SEED):
+  """Splits examples into training and validation sets, saving both.
+
+  Args:
+    num_examples (int): The number of examples
+    output_dir (str): The directory to save the splits' indices to
+    seed (int): The random seed to split with
+
+  Returns:
+    paths (dict): The paths of the 'train_indices' and 'validation_indices'
+    .npy files
+  """
+
+  train_indices, validation_indices, _ = lib.split_indices(
+      num_examples,
+      [TRAIN_FRAC, VALIDATION_FRAC, 1 - TRAIN_FRAC - VALIDATION_FRAC],
+      seed=seed)
+
+  os.makedirs(output_dir, exist_ok=True)
+  paths = {}
+  for name, indices in (('train_indices', train_indices),
+                        ('validation_indices', validation_indices)):
+    paths[name] = os.path.join(output_dir, f'{name}.npy')
+    np.save(paths[name], indices)
+
+  return paths
+
+
+def run_sweep(configs,
+              data_paths,
+              num_workers: int = None,
+              threads_per_worker: int = THREADS_PER_WORKER,
+              on_result=None):
+  """Trains configurations concurrently on a pool of worker processes.
+
+  Args:
+    configs (List[dict]): The configurations to train
+    data_paths (dict): The data to train on, as returned by prepare_data
+    num_workers (int): The number of worker processes. Defaults to as many as
+      fit on this machine's CPUs with threads_per_worker threads each
+    threads_per_worker (int): The number of threads each worker's TensorFlow
+      runtime may use
+    on_result (Callable[[dict], None]): Called with each result as soon as its
+      configuration finishes
+
+  Returns:
+    leaderboard (List[dict]): The results of run_trial, sorted by descending
+    validation accuracy
+  """
+
+  if num_workers is None:
+    num_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+  results = []
+  # Spawn fresh workers, since TensorFlow doesn't support being forked
+  with concurrent.futures.ProcessPoolExecutor(
+      num_workers,
+      mp_context=multiprocessing.get_context('spawn'),
+      initializer=_init_worker,
+      initargs=(threads_per_worker, data_paths)) as executor:
+    futures = [executor.submit(run_trial, config) for config in configs]
+    for future in concurrent.futures.as_completed(futures):
+      results.append(future.result())
+      if on_result is not None:
+        on_result(results[-1])
+
+  return sorted(results, key=lambda result: -result['validation_accuracy'])
+
+
+def format_leaderboard(leaderboard):
+  """Formats a leaderboard as a human-readable table.
+
+  Each configuration is shown with only the hyperparameters that differ from
+  DEFAULT_CONFIG. If the default configuration was trained, every other
+  configuration's throughput is also shown relative to it.
+  """
+
+  baseline = next((result for result in leaderboard
+                   if result['config'] == DEFAULT_CONFIG), None)
+
+  lines = [
+      f'{"Rank":<6}{"Val acc":>9}{"Val loss":>10}{"Seconds":>9}'
+      f'{"Train ex/s":>18}{"Val ex/s":>18}{"Params":>9}  Config'
+  ]
+  for rank, result in enumerate(leaderboard, 1):
+    searched = {
+        name: value
+        for name, value in result['config'].items()
+        if value != DEFAULT_CONFIG[name]
+    }
+    train_speed = f'{result["train_examples_per_sec"]:.0f}'
+    validation_speed = f'{result["validation_examples_per_sec"]:.0f}'
+    if baseline is not None and result is not baseline:
+      train_speedup = (result['train_examples_per_sec'] /
+                       baseline['train_examples_per_sec'])
+      validation_speedup = (result['validation_examples_per_sec'] /
+                            baseline['validation_examples_per_sec'])
+      train_speed += f' ({train_speedup:.2f}x)'
+      validation_speed += f' ({validation_speedup:.2f}x)'
+    lines.append(f'{rank:<6}{result["validation_accuracy"]:>9.4f}'
+                 f'{result["validation_loss"]:>10.4f}'
+                 f'{result["train_seconds"]:>9.1f}{train_speed:>18}'
+                 f'{validation_speed:>18}{result["num_params"]:>9}  '
+                 f'{json.dumps(searched)}')
+
+  return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Search for the best model hyperparameters in parallel.')
+  parser.add_argument(
+      '--space',
+      default='default',
+      help=('JSON file mapping hyperparameters to lists of values to try, or '
+            f'the name of a predefined space ({", ".join(SPACES)})'))
+  parser.add_argument(
+      '--search',
+      choices=('grid', 'random'),
+      default='grid',
+      help='try every combination, or a random sample of --trials of them')
+  parser.add_argument(
+      '--trials',
+      type=int,
+      default=10,
+      help='number of combinations to try with --search random')
+  parser.add_argument(
+      '--workers',
+      type=int,
+      help='number of worker processes (default: CPUs / --threads)')
+  parser.add_argument(
+      '--threads',
+      type=int,
+      default=THREADS_PER_WORKER,
+      help="threads each worker's TensorFlow runtime may use")
+  parser.add_argument(
+      '--output-dir',
+      default='sweep',
+      help='directory to write the data splits and leaderboard to')
+  parser.add_argument(
+      '--seed',
+      type=int,
+      default=SEED,
+      help='seed to split data and sample configurations with')
+
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+  from amaranth.ml import train  # pylint: disable=import-outside-toplevel
+
+  if args.space in SPACES:
+    space = SPACES[args.space]
+  else:
+    with open(args.space) as file:
+      space = json.load(file)
+  unknown = set(space) - set(DEFAULT_CONFIG)
+  if unknown:
+    raise ValueError(f'Unknown hyperparameters {sorted(unknown)}, expected '
+                     f'some of {sorted(DEFAULT_CONFIG)}')
+
+  if args.search == 'grid':
+    configs = grid_search(space)
+  else:
+    configs = random_search(space, args.trials, args.seed)
+
+  current_dir = os.path.dirname(__file__)
+  data_paths = prepare_data(configs, args.output_dir,
+                            os.path.join(current_dir, train.FDC_DATA_DIR),
+                            os.path.join(current_dir, train.CACHE_DIR),
+                            args.seed)
+
+  print(f'Training {len(configs)} configurations')
+  start_time = time.perf_counter()
+
+  def report(result):
+    print(f'[{time.perf_counter() - start_time:.0f}s] '
+          f'{result["validation_accuracy"]:.4f} {json.dumps(result["config"])}')
+
+  leaderboard = run_sweep(
+      configs,
+      data_paths,
+      num_workers=args.workers,
+      threads_per_worker=args.threads,
+      on_result=report)
+
+  leaderboard_path = os.path.join(args.output_dir, 'leaderboard.json')
+  with open(leaderboard_path, 'w') as file:
+    json.dump(leaderboard, file, indent=2)
+
+  print()
+  print(format_leaderboard(leaderboard))
+  print(f'\nLeaderboard written to {leaderboard_path}')
+
+
+if __name__ == '__main__':
+  main()
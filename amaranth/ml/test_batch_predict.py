@@ -0,0 +1,94 @@
+# Lint as: python3
+"""These tests ensure correctness for the batch prediction script."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from amaranth.ml import batch_predict
+
+
+class FakeClassifier:
+  """Classifies dish names by their length, modulo 3."""
+
+  def predict(self, dish_names):
+    return np.eye(3, dtype=np.float32)[[len(name) % 3 for name in dish_names]]
+
+
+class TestBatchPredict(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.dish_names = [f'dish {"x" * i}' for i in range(10)]
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def predict_file(self, input_name, output_name, **kwargs):
+    input_path = os.path.join(self.tmp_dir.name, input_name)
+    output_path = os.path.join(self.tmp_dir.name, output_name)
+    dish_names = pd.DataFrame({'dish_name': self.dish_names, 'price': 1.0})
+    if batch_predict.is_json_lines(input_path):
+      dish_names.to_json(input_path, orient='records', lines=True)
+    else:
+      dish_names.to_csv(input_path, index=False)
+
+    num_rows, _ = batch_predict.predict_file(
+        FakeClassifier(),
+        input_path,
+        output_path,
+        batch_size=3,
+        num_workers=2,
+        log_file=io.StringIO(),
+        **kwargs)
+    self.assertEqual(num_rows, len(self.dish_names),
+                     'Every dish name is classified')
+
+    if batch_predict.is_json_lines(output_path):
+      with open(output_path) as output_file:
+        lines = output_file.read().splitlines()
+      self.assertNotIn('', lines, 'JSON Lines have no blank lines')
+      # Every line must parse on its own, unlike with pd.read_json
+      return pd.DataFrame([json.loads(line) for line in lines])
+    return pd.read_csv(output_path)
+
+  def check_predictions(self, predictions):
+    self.assertEqual(
+        list(predictions.columns), batch_predict.OUTPUT_COLUMNS,
+        'Predictions have a dish name, label, and confidence columns')
+    self.assertEqual(
+        list(predictions['dish_name']), self.dish_names,
+        'Predictions are written in the same order as the input')
+    self.assertEqual(
+        list(predictions['label']), [
+            ['Low Calorie', 'Average Calorie', 'High Calorie'][len(name) % 3]
+            for name in self.dish_names
+        ], 'Each dish is labeled with its most confident class')
+
+  def test_predict_csv(self):
+    self.check_predictions(self.predict_file('menu.csv', 'out.csv'))
+
+  def test_predict_json_lines(self):
+    self.check_predictions(self.predict_file('menu.jsonl', 'out.jsonl'))
+
+  def test_unsupported_input(self):
+    for input_name in ('menu.csv', 'menu.jsonl'):
+      with self.assertRaisesRegex(
+          ValueError, 'Column name not found',
+          msg='Missing dish name columns are reported by name'):
+        self.predict_file(input_name, 'out.csv', column='name')
+
+    with self.assertRaisesRegex(
+        ValueError, 'JSON Lines', msg='JSON arrays are rejected'):
+      self.predict_file('menu.csv', 'out.json')
+    self.assertFalse(
+        os.path.exists(os.path.join(self.tmp_dir.name, 'out.json')),
+        'No output is written for rejected files')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,98 @@
+# Lint as: python3
+"""These tests ensure the pipeline benchmark runs on valid synthetic data."""
+
+import os
+import tempfile
+import unittest
+import pandas as pd
+
+from amaranth.ml import benchmark
+from amaranth.ml import ingest
+
+
+class TestBenchmark(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.fdc_data_dir = self.tmp_dir.name
+    benchmark.generate_fdc_data(self.fdc_data_dir, 2005, seed=1)
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_generate_fdc_data(self):
+    food = pd.read_csv(os.path.join(self.fdc_data_dir, 'food.csv'))
+    food_nutrient = pd.read_csv(
+        os.path.join(self.fdc_data_dir, 'food_nutrient.csv'))
+    nutrient = pd.read_csv(os.path.join(self.fdc_data_dir, 'nutrient.csv'))
+
+    self.assertEqual(len(food_nutrient), 2005,
+                     'food_nutrient.csv has the requested number of rows')
+    self.assertEqual(len(food), 201, 'Every food has its nutrients')
+    self.assertTrue(
+        food_nutrient['fdc_id'].isin(food['fdc_id']).all(),
+        'Every food_nutrient row refers to a food')
+    self.assertTrue(
+        food_nutrient['nutrient_id'].isin(nutrient['id']).all(),
+        'Every food_nutrient row refers to a nutrient')
+    for columns, dtypes in ((food.columns, ingest.FOOD_DTYPES),
+                            (food_nutrient.columns,
+                             ingest.FOOD_NUTRIENT_DTYPES),
+                            (nutrient.columns, ingest.NUTRIENT_DTYPES)):
+      self.assertTrue(
+          set(dtypes).issubset(columns), 'Files have the FDC columns')
+
+    with tempfile.TemporaryDirectory() as other_dir:
+      benchmark.generate_fdc_data(other_dir, 2005, seed=1)
+      pd.testing.assert_frame_equal(
+          pd.read_csv(os.path.join(other_dir, 'food.csv')), food,
+          'The same seed generates the same data')
+
+  def test_run_stages(self):
+    stages = benchmark.run_stages(self.fdc_data_dir, trace_memory=True)
+    stages = {stage['name']: stage for stage in stages}
+
+    self.assertEqual(
+        list(stages), [
+            'parse', 'join_pushdown', 'join_food', 'join_nutrient',
+            'get_calorie_data_strings', 'get_calorie_data', 'clean_chunks',
+            'clean', 'read_food_nutrient', 'read_food_nutrient_parallel',
+            'build_calorie_data', 'label', 'normalize', 'fit_vocab',
+            'fit_vocab_sketch', 'encode'
+        ], 'Every stage is recorded in order')
+    self.assertEqual(stages['parse']['rows'], 2005,
+                     'Stages record their number of input rows')
+    self.assertEqual(stages['label']['rows'],
+                     len(ingest.build_calorie_data(self.fdc_data_dir)),
+                     'Stages after the calorie table see every calorie row')
+    self.assertEqual(stages['fit_vocab_sketch']['missing_tokens'], 0,
+                     'The sketched vocabulary never misses a frequent token')
+    for stage in stages.values():
+      self.assertGreater(stage['seconds'], 0, 'Stages are timed')
+      self.assertGreater(stage['peak_rss_mb'], 0, 'Peak RSS is recorded')
+      self.assertIn('peak_traced_mb', stage, 'Traced memory is recorded')
+
+  def test_format_results(self):
+    stage = {
+        'name': 'parse',
+        'rows': 100,
+        'seconds': 0.5,
+        'rows_per_sec': 200.0,
+        'peak_rss_mb': 50.0
+    }
+    results = {'results': [{'food_nutrient_rows': 100, 'stages': [stage]}]}
+    baseline = {
+        'results': [{
+            'food_nutrient_rows': 100,
+            'stages': [dict(stage, seconds=1.0)]
+        }]
+    }
+
+    self.assertIn('2.00x', benchmark.format_results(results, baseline),
+                  'Speedups over the baseline are shown')
+    self.assertNotIn('x\n', benchmark.format_results(results) + '\n',
+                     'No speedups are shown without a baseline')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,151 @@
+# Lint as: python3
+"""These tests ensure corpus statistics match those of separate passes."""
+
+import collections
+import random
+import unittest
+from unittest import mock
+import numpy as np
+
+from amaranth.ml import corpus_stats
+from amaranth.ml import lib
+from amaranth.ml import tokenizer as tok
+
+
+class TestCorpusStats(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    rng = random.Random(0)
+    words = [f'word{idx}' for idx in range(40)]
+    cls.corpus = [
+        '  '.join(rng.choices(words, k=rng.randrange(9)))
+        for _ in range(1000)
+    ]
+
+  def test_update(self):
+    with mock.patch.object(corpus_stats, 'STATS_CHUNK_SIZE', 64):
+      stats = corpus_stats.CorpusStats().update(iter(self.corpus))
+
+    expected_counts = collections.Counter()
+    for string in self.corpus:
+      expected_counts.update(string.split())
+    self.assertEqual(
+        list(stats.token_counts.items()), list(expected_counts.items()),
+        'Tokens are counted in order of first appearance')
+    self.assertEqual(stats.unique_words, lib.num_unique_words(self.corpus),
+                     'Unique words are counted')
+    self.assertEqual(
+        stats.max_length,
+        lib.max_sequence_length([string.split() for string in self.corpus]),
+        'The longest length is found')
+    np.testing.assert_array_equal(
+        stats.length_counts,
+        np.bincount([len(string.split()) for string in self.corpus]),
+        'Lengths are counted')
+    self.assertEqual(stats.num_strings, len(self.corpus),
+                     'Strings are counted')
+    self.assertEqual(stats.num_tokens, sum(expected_counts.values()),
+                     'Tokens are totalled')
+    self.assertEqual(
+        stats.percentile_length(0.9),
+        lib.percentile_sequence_length(
+            [len(string.split()) for string in self.corpus], 0.9),
+        'Percentile lengths are computed from the length counts')
+
+    empty = corpus_stats.CorpusStats().update([])
+    self.assertEqual((empty.unique_words, empty.max_length, empty.num_tokens),
+                     (0, 0, 0), 'An empty corpus has no statistics')
+
+  def test_merge(self):
+    whole = corpus_stats.CorpusStats().update(self.corpus)
+    merged = corpus_stats.CorpusStats()
+    bounds = [0, 10, 500, len(self.corpus)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+      merged.merge(corpus_stats.CorpusStats().update(self.corpus[start:end]))
+
+    self.assertEqual(
+        list(merged.token_counts.items()), list(whole.token_counts.items()),
+        'Merging shards in order keeps the order of first appearance')
+    np.testing.assert_array_equal(merged.length_counts, whole.length_counts,
+                                  'Merged length counts are summed')
+    self.assertEqual(merged.num_strings, whole.num_strings)
+
+  def test_compute(self):
+    serial = corpus_stats.compute(self.corpus)
+    parallel = corpus_stats.compute(self.corpus, num_workers=2, shard_size=300)
+
+    self.assertEqual(
+        list(parallel.token_counts.items()), list(serial.token_counts.items()),
+        'Shards computed in parallel give the same token counts')
+    np.testing.assert_array_equal(parallel.length_counts, serial.length_counts,
+                                  'Shards computed in parallel give the same '
+                                  'length counts')
+
+  def test_fit_stats(self):
+    fitted = tok.Tokenizer(min_count=30, length_coverage=0.9).fit(self.corpus)
+    fitted_stats = tok.Tokenizer(
+        min_count=30, length_coverage=0.9).fit_stats(
+            corpus_stats.compute(self.corpus, num_workers=2, shard_size=300))
+
+    self.assertEqual(fitted_stats.to_json(), fitted.to_json(),
+                     'Fitting on statistics gives the same tokenizer')
+
+  def test_count_min_sketch(self):
+    tokens = ' '.join(self.corpus).split()
+    exact = collections.Counter(tokens)
+    sketch = corpus_stats.CountMinSketch(64, depth=3).update(tokens)
+    estimates = dict(zip(exact, sketch.estimate(list(exact))))
+
+    self.assertEqual(sketch.table.shape, (3, 64))
+    self.assertTrue(
+        all(estimates[token] >= count for token, count in exact.items()),
+        'Estimates never undercount')
+    self.assertTrue(
+        all(estimates[token] <= count + sketch.error_bound
+            for token, count in exact.items()),
+        'Estimates overcount by at most the error bound')
+    self.assertEqual(
+        list(corpus_stats.CountMinSketch(10_000).update(tokens).estimate(
+            list(exact))), list(exact.values()),
+        'Estimates without collisions are exact')
+
+    half = len(tokens) // 2
+    merged = corpus_stats.CountMinSketch(64, depth=3).update(tokens[:half])
+    merged.merge(corpus_stats.CountMinSketch(64, depth=3).update(tokens[half:]))
+    np.testing.assert_array_equal(merged.table, sketch.table,
+                                  'Merged sketches count every token')
+    with self.assertRaises(ValueError, msg='Only same-shape sketches merge'):
+      merged.merge(corpus_stats.CountMinSketch(32, depth=3))
+
+    self.assertEqual(
+        corpus_stats.CountMinSketch.from_memory_budget(4096, 2).table.nbytes,
+        4096, 'Sketches fill their memory budget')
+
+  def test_approximate(self):
+    exact = corpus_stats.compute(self.corpus)
+    words = [token for token, count in exact.token_counts.items()
+             if count >= 100]
+
+    approximate = corpus_stats.approximate(self.corpus, 100, memory_bytes=4096)
+    self.assertEqual(
+        list(approximate.token_counts), words,
+        ('A sketch without collisions keeps exactly the frequent tokens, in '
+         'order of first appearance'))
+    np.testing.assert_array_equal(approximate.length_counts,
+                                  exact.length_counts,
+                                  'Lengths are counted exactly')
+
+    small = corpus_stats.approximate(self.corpus, 100, memory_bytes=4 * 8)
+    self.assertEqual([token for token in small.token_counts if token in words],
+                     words, 'Every frequent token is kept')
+    self.assertTrue(
+        all(exact.token_counts[token] >= 100 - small.count_error
+            for token in small.token_counts),
+        'Infrequent tokens are only kept within the error bound')
+    with self.assertRaises(ValueError, msg='Approximate stats do not merge'):
+      corpus_stats.CorpusStats().merge(small)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,102 @@
+# Lint as: python3
+"""These tests ensure correctness for the input pipelines in dataset."""
+
+import unittest
+import numpy as np
+
+from amaranth.ml import dataset
+
+
+class TestDataset(unittest.TestCase):
+
+  def setUp(self):
+    self.inputs = np.arange(30, dtype=np.int32).reshape(10, 3)
+    self.calorie_classes = np.array([0, 1, 2, 0, 1, 2, 0, 1, 2, 0],
+                                    dtype=np.uint8)
+
+  def test_make_dataset(self):
+    indices = np.array([7, 2, 9, 0, 4])
+    batches = list(
+        dataset.make_dataset(
+            self.inputs,
+            self.calorie_classes,
+            indices,
+            batch_size=2,
+            chunk_size=3).as_numpy_iterator())
+    self.assertEqual([len(batch_inputs) for batch_inputs, _ in batches],
+                     [2, 2, 1], 'Examples are split into batches')
+    np.testing.assert_array_equal(
+        np.concatenate([batch_inputs for batch_inputs, _ in batches]),
+        self.inputs[indices],
+        'Unshuffled datasets contain the rows at indices, in order')
+    np.testing.assert_array_equal(
+        np.concatenate([batch_labels for _, batch_labels in batches]),
+        np.eye(3)[self.calorie_classes[indices]],
+        'Labels are one-hot-encoded calorie classes')
+
+  def test_make_shuffled_dataset(self):
+    batches = list(
+        dataset.make_dataset(
+            self.inputs,
+            self.calorie_classes,
+            batch_size=4,
+            shuffle=True,
+            seed=0,
+            chunk_size=4).as_numpy_iterator())
+    batch_inputs = np.concatenate([inputs for inputs, _ in batches])
+    batch_labels = np.concatenate([labels for _, labels in batches])
+    np.testing.assert_array_equal(
+        batch_inputs[np.argsort(batch_inputs[:, 0])], self.inputs,
+        'Shuffled datasets contain every row exactly once')
+    np.testing.assert_array_equal(
+        batch_labels.argmax(axis=-1),
+        self.calorie_classes[batch_inputs[:, 0] // 3],
+        'Shuffled datasets keep inputs with their labels')
+
+  def test_make_bucketed_dataset(self):
+    inputs = np.zeros((10, 6), dtype=np.int32)
+    lengths = np.array([1, 6, 2, 0, 1, 5, 2, 6, 1, 2], dtype=np.int32)
+    for idx, length in enumerate(lengths):
+      inputs[idx, :length] = idx + 1
+
+    trimmed = list(
+        dataset.make_dataset(
+            inputs,
+            self.calorie_classes,
+            batch_size=4,
+            chunk_size=3,
+            lengths=lengths).as_numpy_iterator())
+    self.assertEqual([batch_inputs.shape[1] for batch_inputs, _ in trimmed],
+                     [6, 6, 2], 'Batches are padded to their longest row')
+
+    bucketed = list(
+        dataset.make_dataset(
+            inputs,
+            self.calorie_classes,
+            batch_size=4,
+            chunk_size=3,
+            lengths=lengths,
+            bucket_boundaries=[2, 3]).as_numpy_iterator())
+    self.assertEqual(
+        sorted(batch_inputs.shape[1] for batch_inputs, _ in bucketed),
+        [1, 2, 6], 'Rows of similar lengths are batched together')
+
+    self.assertEqual(
+        sum(len(batch_inputs) for batch_inputs, _ in bucketed), 10,
+        'Bucketed datasets contain every row')
+    rows = {}
+    for batch_inputs, batch_labels in bucketed:
+      for row, label in zip(batch_inputs, batch_labels):
+        rows[row[0]] = (row, label.argmax())
+    for idx, length in enumerate(lengths):
+      if length:
+        row, label = rows[idx + 1]
+        np.testing.assert_array_equal(
+            row[:length], inputs[idx, :length],
+            'Bucketed rows keep their unpadded ids')
+        self.assertEqual(label, self.calorie_classes[idx],
+                         'Bucketed rows keep their labels')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,189 @@
+# Lint as: python3
+"""These tests ensure correctness for the FDC data loaders in ingest."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+
+from amaranth.ml import benchmark
+from amaranth.ml import ingest
+from amaranth.ml import instrumentation
+from amaranth.ml import lib
+from amaranth.ml import stage_cache
+
+
+def write_fdc_files(fdc_data_dir):
+  """Writes a small FDC-shaped dataset to fdc_data_dir."""
+
+  pd.DataFrame(
+      data={
+          'fdc_id': [1, 2, 3, 4, 5],
+          'data_type': ['branded_food'] * 4 + ['sr_legacy_food'],
+          'description': [
+              'Cheeseburger', 'Caesar Salad', None, 'Cheeseburger', 'Apple'
+          ],
+          'food_category_id': [1, 2, 3, 1, 4],
+          'publication_date': ['2020-04-01'] * 5,
+      }).to_csv(
+          os.path.join(fdc_data_dir, 'food.csv'), index=False)
+  pd.DataFrame(
+      data={
+          'id': [10, 11, 12, 13],
+          'name': ['Energy', 'Energy', 'Protein', 'Total lipid (fat)'],
+          'unit_name': ['KCAL', 'kJ', 'G', 'G'],
+          'nutrient_nbr': [208, 268, 203, 204],
+          'rank': [300, 400, 600, 800],
+      }).to_csv(
+          os.path.join(fdc_data_dir, 'nutrient.csv'), index=False)
+  pd.DataFrame(
+      data={
+          'id': range(12),
+          'fdc_id': [1, 1, 1, 2, 2, 3, 4, 4, 5, 5, 6, 1],
+          'nutrient_id': [10, 11, 12, 10, 13, 10, 10, 11, 12, 10, 10, 14],
+          'amount': [303, 1268, 15, 44, 2.1, 100, 303, 1268, 0.3, 52, 10, 1],
+          'data_points': [1] * 12,
+      }).to_csv(
+          os.path.join(fdc_data_dir, 'food_nutrient.csv'), index=False)
+
+
+def combine_fdc_files(fdc_data_dir):
+  """Builds the calorie table by reading and joining every FDC column."""
+
+  food = pd.read_csv(os.path.join(fdc_data_dir, 'food.csv'))
+  nutrient = pd.read_csv(os.path.join(
+      fdc_data_dir, 'nutrient.csv')).rename(columns={'id': 'nutrient_id'})
+  food_nutrient = pd.read_csv(os.path.join(fdc_data_dir, 'food_nutrient.csv'))
+  combined = lib.combine_dataframes('fdc_id', food, food_nutrient)
+  combined = lib.combine_dataframes('nutrient_id', combined, nutrient)
+
+  calorie_data = lib.get_calorie_data(combined, 'kcal')
+  calorie_data = calorie_data[ingest.CALORIE_DATA_COLUMNS]
+  return lib.clean_data(calorie_data).reset_index(drop=True)
+
+
+def decode_categoricals(dataframe):
+  """Converts a DataFrame's categorical columns back to their values."""
+
+  return dataframe.astype({
+      col: dataframe[col].cat.categories.dtype
+      for col in dataframe.select_dtypes('category').columns
+  })
+
+
+class TestIngest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.fdc_data_dir = self.tmp_dir.name
+    write_fdc_files(self.fdc_data_dir)
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_read_food_nutrient(self):
+    food_nutrient = ingest.read_food_nutrient(self.fdc_data_dir, [12])
+    self.assertEqual(
+        list(food_nutrient.columns), ['fdc_id', 'nutrient_id', 'amount'],
+        'Only the relevant columns of food_nutrient.csv are read')
+    self.assertEqual(
+        list(food_nutrient['fdc_id']), [1, 5],
+        'Only rows for the given nutrients are kept')
+
+  def test_line_byte_ranges(self):
+    path = os.path.join(self.fdc_data_dir, 'food_nutrient.csv')
+    header, byte_ranges = ingest.line_byte_ranges(path, 20)
+    with open(path, 'rb') as file:
+      contents = file.read()
+
+    self.assertEqual(header, contents.splitlines(keepends=True)[0],
+                     'The header line is returned separately')
+    self.assertEqual(
+        b''.join(contents[start:end] for start, end in byte_ranges),
+        contents[len(header):], 'The ranges cover the rest of the file')
+    for start, end in byte_ranges:
+      self.assertTrue(
+          contents[end - 1:end] == b'\n' or end == len(contents),
+          'Ranges end on line breaks')
+      self.assertGreaterEqual(end - start, 20,
+                              'Ranges are at least range_size bytes long')
+
+  def test_read_food_nutrient_parallel(self):
+    benchmark.generate_fdc_data(self.fdc_data_dir, 3000, seed=1)
+    energy_ids = [nutrient[0] for nutrient in benchmark.NUTRIENTS[:2]]
+    expected = ingest.read_food_nutrient(
+        self.fdc_data_dir, energy_ids, num_workers=1)
+
+    food_nutrient = ingest.read_food_nutrient(
+        self.fdc_data_dir, energy_ids, num_workers=2, range_size=4096)
+    pd.testing.assert_frame_equal(
+        food_nutrient, expected,
+        'Parsing byte ranges in parallel gives the same rows in the same order')
+
+    with mock.patch.object(ingest, 'BYTE_RANGE_SIZE', 4096):
+      calorie_data = ingest.build_calorie_data(self.fdc_data_dir, num_workers=2)
+    pd.testing.assert_frame_equal(
+        decode_categoricals(calorie_data), combine_fdc_files(self.fdc_data_dir),
+        'The parallel calorie table matches the joined FDC files')
+
+  def test_build_calorie_data(self):
+    calorie_data = ingest.build_calorie_data(self.fdc_data_dir)
+    self.assertTrue(
+        decode_categoricals(calorie_data).equals(
+            combine_fdc_files(self.fdc_data_dir)),
+        ('Building calorie data gives the same table as joining every column '
+         'of the FDC files'))
+    self.assertEqual(
+        list(calorie_data.select_dtypes('category').columns),
+        ['description', 'data_type', 'name', 'unit_name'],
+        'String columns are categorical')
+    self.assertEqual(
+        list(calorie_data['description']),
+        ['Cheeseburger', 'Caesar Salad', 'Apple'],
+        'Calorie data is cleaned of missing values and duplicates')
+
+  def test_build_calorie_data_metrics(self):
+    metrics = instrumentation.RunMetrics()
+    ingest.build_calorie_data(self.fdc_data_dir, metrics=metrics)
+    self.assertEqual(
+        metrics.counts, {
+            'calorie_food_nutrient_rows': 6,
+            'joined_rows': 5,
+            'missing_dropped_rows': 1,
+            'duplicate_dropped_rows': 1,
+            'cleaned_rows': 3
+        }, ('The rows left after each filter, and the rows each cleaning rule '
+            'drops, are counted'))
+    self.assertEqual(
+        [stage['name'] for stage in metrics.stages],
+        ['read_nutrient', 'read_food_nutrient', 'read_food', 'join', 'clean'],
+        'Each step is timed')
+
+  def test_load_calorie_data(self):
+    cache_dir = os.path.join(self.fdc_data_dir, 'cache')
+    calorie_data = ingest.load_calorie_data(self.fdc_data_dir, cache_dir)
+    self.assertEqual(
+        len(stage_cache.StageCache(cache_dir).entries()), 1,
+        'Loading calorie data caches it in cache_dir')
+    self.assertTrue(
+        ingest.load_calorie_data(self.fdc_data_dir,
+                                 cache_dir).equals(calorie_data),
+        'Loading cached calorie data gives the same table')
+
+    # Changing any of the FDC files invalidates the cache
+    with open(os.path.join(self.fdc_data_dir, 'food.csv'), 'a') as food_file:
+      food_file.write('7,branded_food,Hot Dog,1,2020-04-01\n')
+    with open(os.path.join(self.fdc_data_dir, 'food_nutrient.csv'),
+              'a') as food_nutrient_file:
+      food_nutrient_file.write('12,7,10,290,1\n')
+    calorie_data = ingest.load_calorie_data(self.fdc_data_dir, cache_dir)
+    self.assertEqual(
+        len(stage_cache.StageCache(cache_dir).entries()), 2,
+        'Changing the FDC files caches a new calorie table')
+    self.assertIn('Hot Dog', list(calorie_data['description']),
+                  'Changing the FDC files rebuilds the calorie table')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,130 @@
+# Lint as: python3
+"""These tests ensure correctness for the pipeline instrumentation."""
+
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from tensorflow import keras
+
+from amaranth.ml import instrumentation
+
+
+class TestRunMetrics(unittest.TestCase):
+
+  def test_disabled(self):
+    metrics = instrumentation.RunMetrics(enabled=False)
+
+    @metrics.timed()
+    def add(a, b):
+      return a + b
+
+    with metrics.stage('stage') as stage:
+      stage['rows'] = 10
+    metrics.count('rows', 10)
+
+    self.assertEqual(add(1, 2), 3, 'Timed functions still return')
+    self.assertEqual(metrics.stages, [], 'Disabled metrics record no stages')
+    self.assertEqual(metrics.counts, {}, 'Disabled metrics record no counts')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'metrics.json')
+      metrics.save(path)
+      self.assertFalse(os.path.exists(path), 'Disabled metrics are not saved')
+
+  def test_stages(self):
+    metrics = instrumentation.RunMetrics()
+
+    with metrics.stage('load') as stage:
+      stage['rows'] = 100
+      with metrics.stage('read'):
+        pass
+
+    @metrics.timed('square')
+    def square(x):
+      return x * x
+
+    self.assertEqual(square(3), 9, 'Timed functions still return')
+    self.assertEqual([stage['name'] for stage in metrics.stages],
+                     ['load/read', 'load', 'square'],
+                     'Stages are recorded as they finish, with nested names')
+
+    load = metrics.stages[1]
+    self.assertGreaterEqual(load['seconds'], metrics.stages[0]['seconds'],
+                            'Parent stages include their children')
+    self.assertAlmostEqual(load['rows_per_sec'], 100 / load['seconds'],
+                           msg='Throughput is recorded for stages with rows')
+    self.assertNotIn('rows_per_sec', metrics.stages[0],
+                     'Throughput is only recorded for stages with rows')
+    self.assertGreater(load['peak_rss_mb'], 0, 'Peak RSS is recorded')
+
+  def test_stage_exception(self):
+    metrics = instrumentation.RunMetrics()
+    with self.assertRaises(ValueError, msg='Exceptions propagate'):
+      with metrics.stage('fail'):
+        raise ValueError()
+    self.assertEqual(metrics.stages[0]['name'], 'fail',
+                     'Failed stages are still recorded')
+
+  def test_trace_memory(self):
+    metrics = instrumentation.RunMetrics(trace_memory=True)
+    try:
+      with metrics.stage('outer'):
+        with metrics.stage('inner'):
+          array = np.ones(4 * 2**20, dtype=np.uint8)
+          del array
+        with metrics.stage('small'):
+          pass
+    finally:
+      metrics.close()
+
+    inner, small, outer = metrics.stages
+    self.assertGreaterEqual(inner['peak_traced_mb'], 4,
+                            'Allocations during a stage are traced')
+    self.assertLess(small['peak_traced_mb'], 4,
+                    'Peaks are reset between stages')
+    self.assertGreaterEqual(outer['peak_traced_mb'], inner['peak_traced_mb'],
+                            "Parent stages' peaks include their children's")
+
+  def test_save(self):
+    metrics = instrumentation.RunMetrics(profile=True)
+    with metrics.stage('stage'):
+      sum(range(1000))
+    metrics.count('rows', np.int64(5))
+    metrics.close()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'metrics.json')
+      metrics.save(path)
+      with open(path) as file:
+        saved = json.load(file)
+      self.assertTrue(
+          os.path.exists(os.path.join(tmp_dir, 'metrics.prof')),
+          'Profiler stats are saved next to the metrics')
+
+    self.assertEqual(saved['counts'], {'rows': 5}, 'Counts are saved')
+    self.assertEqual([stage['name'] for stage in saved['stages']], ['stage'],
+                     'Stages are saved')
+    self.assertIn('total_seconds', saved, 'The total time is saved')
+    self.assertIn('function calls', metrics.profile_stats(),
+                  'Profiler stats are formatted')
+
+  def test_epoch_callback(self):
+    metrics = instrumentation.RunMetrics()
+    model = keras.Sequential([keras.Input((2,)), keras.layers.Dense(1)])
+    model.compile(optimizer='sgd', loss='mse')
+    model.fit(
+        np.zeros((8, 2)),
+        np.zeros((8, 1)),
+        epochs=2,
+        verbose=0,
+        callbacks=[metrics.epoch_callback()])
+
+    self.assertEqual([epoch['epoch'] for epoch in metrics.epochs], [0, 1],
+                     'Every epoch is recorded')
+    self.assertIn('loss', metrics.epochs[0], "Each epoch's logs are recorded")
+    self.assertGreater(metrics.epochs[0]['seconds'], 0, 'Epochs are timed')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,7 +1,9 @@
 # Lint as: python3
 """These tests ensure correctness for the helper functions in amaranth_lib."""
 
+import random
 import unittest
+from unittest import mock
 import numpy as np
 import pandas as pd
 
@@ -53,6 +55,85 @@ class TestAmaranthHelpers(unittest.TestCase):
               'val': [4, 5, 6],
           }))
 
+  def test_join_dataframes(self):
+    food = pd.DataFrame(data={
+        'fdc_id': [1, 2, 3, 4],
+        'description': ['Burger', 'Salad', 'Apple', 'Tea'],
+    })
+    food_nutrient = pd.DataFrame(data={
+        'fdc_id': [1, 1, 2, 3, 5],
+        'nutrient_id': [10, 11, 10, 12, 10],
+        'amount': [300.0, 15.0, 40.0, 0.3, 90.0],
+    })
+    nutrient = pd.DataFrame(data={
+        'nutrient_id': [10, 11, 12],
+        'name': ['Energy', 'Protein', 'Energy'],
+        'unit_name': ['KCAL', 'G', 'kJ'],
+    })
+    joins = [
+        amaranth.Join(food_nutrient, 'fdc_id'),
+        amaranth.Join(nutrient, 'nutrient_id')
+    ]
+
+    for how in amaranth.JOIN_MODES:
+      pd.testing.assert_frame_equal(
+          amaranth.join_dataframes(food, joins, how=how),
+          food.merge(food_nutrient, on='fdc_id',
+                     how=how).merge(nutrient, on='nutrient_id', how=how),
+          f'Joining gives the same table as merging ({how})')
+
+    # Each food has several nutrients, and each nutrient several units
+    units = pd.DataFrame(data={
+        'nutrient_id': [10, 11, 10],
+        'unit': ['KCAL', 'G', 'kJ'],
+    })
+    duplicate_joins = [
+        amaranth.Join(food_nutrient, 'fdc_id'),
+        amaranth.Join(units, 'nutrient_id')
+    ]
+    pd.testing.assert_frame_equal(
+        amaranth.join_dataframes(food, duplicate_joins, how='left'),
+        food.merge(food_nutrient, on='fdc_id',
+                   how='left').merge(units, on='nutrient_id', how='left'),
+        'Left joins onto duplicate keys keep the order of merging')
+    joined = amaranth.join_dataframes(food, duplicate_joins, how='inner')
+    merged = food.merge(food_nutrient, on='fdc_id').merge(units,
+                                                          on='nutrient_id')
+    self.assertEqual(
+        sorted(map(tuple, joined.to_numpy().tolist())),
+        sorted(map(tuple, merged.to_numpy().tolist())),
+        'Inner joins onto duplicate keys give the same rows as merging')
+    self.assertEqual(
+        list(zip(joined['description'], joined['unit'])),
+        [('Burger', 'KCAL'), ('Burger', 'kJ'), ('Burger', 'G'),
+         ('Salad', 'KCAL'), ('Salad', 'kJ')],
+        'Rows are ordered by base row, then by each joined row')
+
+    calorie_data = amaranth.join_dataframes(
+        food, [
+            amaranth.Join(food_nutrient, 'fdc_id'),
+            amaranth.Join(
+                nutrient,
+                'nutrient_id',
+                where=lambda df: amaranth.calorie_mask(df, 'kcal'))
+        ],
+        how='inner',
+        where=lambda df: df['description'] != 'Salad')
+    self.assertEqual(
+        list(calorie_data['description']), ['Burger'],
+        'Predicates filter each table before the inner join')
+    self.assertEqual(
+        list(calorie_data.columns),
+        ['fdc_id', 'description', 'nutrient_id', 'amount', 'name', 'unit_name'],
+        'Each key column appears once, with every other column in order')
+
+    with self.assertRaises(
+        ValueError, msg='Columns in more than one table raise a ValueError'):
+      amaranth.join_dataframes(food, [amaranth.Join(food, 'fdc_id')])
+    with self.assertRaises(
+        KeyError, msg='Keys missing from earlier tables raise a KeyError'):
+      amaranth.join_dataframes(food, [amaranth.Join(nutrient, 'nutrient_id')])
+
   def test_get_calorie_data(self):
     with self.assertRaises(
         KeyError,
@@ -73,6 +154,33 @@ class TestAmaranthHelpers(unittest.TestCase):
         ('Getting calorie data of a DataFrame should only return columns '
          'where \'name\' = \'Energy\' and \'unit_name\' = \'unit\''))
 
+  def test_map_values(self):
+    series = pd.Series(['kcal', 'KCAL', None, 'kJ'], index=[3, 1, 4, 2])
+    mapped = amaranth.map_values(series.astype('category'),
+                                 lambda values: values.str.lower() == 'kcal')
+    self.assertEqual(mapped.tolist(), [True, True, False, False],
+                     ('A categorical Series is mapped by its categories, with '
+                      'missing values mapped to False'))
+    self.assertEqual(mapped.index.tolist(), [3, 1, 4, 2],
+                     'The index of the mapped Series is kept')
+    self.assertTrue(
+        amaranth.map_values(series.astype('category'),
+                            lambda values: values.str.upper()).isna().iloc[2],
+        'Missing values map to NaN for non-boolean results')
+    self.assertEqual(
+        amaranth.map_values(series.iloc[[0, 1, 3]],
+                            lambda values: values == 'kJ').tolist(),
+        [False, False, True], 'Other Series are mapped directly')
+
+    dataframe = pd.DataFrame(data={
+        'name': ['Energy', 'Energy', 'Fat'],
+        'unit_name': ['kcal', 'kj', 'kcal'],
+    })
+    self.assertTrue(
+        amaranth.get_calorie_data(dataframe.astype('category'), 'KCAL').astype(
+            str).equals(amaranth.get_calorie_data(dataframe, 'kcal')),
+        'Calorie data of categorical columns matches that of string columns')
+
   def test_clean_data(self):
     self.assertTrue(
         amaranth.clean_data(
@@ -113,6 +221,59 @@ class TestAmaranthHelpers(unittest.TestCase):
                 'val': ['one'],
             })), 'Cleaning DataFrame removes NaN and duplicates')
 
+  def test_clean_data_subset(self):
+    dataframe = pd.DataFrame(
+        data={
+            'description': ['a', 'a', 'b', 'a', None],
+            'data_type': ['x', 'y', 'x', 'x', 'x'],
+            'amount': [1.0, 1.0, 2.0, 3.0, 1.0],
+        },
+        index=[5, 6, 7, 8, 9])
+    drop_counts = {}
+    cleaned = amaranth.clean_data(
+        dataframe, subset=['description', 'amount'], drop_counts=drop_counts)
+    self.assertEqual(cleaned.index.tolist(), [5, 7, 8],
+                     'Rows are duplicates if their subset columns are equal')
+    self.assertEqual(drop_counts, {
+        'missing': 1,
+        'duplicate': 1
+    }, 'The rows dropped by each rule are counted')
+    self.assertTrue(
+        amaranth.clean_data(dataframe.astype({'description': 'category'}),
+                            subset=['description', 'amount']).index.equals(
+                                cleaned.index),
+        'Categorical columns are compared by value')
+
+  def test_clean_chunks(self):
+    rng = np.random.default_rng(0)
+    dataframe = pd.DataFrame(
+        data={
+            'id': rng.integers(50, size=500),
+            'val': rng.choice(['one', 'two', None], size=500),
+        })
+    chunks = [dataframe.iloc[start:start + 64] for start in range(0, 500, 64)]
+
+    drop_counts = {}
+    streamed = pd.concat(
+        amaranth.clean_chunks(chunks, drop_counts=drop_counts))
+    expected_counts = {}
+    self.assertTrue(
+        streamed.equals(
+            amaranth.clean_data(dataframe, drop_counts=expected_counts)),
+        ('Cleaning chunks remembering every row is identical to cleaning them '
+         'combined'))
+    self.assertEqual(drop_counts, expected_counts,
+                     'Dropped rows are counted across chunks')
+
+    bounded = pd.concat(amaranth.clean_chunks(chunks, ['id'], max_seen=10))
+    self.assertGreater(
+        len(bounded), len(amaranth.clean_data(dataframe, ['id'])),
+        'Duplicates of forgotten rows are kept')
+    self.assertFalse(
+        any(chunk['id'].duplicated().any()
+            for chunk in amaranth.clean_chunks(chunks, ['id'], max_seen=10)),
+        'Duplicates within a chunk are always dropped')
+
   def test_add_calorie_labels(self):
     with self.assertRaises(
         KeyError,
@@ -166,6 +327,96 @@ class TestAmaranthHelpers(unittest.TestCase):
         ('Calories are correctly labeled for low, average, and high calorie '
          'dishes'))
 
+  def test_label_calories(self):
+    calorie_labels, calorie_classes = amaranth.label_calories([], 100, 200)
+    self.assertEqual(calorie_labels.shape, (0, 3),
+                     'Labelling no amounts yields an empty (0, 3) array')
+    self.assertEqual(
+        calorie_classes.shape, (0,),
+        'Labelling no amounts yields an empty array of classes')
+
+    calorie_labels, calorie_classes = amaranth.label_calories(
+        [0, 100, 200, 300, 400, 500, 600], 250, 350)
+    self.assertEqual(calorie_labels.dtype, np.uint8,
+                     'Calorie labels are a uint8 array')
+    np.testing.assert_array_equal(
+        calorie_labels, [[1, 0, 0], [1, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1],
+                         [0, 0, 1], [0, 0, 1]],
+        ('Calories are correctly labeled for low, average, and high calorie '
+         'dishes'))
+    np.testing.assert_array_equal(
+        calorie_classes, [0, 0, 0, 1, 2, 2, 2],
+        'Calorie classes are the index of each one-hot-encoded label')
+
+    _, calorie_classes = amaranth.label_calories([99, 100, 300, 301], 100, 300)
+    np.testing.assert_array_equal(
+        calorie_classes, [0, 1, 1, 2],
+        'Amounts equal to either threshold are labeled average calorie')
+
+    _, calorie_classes = amaranth.label_calories([0, 150, 300], 200, 100)
+    np.testing.assert_array_equal(
+        calorie_classes, [0, 0, 2],
+        'Amounts both below low and above high thresholds are low calorie')
+
+  def test_class_balance(self):
+    np.testing.assert_array_equal(
+        amaranth.class_balance(np.zeros((0, 3), dtype=np.uint8)), [0, 0, 0],
+        'Class balance of no labels is all zeroes')
+    calorie_labels, _ = amaranth.label_calories([0, 0, 150, 400], 100, 300)
+    np.testing.assert_array_equal(
+        amaranth.class_balance(calorie_labels), [0.5, 0.25, 0.25],
+        'Class balance is the fraction of labels in each class')
+
+  def test_split_indices(self):
+    splits = amaranth.split_indices(10, [0.6, 0.2, 0.2], seed=0)
+    self.assertEqual([len(split) for split in splits], [6, 2, 2],
+                     'Indices are split into subsets of the given fractions')
+    np.testing.assert_array_equal(
+        np.sort(np.concatenate(splits)), np.arange(10),
+        'Every index is in exactly one subset')
+    self.assertEqual([len(split) for split in amaranth.split_indices(
+        7, [0.5, 0.5])], [3, 4], 'Leftover indices go in the last subset')
+
+  def test_normalize_strings(self):
+    filters = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+    # Includes letters whose lowercase depends on their neighbors (Σ), or is
+    # longer than themselves (İ), and the chunk separator itself
+    alphabet = 'aBcXyZ 019' + filters + 'ΣσΑİÉßǅ\u0301\x00'
+    rng = random.Random(0)
+    strings = [
+        ''.join(rng.choices(alphabet, k=rng.randrange(12)))
+        for _ in range(2000)
+    ]
+
+    for string_filters in (filters, filters + '\x00', 'Σ'):
+      expected = [
+          ''.join([char for char in string.lower()
+                   if char not in string_filters])
+          for string in strings
+      ]
+      for num_workers in (1, 3):
+        with mock.patch.object(amaranth, 'NORMALIZE_CHUNK_SIZE', 7):
+          self.assertEqual(
+              amaranth.normalize_strings(strings, string_filters,
+                                         num_workers), expected,
+              ('Normalizing strings in chunks is identical to lowercasing and '
+               'filtering each one'))
+      self.assertEqual(
+          amaranth.normalize_strings(
+              [string for string in strings if '\x00' not in string],
+              string_filters), [
+                  normalized
+                  for string, normalized in zip(strings, expected)
+                  if '\x00' not in string
+              ], 'Chunks without the separator are normalized identically')
+
+    self.assertEqual(
+        amaranth.normalize_strings(
+            pd.Series(['A-B', 'C.D', 'A-B'], dtype='category'), filters),
+        ['ab', 'cd', 'ab'], 'Categorical strings are normalized')
+    self.assertEqual(amaranth.normalize_strings([], filters), [],
+                     'Normalizing no strings returns an empty list')
+
   def test_num_unique_words(self):
     self.assertEqual(
         amaranth.num_unique_words([]), 0, 'No unique words in an empty list')
@@ -190,6 +441,26 @@ class TestAmaranthHelpers(unittest.TestCase):
         amaranth.max_sequence_length([[1], [1, 2, 3], [1, 2, 3, 4, 5]]), 5,
         'Max sequence length of multiple lists is correct')
 
+  def test_percentile_sequence_length(self):
+    lengths = [2, 3, 2, 1, 40, 3, 2, 4, 2, 3]
+    self.assertEqual(
+        amaranth.percentile_sequence_length(lengths), 40,
+        'Full coverage is the max sequence length')
+    self.assertEqual(
+        amaranth.percentile_sequence_length(lengths, 0.9), 4,
+        'The longest 10% of sequences are ignored with 90% coverage')
+    self.assertEqual(
+        amaranth.percentile_sequence_length(lengths, 0.91), 40,
+        'Coverage is never rounded down')
+    self.assertEqual(
+        amaranth.percentile_sequence_length(lengths, 0.5), 2,
+        'Half of the sequences have at most 2 elements')
+    self.assertEqual(
+        amaranth.percentile_sequence_length([], 0.5), 0,
+        'Percentile sequence length of no sequences is 0')
+    with self.assertRaises(ValueError, msg='Coverage must be in (0, 1]'):
+      amaranth.percentile_sequence_length(lengths, 0)
+
   def test_pad_list(self):
     self.assertEqual(
         amaranth.pad_list([], 0, 0), [],
@@ -205,6 +476,38 @@ class TestAmaranthHelpers(unittest.TestCase):
         amaranth.pad_list([1, 2, 3], 1, 0), [1, 2, 3],
         'Existing list padded to smaller length should return original list')
 
+  def test_encode_corpus(self):
+    ids, lengths = amaranth.encode_corpus([], {'one': 1}, 3)
+    self.assertEqual(ids.shape, (0, 3),
+                     'Encoding an empty corpus yields an empty (0, 3) matrix')
+    self.assertEqual(lengths.shape, (0,),
+                     'Encoding an empty corpus yields no lengths')
+
+    ids, lengths = amaranth.encode_corpus(
+        ['one two', '', 'three  one four', 'two two two two two'], {
+            'one': 1,
+            'two': 2,
+            'three': 3,
+        }, 4)
+    self.assertEqual(ids.dtype, np.int32, 'Token ids are an int32 matrix')
+    np.testing.assert_array_equal(
+        ids, [[1, 2, 0, 0], [0, 0, 0, 0], [3, 1, 0, 0], [2, 2, 2, 2]],
+        ('Strings are encoded into rows of token ids, with unknown tokens '
+         'replaced with 0 and rows padded or truncated to max_len'))
+    np.testing.assert_array_equal(
+        lengths, [2, 0, 3, 4], 'Lengths are the number of unpadded ids')
+
+    out = np.full((2, 2), 7, dtype=np.int64)
+    ids, _ = amaranth.encode_corpus(['a b c', 'c'], {'a': 1},
+                                    2,
+                                    oov_value=9,
+                                    padding_value=8,
+                                    out=out)
+    self.assertIs(ids, out, 'Token ids are written into out if given')
+    np.testing.assert_array_equal(
+        out, [[1, 9], [9, 8]],
+        'Custom out-of-vocabulary and padding values are used')
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,97 @@
+# Lint as: python3
+"""These tests ensure the NumPy model matches the Keras model it exports."""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from tensorflow import keras
+
+from amaranth.ml import layers
+from amaranth.ml import numpy_model
+
+
+def build_keras_model(vocab_size, max_len):
+  """Builds a model with the same architecture as train.py's."""
+
+  model = keras.Sequential([
+      keras.layers.Embedding(
+          vocab_size + 1,
+          int((vocab_size + 1)**(1 / 4)),
+          input_length=max_len),
+      keras.layers.Flatten(),
+      keras.layers.Dense(32, activation='sigmoid'),
+      keras.layers.Dense(10, activation='sigmoid'),
+      keras.layers.Dense(3, activation='softmax'),
+  ])
+  model.build((None, max_len))
+
+  # Randomize every weight (including biases, which start at zero) so the
+  # parity check exercises all of them
+  rng = np.random.default_rng(0)
+  model.set_weights(
+      [rng.normal(size=weight.shape) for weight in model.get_weights()])
+
+  return model
+
+
+class TestNumpyModel(unittest.TestCase):
+
+  def setUp(self):
+    self.keras_model = build_keras_model(vocab_size=500, max_len=12)
+    self.inputs = np.random.default_rng(1).integers(
+        0, 501, size=(64, 12), dtype=np.int32)
+
+  def test_parity(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'model.npz')
+      numpy_model.export_keras_model(self.keras_model, path)
+      model = numpy_model.NumpyModel.load(path)
+
+    outputs = model.predict_on_batch(self.inputs)
+    self.assertEqual(outputs.dtype, np.float32, 'Outputs are float32')
+    np.testing.assert_allclose(
+        outputs,
+        self.keras_model.predict_on_batch(self.inputs),
+        atol=1e-5,
+        err_msg='The NumPy model predicts the same as the Keras model')
+
+  def test_average_pooling_parity(self):
+    keras_model = keras.Sequential([
+        keras.layers.Embedding(501, 4, mask_zero=True),
+        layers.MaskedAveragePooling1D(),
+        keras.layers.Dense(3, activation='softmax'),
+    ])
+    keras_model.build((None, 12))
+    rng = np.random.default_rng(2)
+    keras_model.set_weights(
+        [rng.normal(size=weight.shape) for weight in keras_model.get_weights()])
+    inputs = self.inputs.copy()
+    inputs[:, 6:] = 0
+    inputs[0] = 0
+
+    model = numpy_model.NumpyModel.from_keras_model(keras_model)
+    outputs = model.predict_on_batch(inputs)
+    np.testing.assert_allclose(
+        outputs,
+        keras_model.predict_on_batch(inputs),
+        atol=1e-5,
+        err_msg='The NumPy model averages the same as the Keras model')
+    self.assertFalse(
+        np.isnan(outputs).any(), 'Rows of only padding have no NaN outputs')
+    np.testing.assert_allclose(
+        model.predict_on_batch(inputs[:, :6]),
+        outputs,
+        atol=1e-6,
+        err_msg='Padding doesn\'t change averaged predictions')
+
+  def test_unsupported_layer(self):
+    model = keras.Sequential([keras.Input((4,)), keras.layers.Dropout(0.5)])
+    with self.assertRaises(
+        ValueError,
+        msg='Exporting a model with an unsupported layer raises a ValueError'):
+      numpy_model.NumpyModel.from_keras_model(model)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+# Lint as: python3
+"""These tests ensure correctness for the prediction cache."""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from amaranth.ml import classifier
+from amaranth.ml import prediction_cache
+from amaranth.ml import tokenizer as tok
+
+
+class FakeModel:
+  """Predicts the first token id of each input, modulo 3."""
+
+  def __init__(self):
+    self.num_predictions = 0
+
+  def predict_on_batch(self, inputs):
+    self.num_predictions += len(inputs)
+    return np.eye(3, dtype=np.float32)[inputs[:, 0] % 3]
+
+
+class TestPredictionCache(unittest.TestCase):
+
+  def test_get_put(self):
+    cache = prediction_cache.PredictionCache(max_size=2)
+    cache.put('a', np.array([1, 0, 0]))
+    cache.put('b', np.array([0, 1, 0]))
+    self.assertIsNone(cache.get('c'), 'Uncached keys return None')
+    np.testing.assert_array_equal(
+        cache.get('a'), [1, 0, 0], 'Cached keys return their prediction')
+    cache.put('c', np.array([0, 0, 1]))
+    self.assertIsNone(cache.get('b'),
+                      'The least recently used key is evicted when full')
+    self.assertEqual(len(cache), 2, 'The cache never exceeds max_size')
+    self.assertEqual((cache.hits, cache.misses), (1, 2),
+                     'Hits and misses are counted')
+
+  def test_save_load(self):
+    cache = prediction_cache.PredictionCache()
+    cache.put('cheese burger', np.array([0.1, 0.2, 0.7], dtype=np.float32))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'cache.json')
+      self.assertEqual(
+          len(prediction_cache.PredictionCache.load(path)), 0,
+          'Loading a cache that doesn\'t exist yields an empty cache')
+      cache.save(path)
+      loaded = prediction_cache.PredictionCache.load(path)
+
+    np.testing.assert_allclose(
+        loaded.get('cheese burger'), [0.1, 0.2, 0.7],
+        err_msg='Loaded caches have the same predictions as saved ones')
+
+  def test_model_id(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      tokenizer_path = os.path.join(tmp_dir, 'tokenizer.json')
+      tok.Tokenizer().fit(['cheese burger']).save(tokenizer_path)
+      model_dir = os.path.join(tmp_dir, 'model')
+      os.makedirs(os.path.join(model_dir, 'variables'))
+      for name, contents in (('saved_model.pb', 'graph'),
+                             ('variables/variables.data', 'weights')):
+        with open(os.path.join(model_dir, name), 'w') as file:
+          file.write(contents)
+      first_id = classifier.model_id(model_dir, tokenizer_path)
+
+      cache = prediction_cache.PredictionCache(model_id=first_id)
+      cache.put('cheese burger', np.array([0.1, 0.2, 0.7], dtype=np.float32))
+      path = os.path.join(tmp_dir, 'cache.json')
+      cache.save(path)
+
+      with open(os.path.join(model_dir, 'variables/variables.data'),
+                'w') as file:
+        file.write('retrained weights')
+      second_id = classifier.model_id(model_dir, tokenizer_path)
+      self.assertNotEqual(first_id, second_id,
+                          "Changing any of a model's files changes its id")
+
+      self.assertEqual(
+          len(prediction_cache.PredictionCache.load(path, model_id=first_id)),
+          1, 'Caches are loaded for the model they were saved for')
+      stale = prediction_cache.PredictionCache.load(path, model_id=second_id)
+      self.assertEqual(len(stale), 0,
+                       'Caches saved for another model are discarded')
+      self.assertEqual(stale.model_id, second_id)
+
+  def test_cached_classifier(self):
+    tokenizer = tok.Tokenizer().fit(['cheese burger', 'caesar salad'])
+    model = FakeModel()
+    cache = prediction_cache.PredictionCache()
+    calorie_classifier = classifier.CalorieClassifier(model, tokenizer, cache)
+
+    confidences = calorie_classifier.predict(
+        ['Cheese Burger', 'caesar salad', 'cheese, burger!'])
+    np.testing.assert_array_equal(
+        confidences, [[0, 1, 0], [1, 0, 0], [0, 1, 0]],
+        'Cached classifiers predict the same as the model')
+    self.assertEqual(
+        model.num_predictions, 2,
+        'Dish names with the same normalized tokens only run the model once')
+
+    calorie_classifier.predict(['CHEESE BURGER', 'caesar salad'])
+    self.assertEqual(model.num_predictions, 2,
+                     'Cached dish names skip the model entirely')
+    self.assertEqual((cache.hits, cache.misses), (2, 3),
+                     'Cache hits and misses are counted per dish name')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,137 @@
+# Lint as: python3
+"""These tests ensure preprocessing reuses exactly the stages it can."""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from amaranth.ml import ingest
+from amaranth.ml import instrumentation
+from amaranth.ml import lib
+from amaranth.ml import preprocess
+from amaranth.ml import tokenizer as tok
+from amaranth.ml.test_ingest import write_fdc_files
+
+
+class TestPreprocess(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.fdc_data_dir = self.tmp_dir.name
+    self.cache_dir = os.path.join(self.fdc_data_dir, 'cache')
+    write_fdc_files(self.fdc_data_dir)
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def preprocess(self,
+                 low_calorie_threshold=100,
+                 min_count=1,
+                 length_coverage=1.0,
+                 vocab_memory_bytes=None,
+                 num_hash_buckets=None):
+    metrics = instrumentation.RunMetrics()
+    preprocessed = preprocess.preprocess(
+        self.fdc_data_dir,
+        self.cache_dir,
+        low_calorie_threshold=low_calorie_threshold,
+        high_calorie_threshold=300,
+        min_count=min_count,
+        length_coverage=length_coverage,
+        vocab_memory_bytes=vocab_memory_bytes,
+        num_hash_buckets=num_hash_buckets,
+        metrics=metrics)
+    hits = {
+        name[:-len('_cache_hit')]
+        for name, count in metrics.counts.items()
+        if name.endswith('_cache_hit') and count
+    }
+    return preprocessed, hits
+
+  def test_preprocess(self):
+    preprocessed, hits = self.preprocess()
+    self.assertEqual(hits, set(), 'Nothing is cached at first')
+
+    calorie_data = ingest.build_calorie_data(self.fdc_data_dir)
+    tokenizer = tok.Tokenizer().fit(calorie_data['description'])
+    _, calorie_classes = lib.label_calories(calorie_data['amount'], 100, 300)
+    self.assertEqual(preprocessed.tokenizer.vocab, tokenizer.vocab,
+                     'The tokenizer is fit to the dish names')
+    self.assertEqual(preprocessed.unique_words, 4,
+                     'Unique words are counted')
+    np.testing.assert_array_equal(
+        preprocessed.inputs,
+        tokenizer.encode_batch(calorie_data['description'])[0],
+        err_msg='Dish names are encoded')
+    np.testing.assert_array_equal(
+        preprocessed.input_lengths, [1, 2, 1],
+        err_msg='Encoded lengths are saved')
+    np.testing.assert_array_equal(
+        preprocessed.calorie_classes,
+        calorie_classes,
+        err_msg='Dishes are labelled')
+    self.assertIsInstance(preprocessed.inputs, np.memmap,
+                          'Inputs are memory-mapped')
+
+    cached, hits = self.preprocess()
+    # calorie_data isn't a hit because it isn't even loaded
+    self.assertEqual(hits, {'calorie_classes', 'tokenizer', 'inputs'},
+                     'Every stage is reused when nothing changes')
+    np.testing.assert_array_equal(
+        cached.inputs, preprocessed.inputs, err_msg='Cached inputs are loaded')
+    np.testing.assert_array_equal(
+        cached.tokenizer.length_counts, [0, 2, 1],
+        err_msg='The cached tokenizer keeps its length counts')
+
+  def test_config_changes(self):
+    self.preprocess()
+
+    relabelled, hits = self.preprocess(low_calorie_threshold=50)
+    self.assertEqual(
+        hits, {'calorie_data', 'tokenizer', 'inputs'},
+        'Changing the thresholds only relabels the dishes')
+    np.testing.assert_array_equal(
+        relabelled.calorie_classes, [2, 0, 1],
+        err_msg='Dishes are relabelled with the new thresholds')
+
+    _, hits = self.preprocess(min_count=2)
+    self.assertEqual(
+        hits, {'calorie_data', 'calorie_classes'},
+        'Changing the minimum token count refits the tokenizer')
+
+    truncated, hits = self.preprocess(length_coverage=0.5)
+    self.assertEqual(
+        hits, {'calorie_data', 'calorie_classes'},
+        'Changing the length coverage refits the tokenizer')
+    self.assertEqual(truncated.inputs.shape, (3, 1),
+                     'Inputs are truncated to the covered length')
+
+    sketched, hits = self.preprocess(vocab_memory_bytes=4096)
+    self.assertEqual(
+        hits, {'calorie_data', 'calorie_classes'},
+        'Counting tokens approximately refits the tokenizer')
+    self.assertEqual(sketched.tokenizer.vocab,
+                     self.preprocess()[0].tokenizer.vocab,
+                     'A large enough sketch gives the exact vocabulary')
+
+    hashed, hits = self.preprocess(num_hash_buckets=64)
+    self.assertEqual(
+        hits, {'calorie_data', 'calorie_classes'},
+        'Hashing tokens refits the tokenizer')
+    calorie_data = ingest.build_calorie_data(self.fdc_data_dir)
+    np.testing.assert_array_equal(
+        hashed.inputs,
+        tok.Tokenizer(num_buckets=64).fit(
+            calorie_data['description']).encode_batch(
+                calorie_data['description'])[0],
+        err_msg='Dish names are encoded as hashed n-grams')
+
+    with open(os.path.join(self.fdc_data_dir, 'food.csv'), 'a') as food_file:
+      food_file.write('7,branded_food,Hot Dog,1,2020-04-01\n')
+    _, hits = self.preprocess()
+    self.assertEqual(hits, set(), 'Changing the FDC files recomputes everything')
+
+
+if __name__ == '__main__':
+  unittest.main()
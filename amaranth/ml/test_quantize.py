@@ -0,0 +1,178 @@
+# Lint as: python3
+"""These tests ensure quantized models stay close to the float model."""
+
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from amaranth.ml import numpy_model
+from amaranth.ml import quantize
+from amaranth.ml.test_numpy_model import build_keras_model
+
+
+class TestQuantize(unittest.TestCase):
+
+  def setUp(self):
+    self.keras_model = build_keras_model(vocab_size=500, max_len=12)
+    self.float_model = numpy_model.NumpyModel.from_keras_model(
+        self.keras_model)
+    self.inputs = np.random.default_rng(1).integers(
+        0, 501, size=(256, 12), dtype=np.int32)
+    self.float_outputs = self.float_model.predict_on_batch(self.inputs)
+
+  def test_quantize_affine(self):
+    weights = np.random.default_rng(2).normal(size=(100, 7)).astype(np.float32)
+    quantized, scale, min_value = quantize.quantize_affine(weights)
+
+    self.assertEqual(quantized.dtype, np.uint8, 'Weights are quantized to uint8')
+    self.assertEqual(quantized.min(), 0, 'The min weight is quantized to 0')
+    self.assertEqual(quantized.max(), 255, 'The max weight is quantized to 255')
+    self.assertLessEqual(
+        np.abs(quantized * scale + min_value - weights).max(),
+        scale / 2 + 1e-6, 'Each weight is off by at most half a step')
+
+    constant, scale, min_value = quantize.quantize_affine(np.full(4, 3.0))
+    np.testing.assert_array_equal(
+        constant * scale + min_value, np.full(4, 3.0),
+        'Constant weights are quantized exactly')
+
+  def test_quantize_embedding(self):
+    for dtype in quantize.EMBEDDING_DTYPES:
+      model = quantize.quantize_embedding(self.float_model, dtype)
+      self.assertEqual(model.weights[0][0].dtype, np.dtype(dtype),
+                       f'The embedding is stored as {dtype}')
+
+      with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.npz')
+        model.save(path)
+        model = numpy_model.NumpyModel.load(path)
+
+      outputs = model.predict_on_batch(self.inputs)
+      self.assertEqual(outputs.dtype, np.float32, 'Outputs are float32')
+      np.testing.assert_allclose(
+          outputs,
+          self.float_outputs,
+          atol=0.05,
+          err_msg=f'The {dtype} embedding predicts close to the float model')
+
+    self.assertEqual(self.float_model.weights[0][0].dtype, np.float32,
+                     'The float model is not modified')
+    with self.assertRaises(ValueError, msg='Unknown dtypes are rejected'):
+      quantize.quantize_embedding(self.float_model, 'int4')
+
+  def test_tflite(self):
+    for calibration_inputs in (None, self.inputs[:100]):
+      model = quantize.TfliteModel(
+          quantize.convert_to_tflite(self.keras_model, calibration_inputs))
+
+      outputs = model.predict_on_batch(self.inputs)
+      self.assertEqual(outputs.shape, self.float_outputs.shape,
+                       'The TFLite model outputs confidences for each class')
+      self.assertGreater(
+          np.mean(outputs.argmax(axis=-1) ==
+                  self.float_outputs.argmax(axis=-1)), 0.9,
+          'The TFLite model mostly agrees with the float model')
+
+  def test_evaluate_model(self):
+    calorie_classes = self.float_outputs.argmax(axis=-1)
+    calorie_classes[:10] = (calorie_classes[:10] + 1) % 3
+
+    accuracy, confusion = quantize.evaluate_model(
+        self.float_model, self.inputs, calorie_classes, batch_size=100)
+    self.assertAlmostEqual(accuracy, 246 / 256,
+                           msg='Accuracy counts matching classes')
+    self.assertEqual(confusion.sum(), 256, 'Every example is counted once')
+    np.testing.assert_array_equal(
+        confusion.sum(axis=1),
+        np.bincount(calorie_classes, minlength=3),
+        err_msg='Rows of the confusion matrix are actual classes')
+
+  def test_export_quantized_models(self):
+    calorie_classes = self.float_outputs.argmax(axis=-1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      report = quantize.export_quantized_models(
+          self.keras_model,
+          tmp_dir,
+          self.inputs,
+          calorie_classes,
+          calibration_indices=np.arange(128),
+          test_indices=np.arange(128, 256))
+
+      self.assertEqual([variant['name'] for variant in report], [
+          'float32', 'numpy_float16_embedding', 'numpy_uint8_embedding',
+          'tflite_dynamic_range', 'tflite_int8'
+      ], 'Every variant is reported, starting with the float model')
+      for variant in report:
+        self.assertTrue(
+            os.path.exists(variant['path']), f'{variant["name"]} is saved')
+      self.assertEqual(report[0]['accuracy'], 1.0,
+                       'The float model is evaluated on the test set')
+      self.assertLess(report[2]['size_bytes'], report[0]['size_bytes'],
+                      'Quantizing the embedding shrinks the model')
+      with open(os.path.join(tmp_dir, 'quantization_report.json')) as file:
+        self.assertEqual(json.load(file), report, 'The report is saved')
+
+    self.assertIn('tflite_int8', quantize.format_report(report),
+                  'Every variant is formatted')
+
+  def test_quantize_tfjs_model(self):
+    rng = np.random.default_rng(3)
+    weights = {
+        'dense/kernel': rng.normal(size=(6, 3)).astype('<f4'),
+        'embedding/embeddings': rng.normal(size=(20, 2)).astype('<f4'),
+    }
+    model_json = {
+        'format': 'layers-model',
+        'weightsManifest': [{
+            'paths': ['group1-shard1of2.bin', 'group1-shard2of2.bin'],
+            'weights': [{
+                'name': name,
+                'shape': list(weight.shape),
+                'dtype': 'float32'
+            } for name, weight in weights.items()]
+        }]
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      data = b''.join(weight.tobytes() for weight in weights.values())
+      with open(os.path.join(tmp_dir, 'model.json'), 'w') as file:
+        json.dump(model_json, file)
+      with open(os.path.join(tmp_dir, 'group1-shard1of2.bin'), 'wb') as file:
+        file.write(data[:50])
+      with open(os.path.join(tmp_dir, 'group1-shard2of2.bin'), 'wb') as file:
+        file.write(data[50:])
+
+      output_dir = os.path.join(tmp_dir, 'quantized')
+      float_size, quantized_size = quantize.quantize_tfjs_model(
+          tmp_dir, output_dir)
+      with open(os.path.join(output_dir, 'model.json')) as file:
+        manifest, = json.load(file)['weightsManifest']
+      with open(os.path.join(output_dir, manifest['paths'][0]), 'rb') as file:
+        quantized_data = file.read()
+
+    self.assertEqual(float_size, len(data), 'Every shard is read')
+    self.assertEqual(quantized_size, 6 * 3 * 4 + 20 * 2,
+                     'Only the embedding is quantized')
+    self.assertEqual(len(quantized_data), quantized_size, 'Weights are saved')
+
+    kernel_spec, embedding_spec = manifest['weights']
+    self.assertNotIn('quantization', kernel_spec, 'Dense layers are unchanged')
+    self.assertEqual(
+        np.frombuffer(quantized_data[:72], dtype='<f4').tolist(),
+        weights['dense/kernel'].ravel().tolist(), 'Dense layers are unchanged')
+
+    quantization = embedding_spec['quantization']
+    self.assertEqual(quantization['dtype'], 'uint8', 'The embedding is uint8')
+    np.testing.assert_allclose(
+        np.frombuffer(quantized_data[72:], dtype=np.uint8) *
+        quantization['scale'] + quantization['min'],
+        weights['embedding/embeddings'].ravel(),
+        atol=quantization['scale'] / 2 + 1e-6,
+        err_msg='The embedding dequantizes close to its float weights')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,195 @@
+# Lint as: python3
+"""These tests ensure model versions are published, loaded, and switched."""
+
+import concurrent.futures
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import numpy as np
+
+from amaranth.ml import numpy_model
+from amaranth.ml import registry
+from amaranth.ml import tokenizer as tok
+
+
+def write_model(version_dir, high_calorie_bias):
+  """Writes a tiny model that always favors one class, and its tokenizer."""
+
+  model = numpy_model.NumpyModel(
+      [{'type': 'embedding', 'name': 'embedding', 'mask_zero': True},
+       {'type': 'average_pooling', 'name': 'pooling'},
+       {'type': 'dense', 'name': 'dense', 'activation': 'softmax'}],
+      [[np.ones((4, 2), dtype=np.float32)], [],
+       [np.zeros((2, 3), dtype=np.float32),
+        np.array([0, 0, high_calorie_bias], dtype=np.float32)]])
+  model.save(os.path.join(version_dir, registry.NUMPY_MODEL_FILE))
+  tok.Tokenizer().fit(['cheese burger', 'salad']).save(
+      os.path.join(version_dir, registry.TOKENIZER_FILE))
+
+
+class TestRegistry(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.registry = registry.ModelRegistry(
+        os.path.join(self.tmp_dir.name, 'registry'))
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def publish(self, high_calorie_bias, **kwargs):
+    return self.registry.publish(
+        lambda version_dir: write_model(version_dir, high_calorie_bias),
+        {'high_calorie_bias': high_calorie_bias}, **kwargs)
+
+  def test_publish(self):
+    self.assertEqual(self.registry.versions(), [])
+    self.assertIsNone(self.registry.current_version(),
+                      'Empty registries have no active version')
+
+    self.assertEqual(self.publish(1), 'v0001')
+    self.assertEqual(self.publish(-1, activate=False), 'v0002',
+                     'Versions are numbered in order')
+    self.assertEqual(self.registry.versions(), ['v0001', 'v0002'])
+    self.assertEqual(self.registry.current_version(), 'v0001',
+                     'Versions are only activated if asked to')
+
+    metadata = self.registry.metadata()
+    self.assertEqual(
+        (metadata['version'], metadata['high_calorie_bias']), ('v0001', 1),
+        "Metadata of the active version is saved with the version's name")
+    self.assertIn('created', metadata)
+    self.assertEqual(self.registry.metadata('v0002')['high_calorie_bias'], -1)
+
+    def fail(version_dir):
+      write_model(version_dir, 0)
+      raise RuntimeError('Interrupted')
+
+    with self.assertRaises(RuntimeError):
+      self.registry.publish(fail)
+    self.assertEqual(
+        sorted(os.listdir(self.registry.registry_dir)),
+        ['CURRENT', 'v0001', 'v0002'],
+        'Failed publishes leave no partially written version behind')
+
+  def test_activate(self):
+    self.publish(1)
+    self.publish(-1)
+    self.assertEqual(self.registry.current_version(), 'v0002',
+                     'Publishing activates the new version')
+
+    self.registry.activate('v0001')
+    self.assertEqual(self.registry.current_version(), 'v0001',
+                     'Older versions can be switched back to')
+    with self.assertRaises(ValueError, msg='Unknown versions are rejected'):
+      self.registry.activate('v0003')
+
+    confidences = self.registry.load_classifier().predict(['cheese'])
+    self.assertEqual(confidences.argmax(), 2,
+                     'The active version is loaded')
+    confidences = self.registry.load_classifier('v0002').predict(['cheese'])
+    self.assertEqual(confidences.argmax(), 0,
+                     'Other versions can be loaded by name')
+
+  def test_lazy_classifier(self):
+    self.publish(1)
+    lazy = registry.LazyClassifier(self.registry, cache_size=10)
+    self.assertFalse(lazy.loaded, 'Nothing is loaded until the first predict')
+
+    self.assertEqual(lazy.predict(['cheese']).argmax(), 2)
+    self.assertEqual((lazy.loaded, lazy.version), (True, 'v0001'))
+    first = lazy.get()
+    self.assertIs(lazy.get(), first, 'The loaded classifier is reused')
+    self.assertFalse(lazy.refresh(),
+                     'Refreshing without a new version reloads nothing')
+
+    self.publish(-1)
+    self.assertEqual(lazy.predict(['cheese']).argmax(), 2,
+                     'The loaded version keeps serving until refreshed')
+    self.assertTrue(lazy.refresh())
+    self.assertEqual(lazy.version, 'v0002')
+    self.assertEqual(
+        lazy.predict(['cheese']).argmax(), 0,
+        "Cached predictions of the old version aren't returned")
+
+    watching = registry.LazyClassifier(self.registry, check_seconds=0)
+    watching.predict(['cheese'])
+    self.registry.activate('v0001')
+    watching.predict(['cheese'])
+    watching._refresh_thread.join()  # pylint: disable=protected-access
+    self.assertEqual(watching.predict(['cheese']).argmax(), 2,
+                     'Predictions switch to newly activated versions')
+
+  def test_slow_switch(self):
+    self.publish(1)
+    lazy = registry.LazyClassifier(self.registry, check_seconds=0)
+    lazy.get()
+    self.publish(-1)
+
+    loading = threading.Event()
+    finish_loading = threading.Event()
+    load = lazy._load  # pylint: disable=protected-access
+
+    def slow_load(version):
+      loading.set()
+      finish_loading.wait(10)
+      return load(version)
+
+    with mock.patch.object(lazy, '_load', slow_load), \
+        concurrent.futures.ThreadPoolExecutor(1) as executor:
+      lazy.predict(['cheese'])
+      self.assertTrue(loading.wait(5))
+      self.assertEqual(
+          executor.submit(lazy.predict, ['cheese']).result(timeout=5).argmax(),
+          2, 'The old version keeps serving while the new one loads')
+      finish_loading.set()
+      lazy._refresh_thread.join()  # pylint: disable=protected-access
+    self.assertEqual(lazy.version, 'v0002',
+                     'The new version is swapped in once loaded')
+
+  def test_failed_switch(self):
+    self.publish(1)
+    lazy = registry.LazyClassifier(self.registry)
+    lazy.get()
+    self.publish(-1)
+
+    with mock.patch.object(lazy, '_load', side_effect=OSError('Corrupt')), \
+        self.assertLogs(level='ERROR'):
+      self.assertFalse(lazy.refresh(), 'Failed loads are logged')
+    self.assertEqual(lazy.version, 'v0001',
+                     'The old version is kept if the new one fails to load')
+    self.assertEqual(lazy.predict(['cheese']).argmax(), 2)
+
+  def test_concurrent_switch(self):
+    self.publish(1)
+    self.publish(-1, activate=False)
+    lazy = registry.LazyClassifier(self.registry, check_seconds=0)
+
+    def predict(idx):
+      if idx == 50:
+        self.registry.activate('v0002')
+      return lazy.predict(['cheese burger'])
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+      predictions = list(executor.map(predict, range(100)))
+    self.assertTrue(
+        all(len(prediction) == 1 for prediction in predictions),
+        'Every prediction succeeds while switching versions')
+    lazy.refresh()
+    self.assertEqual(lazy.version, 'v0002')
+
+  def test_get_classifier(self):
+    registry_dir = self.registry.registry_dir
+    classifier = registry.get_classifier(registry_dir)
+    self.assertIs(
+        registry.get_classifier(os.path.join(registry_dir, '')), classifier,
+        'Each registry directory has one classifier per process')
+    self.assertIsNot(
+        registry.get_classifier(os.path.join(self.tmp_dir.name, 'other')),
+        classifier)
+
+
+if __name__ == '__main__':
+  unittest.main()
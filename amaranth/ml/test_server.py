@@ -0,0 +1,141 @@
+# Lint as: python3
+"""These tests ensure correctness for the prediction server."""
+
+import concurrent.futures
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import numpy as np
+
+from amaranth.ml import server
+
+
+class FakeClassifier:
+  """Classifies dish names by their length, modulo 3, failing on 'fail'."""
+
+  def __init__(self):
+    self.batch_sizes = []
+
+  def predict(self, dish_names):
+    if 'fail' in dish_names:
+      raise RuntimeError('model failed')
+    self.batch_sizes.append(len(dish_names))
+    return np.eye(3, dtype=np.float32)[[len(name) % 3 for name in dish_names]]
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+  def test_submit(self):
+    fake_classifier = FakeClassifier()
+    batcher = server.MicroBatcher(
+        fake_classifier.predict, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit('x' * i) for i in range(10)]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    for i, result in enumerate(results):
+      np.testing.assert_array_equal(
+          result,
+          np.eye(3)[i % 3], 'Each future gets its own dish\'s prediction')
+    self.assertEqual(
+        fake_classifier.batch_sizes, [4, 4, 2],
+        'Pending dishes are coalesced into batches of at most max_batch_size')
+
+  def test_submit_error(self):
+
+    def predict(dish_names):
+      raise RuntimeError('model failed')
+
+    batcher = server.MicroBatcher(predict)
+    with self.assertRaises(
+        RuntimeError, msg='Errors while predicting are raised by futures'):
+      batcher.submit('dish').result(timeout=5)
+    batcher.close()
+
+
+class TestPredictionServer(unittest.TestCase):
+
+  def setUp(self):
+    self.fake_classifier = FakeClassifier()
+    self.server = server.PredictionServer(('127.0.0.1', 0),
+                                          self.fake_classifier.predict,
+                                          max_batch_size=8,
+                                          max_wait_ms=50)
+    self.url = 'http://{}:{}'.format(*self.server.server_address[:2])
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.thread.join()
+
+  def request(self, path, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    with urllib.request.urlopen(self.url + path, data=data, timeout=5) as resp:
+      return json.loads(resp.read())
+
+  def test_predict(self):
+    prediction = self.request('/predict', {'dish_name': 'abcd'})
+    self.assertEqual(prediction['dish_name'], 'abcd',
+                     'Predictions include the dish name')
+    self.assertEqual(prediction['label'], 'Average Calorie',
+                     'Predictions are labeled with their most confident class')
+    self.assertEqual(prediction['confidence']['Average Calorie'], 1.0,
+                     'Predictions include the confidence of each class')
+
+    predictions = self.request('/predict', {'dish_names': ['a', 'ab', 'abc']})
+    self.assertEqual(
+        [prediction['label'] for prediction in predictions['predictions']],
+        ['Average Calorie', 'High Calorie', 'Low Calorie'],
+        'Multiple dish names can be classified in one request')
+
+    with self.assertRaises(
+        urllib.error.HTTPError,
+        msg='Requests without dish names are rejected'):
+      self.request('/predict', {'name': 'abc'})
+    for body in ({'dish_names': 'abc'}, ['abc'], 'abc'):
+      with self.assertRaises(urllib.error.HTTPError) as context:
+        self.request('/predict', body)
+      self.assertEqual(context.exception.code, 400,
+                       f'Malformed request {body!r} is rejected')
+
+  def test_failed_requests(self):
+    self.request('/predict', {'dish_name': 'abc'})
+    for body in ({'name': 'abc'}, {'dish_name': 'fail'}):
+      with self.assertRaises(urllib.error.HTTPError):
+        self.request('/predict', body)
+
+    metrics = self.request('/metrics')
+    self.assertEqual(
+        (metrics['num_requests'], metrics['num_errors']), (3, 2),
+        'Failed requests are counted, and their latencies recorded')
+
+  def test_concurrent_requests(self):
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+      predictions = list(
+          executor.map(lambda i: self.request('/predict', {'dish_name': 'x' * i}),
+                       range(32)))
+
+    self.assertEqual([prediction['dish_name'] for prediction in predictions],
+                     ['x' * i for i in range(32)],
+                     'Every concurrent request gets its own prediction')
+    self.assertLess(
+        len(self.fake_classifier.batch_sizes), 32,
+        'Concurrent requests are coalesced into fewer calls to the model')
+
+    metrics = self.request('/metrics')
+    self.assertEqual(metrics['num_requests'], 32,
+                     'Metrics count every request')
+    self.assertEqual(
+        sum(int(size) * cnt
+            for size, cnt in metrics['batch_size_histogram'].items()), 32,
+        'The batch size histogram accounts for every dish')
+    self.assertGreater(metrics['latency_ms']['p99'], 0,
+                       'Metrics include latency percentiles')
+
+
+if __name__ == '__main__':
+  unittest.main()
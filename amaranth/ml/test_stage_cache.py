@@ -0,0 +1,113 @@
+# Lint as: python3
+"""These tests ensure correctness for the preprocessing stage cache."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from amaranth.ml import instrumentation
+from amaranth.ml import stage_cache
+
+
+def write(value, path):
+  with open(path, 'w') as file:
+    file.write(value)
+
+
+def read(path):
+  with open(path) as file:
+    return file.read()
+
+
+class TestStageCache(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.cache = stage_cache.StageCache(
+        os.path.join(self.tmp_dir.name, 'cache'))
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def memoize(self, stage, key, value):
+    return self.cache.memoize(
+        stage, key, '.txt', compute=lambda: value, save=write, load=read)
+
+  def test_fingerprint(self):
+    self.assertEqual(
+        stage_cache.fingerprint('a', 1, [2.0]),
+        stage_cache.fingerprint('a', 1, [2.0]), 'Keys are deterministic')
+    self.assertNotEqual(
+        stage_cache.fingerprint('a', 1), stage_cache.fingerprint('a', 2),
+        'Keys depend on every part')
+
+  def test_file_digest(self):
+    path = os.path.join(self.tmp_dir.name, 'data.csv')
+    with open(path, 'w') as file:
+      file.write('a,b\n1,2\n')
+
+    digest = self.cache.file_digest([path])
+    with mock.patch.object(stage_cache, 'hash_files') as hash_files:
+      self.assertEqual(
+          self.cache.file_digest([path]), digest,
+          'Unchanged files have the same digest')
+      hash_files.assert_not_called()
+
+    with open(path, 'a') as file:
+      file.write('3,4\n')
+    self.assertNotEqual(
+        self.cache.file_digest([path]), digest,
+        'Changed files are hashed again')
+
+  def test_memoize(self):
+    self.cache.metrics = instrumentation.RunMetrics()
+
+    self.assertEqual(
+        self.memoize('stage', 'key', 'computed'), 'computed',
+        'Missing outputs are computed')
+    self.assertEqual(self.cache.metrics.counts, {'stage_cache_hit': 0},
+                     'Cache misses are counted')
+    self.assertEqual(
+        self.memoize('stage', 'key', 'recomputed'), 'computed',
+        'Cached outputs are loaded')
+    self.assertEqual(self.cache.metrics.counts, {'stage_cache_hit': 1},
+                     'Cache hits are counted')
+    self.assertEqual(
+        self.memoize('stage', 'other key', 'recomputed'), 'recomputed',
+        'Outputs with other keys are computed')
+
+  def test_failed_write(self):
+    with self.assertRaises(ValueError, msg='Exceptions propagate'):
+      with self.cache.writing('stage', 'key', '.txt') as tmp_path:
+        with open(tmp_path, 'w') as file:
+          file.write('partial')
+        raise ValueError()
+
+    self.assertFalse(
+        self.cache.has('stage', 'key', '.txt'),
+        'Failed writes are not cached')
+    self.assertEqual(
+        os.listdir(self.cache.cache_dir), [],
+        'Failed writes leave no temporary files behind')
+
+  def test_invalidate(self):
+    self.memoize('a', 'key', 'a')
+    self.memoize('b', 'key', 'b')
+    self.memoize('b', 'other key', 'b')
+    self.cache.file_digest([self.cache.path('a', 'key', '.txt')])
+
+    self.assertEqual([stage for stage, _, _ in self.cache.entries()],
+                     ['a', 'b', 'b'], 'Every cached output is listed')
+    self.assertEqual(
+        self.cache.invalidate(['b']), 2, "Only the given stages are removed")
+    self.assertEqual([stage for stage, _, _ in self.cache.entries()], ['a'],
+                     'Other stages are kept')
+    self.assertEqual(self.cache.invalidate(), 2,
+                     'Every stage and the file hashes are removed')
+    self.assertEqual(
+        os.listdir(self.cache.cache_dir), [], 'The cache is empty')
+
+
+if __name__ == '__main__':
+  unittest.main()
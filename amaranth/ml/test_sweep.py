@@ -0,0 +1,129 @@
+# Lint as: python3
+"""These tests ensure the hyperparameter sweep trains each configuration."""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from amaranth.ml import benchmark
+from amaranth.ml import sweep
+
+
+class TestSweep(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.tmp_dir = tempfile.TemporaryDirectory()
+    fdc_data_dir = os.path.join(cls.tmp_dir.name, 'fdc')
+    os.makedirs(fdc_data_dir)
+    benchmark.generate_fdc_data(fdc_data_dir, 400, seed=1)
+
+    cls.configs = sweep.grid_search({
+        'hidden_units': [[4], [8, 4]],
+        'epochs': [1],
+        'high_calorie_threshold': [300, 400],
+    })
+    # Both encodings' data are prepared, so trials can be run with either
+    cls.data_paths = sweep.prepare_data(
+        cls.configs + [dict(cls.configs[0], hash_buckets=64)],
+        os.path.join(cls.tmp_dir.name, 'sweep'), fdc_data_dir,
+        os.path.join(cls.tmp_dir.name, 'cache'))
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.tmp_dir.cleanup()
+
+  def test_grid_search(self):
+    self.assertEqual(len(self.configs), 4, 'Every combination is listed')
+    self.assertEqual(
+        {(tuple(config['hidden_units']), config['high_calorie_threshold'])
+         for config in self.configs}, {((4,), 300), ((4,), 400),
+                                        ((8, 4), 300), ((8, 4), 400)},
+        'Combinations are distinct')
+    self.assertTrue(
+        all(config['learning_rate'] == sweep.DEFAULT_CONFIG['learning_rate']
+            for config in self.configs),
+        'Unsearched hyperparameters have their defaults')
+
+    configs = sweep.grid_search(sweep.SPACES['batching'])
+    self.assertEqual(
+        len(configs), 3,
+        'Flatten models are never trained on length-bucketed batches')
+
+  def test_random_search(self):
+    space = {'embedding_dim': [2, 4, 8], 'learning_rate': [0.1, 0.01]}
+    configs = sweep.random_search(space, 4, seed=1)
+
+    self.assertEqual(len(configs), 4, 'The number of trials is sampled')
+    self.assertEqual(
+        len({(config['embedding_dim'], config['learning_rate'])
+             for config in configs}), 4, 'Sampled combinations are distinct')
+    self.assertEqual(configs, sweep.random_search(space, 4, seed=1),
+                     'Sampling is deterministic')
+    self.assertEqual(
+        len(sweep.random_search(space, 10)), 6,
+        'At most every combination is sampled')
+
+  def test_prepare_data(self):
+    self.assertEqual(
+        set(self.data_paths['calorie_classes']),
+        {f'{sweep.DEFAULT_CONFIG["low_calorie_threshold"]},{high}'
+         for high in (300, 400)}, 'Each threshold pair is labelled')
+    self.assertEqual(
+        set(self.data_paths['inputs']), {'None', '64'},
+        'Each encoding is preprocessed')
+    self.assertEqual(self.data_paths['vocab_size']['64'], 64,
+                     'Hashed models embed one id per bucket')
+
+    num_examples = len(
+        np.load(self.data_paths['inputs']['None'], mmap_mode='r'))
+    train_indices = np.load(self.data_paths['train_indices'])
+    validation_indices = np.load(self.data_paths['validation_indices'])
+    self.assertEqual(
+        len(train_indices), int(sweep.TRAIN_FRAC * num_examples),
+        'Training indices are saved')
+    self.assertFalse(
+        set(train_indices) & set(validation_indices),
+        'Validation indices are disjoint from training indices')
+
+  def test_run_trial(self):
+    config = dict(self.configs[0], pooling='average', bucket_batches=True)
+    result = sweep.run_trial(config, self.data_paths)
+
+    self.assertEqual(result['config'], config, 'Results include their config')
+    self.assertGreaterEqual(result['validation_accuracy'], 0)
+    self.assertLessEqual(result['validation_accuracy'], 1)
+    self.assertGreater(result['train_seconds'], 0, 'Training is timed')
+    self.assertGreater(result['validation_examples_per_sec'], 0,
+                       'Throughput is measured')
+
+    hashed = sweep.run_trial(
+        dict(self.configs[0], hash_buckets=64), self.data_paths)
+    self.assertGreater(
+        hashed['num_params'], result['num_params'],
+        'Hashed models embed every bucket, more than this small vocabulary')
+
+  def test_run_sweep(self):
+    finished = []
+    leaderboard = sweep.run_sweep(
+        self.configs[:2],
+        self.data_paths,
+        num_workers=2,
+        threads_per_worker=1,
+        on_result=finished.append)
+
+    self.assertEqual(len(leaderboard), 2, 'Every configuration is trained')
+    self.assertEqual(
+        len(finished), 2, 'Each result is reported when it finishes')
+    self.assertNotIn(os.getpid(), [result['pid'] for result in leaderboard],
+                     'Configurations are trained in worker processes')
+    self.assertGreaterEqual(
+        leaderboard[0]['validation_accuracy'],
+        leaderboard[1]['validation_accuracy'],
+        'The leaderboard is sorted by validation accuracy')
+    self.assertIn('Val acc', sweep.format_leaderboard(leaderboard))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,138 @@
+# Lint as: python3
+"""These tests ensure correctness for the Tokenizer class."""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from amaranth.ml import tokenizer as tok
+
+
+class TestTokenizer(unittest.TestCase):
+
+  def test_normalize(self):
+    tokenizer = tok.Tokenizer()
+    self.assertEqual(
+        tokenizer.normalize('Mac & Cheese, (Large)'), 'mac  cheese large',
+        'Normalizing lowercases and removes filtered characters')
+    self.assertEqual(
+        tokenizer.normalize_batch(['A-B', 'C.D']), ['ab', 'cd'],
+        'Normalizing a batch normalizes each dish name')
+    self.assertEqual(
+        tokenizer.normalize_batch(
+            pd.Series(['A-B', 'C.D', 'A-B'], dtype='category')),
+        ['ab', 'cd', 'ab'],
+        'Normalizing a categorical batch normalizes each dish name')
+    self.assertEqual(
+        tok.Tokenizer(filters='x').normalize('Xbox!'), 'bo!',
+        'Only the given filters are removed')
+
+  def test_fit(self):
+    tokenizer = tok.Tokenizer(min_count=2).fit(
+        ['Cheese Burger', 'Veggie burger', 'cheese pizza with extra cheese'])
+    self.assertEqual(
+        tokenizer.vocab, {
+            'cheese': 1,
+            'burger': 2
+        },
+        ('Tokens appearing at least min_count times get ids in order of first '
+         'appearance, starting at 1'))
+    self.assertEqual(tokenizer.max_length, 5,
+                     'max_length is the length of the longest dish name')
+    self.assertEqual(tokenizer.num_ids, 3,
+                     'num_ids counts the padding id and every token id')
+    self.assertEqual(
+        tok.Tokenizer(max_length=2).fit(['a b c']).max_length, 2,
+        'An explicit max_length is kept when fitting')
+
+  def test_fit_length_coverage(self):
+    dish_names = ['a', 'a b', 'a b', 'b', 'a b c d e f g h']
+    tokenizer = tok.Tokenizer(length_coverage=0.8).fit(dish_names)
+    self.assertEqual(tokenizer.max_length, 2,
+                     'max_length covers length_coverage of the dish names')
+    np.testing.assert_array_equal(
+        tokenizer.length_counts, [0, 2, 2, 0, 0, 0, 0, 0, 1],
+        'The number of dish names of each length is counted')
+
+    ids, lengths = tokenizer.encode_batch(['a b c d e f g h'])
+    np.testing.assert_array_equal(ids, [[1, 2]],
+                                  'Longer dish names are truncated')
+    np.testing.assert_array_equal(lengths, [2],
+                                  'Lengths are counted after truncation')
+
+  def test_encode_batch(self):
+    tokenizer = tok.Tokenizer().fit(['cheese burger', 'caesar salad'])
+    ids, lengths = tokenizer.encode_batch(['Cheese Salad', 'Fries!', ''])
+    np.testing.assert_array_equal(
+        ids, [[1, 4], [0, 0], [0, 0]],
+        'Dish names are normalized and encoded as padded rows of token ids')
+    np.testing.assert_array_equal(lengths, [2, 1, 0],
+                                  'Lengths are the number of unpadded ids')
+
+  def test_save_load(self):
+    tokenizer = tok.Tokenizer(
+        filters='!?', max_length=3, oov_id=5).fit(['one two', 'three'])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'tokenizer.json')
+      tokenizer.save(path)
+      loaded = tok.Tokenizer.load(path)
+
+    self.assertEqual(
+        (loaded.filters, loaded.max_length, loaded.oov_id, loaded.vocab),
+        (tokenizer.filters, tokenizer.max_length, tokenizer.oov_id,
+         tokenizer.vocab), 'Loaded tokenizers are identical to saved ones')
+    self.assertEqual(
+        tokenizer.to_json()['vocab'], ['', 'one', 'two', 'three', '', ''],
+        'Saved vocabs list each token at the index of its id')
+    with self.assertRaises(
+        ValueError,
+        msg='Loading a tokenizer with an unknown version raises a ValueError'):
+      tok.Tokenizer.from_json(dict(tokenizer.to_json(), version=0))
+
+    config = tokenizer.to_json()
+    del config['num_buckets'], config['ngram_size']
+    self.assertEqual(
+        tok.Tokenizer.from_json(dict(config, version=1)).vocab,
+        tokenizer.vocab, 'Version 1 tokenizers can still be loaded')
+
+  def test_char_ngrams(self):
+    self.assertEqual(tok.char_ngrams('fries'),
+                     ['<fr', 'fri', 'rie', 'ies', 'es>'],
+                     'Tokens are wrapped and split into overlapping n-grams')
+    self.assertEqual(tok.char_ngrams('a'), ['<a>'])
+    self.assertEqual(
+        tok.char_ngrams('a', ngram_size=4), ['<a>'],
+        'Wrapped tokens shorter than an n-gram are a single n-gram')
+
+  def test_hashed_encode_batch(self):
+    tokenizer = tok.Tokenizer(num_buckets=16).fit(['cheese burger', 'fries'])
+    self.assertEqual(tokenizer.max_length, 12,
+                     'max_length counts n-grams rather than tokens')
+    self.assertEqual(tokenizer.num_ids, 17)
+
+    ids, lengths = tokenizer.encode_batch(['Fries!', 'Chili Fries', ''])
+    fries_ids = [tok.ngram_id(ngram, 16) for ngram in tok.char_ngrams('fries')]
+    np.testing.assert_array_equal(
+        ids[0], fries_ids + [0] * 7,
+        'Dish names are encoded as the hashed ids of their n-grams')
+    np.testing.assert_array_equal(lengths, [5, 10, 0])
+    self.assertTrue(((ids[1, :10] >= 1) & (ids[1, :10] <= 16)).all(),
+                    'Unseen tokens are hashed into the buckets too')
+    self.assertEqual(tok.ngram_id('<ch', 16), 9,
+                     'N-grams are hashed with CRC-32, like the Chrome extension')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'tokenizer.json')
+      tokenizer.save(path)
+      loaded = tok.Tokenizer.load(path)
+    self.assertEqual(loaded.to_json()['vocab'], [],
+                     'Hashing tokenizers save no vocabulary')
+    np.testing.assert_array_equal(
+        loaded.encode_batch(['Chili Fries'])[0], ids[1:2],
+        'Loaded hashing tokenizers encode identically')
+
+
+if __name__ == '__main__':
+  unittest.main()
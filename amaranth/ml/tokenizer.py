@@ -0,0 +1,375 @@
+# Lint as: python3
+"""This module defines the tokenizer that turns dish names into model inputs.
+
+A tokenizer normalizes dish names (lowercasing them and removing filtered
+characters), splits them into space-separated tokens, and maps each token to an
+integer id. Tokenizers are saved as versioned JSON files that are shared between
+the Python code and the Chrome extension, so both encode dish names identically.
+
+Instead of looking tokens up in a vocabulary, a tokenizer can hash them: each
+token is split into character n-grams (see char_ngrams), and each n-gram's id is
+its CRC-32 modulo a fixed number of buckets (see ngram_id). The embedding table
+then has a fixed size however large the corpus is, no vocabulary needs to be
+stored or looked up, and unseen tokens still share ids with the seen tokens
+they have n-grams in common with, rather than all becoming out-of-vocabulary.
+
+The saved format is a JSON object with these keys:
+  version: TOKENIZER_FORMAT_VERSION
+  filters: The characters removed from dish names
+  max_length: The number of token (or n-gram) ids in each encoded dish name
+  oov_id: The id of out-of-vocabulary tokens
+  vocab: A list of tokens, where each token's id is its index in the list. An
+    empty string marks an id that no token maps to (e.g. the padding id)
+  num_buckets: The number of buckets n-grams are hashed into, or null if tokens
+    are looked up in vocab (added in version 2)
+  ngram_size: The number of characters in each n-gram, or null (added in
+    version 2)
+"""
+
+import json
+from typing import Iterable
+import zlib
+
+import numpy as np
+
+from amaranth.ml import corpus_stats
+from amaranth.ml import lib
+
+# Version of the saved tokenizer format. Bump this whenever the format changes.
+TOKENIZER_FORMAT_VERSION = 2
+# Oldest saved format that can still be loaded
+MIN_TOKENIZER_FORMAT_VERSION = 1
+# Default chars to remove from dish names
+DEFAULT_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+# Id of padding and, by default, out-of-vocabulary tokens
+PADDING_ID = 0
+# Default number of characters in each hashed n-gram
+NGRAM_SIZE = 3
+# Marks the start and end of a token, so n-grams at its edges differ from those
+# in its middle
+TOKEN_START = '<'
+TOKEN_END = '>'
+
+
+def char_ngrams(token: str, ngram_size: int = NGRAM_SIZE):
+  """Splits a token into overlapping character n-grams.
+
+  The token is wrapped in TOKEN_START and TOKEN_END first. Wrapped tokens no
+  longer than ngram_size are a single n-gram.
+
+  Args:
+    token (str): The token to split
+    ngram_size (int): The number of characters in each n-gram
+
+  Returns:
+    ngrams (List[str]): The n-grams of the wrapped token, in order
+  """
+
+  wrapped = TOKEN_START + token + TOKEN_END
+  return [
+      wrapped[start:start + ngram_size]
+      for start in range(max(len(wrapped) - ngram_size, 0) + 1)
+  ]
+
+
+def ngram_id(ngram: str, num_buckets: int):
+  """Hashes an n-gram to an id between 1 and num_buckets.
+
+  Args:
+    ngram (str): The n-gram to hash
+    num_buckets (int): The number of ids n-grams are hashed to
+
+  Returns:
+    id (int): The CRC-32 of the n-gram's UTF-8 bytes, modulo num_buckets, plus
+    1 (so no n-gram shares PADDING_ID)
+  """
+
+  return zlib.crc32(ngram.encode('utf-8')) % num_buckets + 1
+
+
+class Tokenizer:
+  """Normalizes dish names and encodes them as fixed-length token id arrays.
+
+  Attributes:
+    filters (str): The characters removed from dish names
+    min_count (int): The number of times a token needs to appear in the corpus
+      passed to fit to be in the vocabulary
+    max_length (int): The number of token ids in each encoded dish name. Longer
+      dish names are truncated
+    length_coverage (float): If max_length is None, the fraction of dish names
+      passed to fit that max_length is chosen to fit without truncation
+    oov_id (int): The id of out-of-vocabulary tokens
+    vocab (Dict[str, int]): A mapping from tokens to their ids
+    num_buckets (int): If not None, tokens are encoded as the ids of their
+      character n-grams (see ngram_id) instead of looked up in vocab, and
+      max_length counts n-grams rather than tokens
+    ngram_size (int): The number of characters in each hashed n-gram
+    length_counts (np.ndarray): How many dish names passed to fit had each
+      number of tokens (or n-grams, if hashing) (this isn't saved)
+  """
+
+  def __init__(self,
+               filters: str = DEFAULT_FILTERS,
+               min_count: int = 1,
+               max_length: int = None,
+               oov_id: int = PADDING_ID,
+               length_coverage: float = 1.0,
+               num_buckets: int = None,
+               ngram_size: int = NGRAM_SIZE):
+    self.filters = filters
+    self.min_count = min_count
+    self.max_length = max_length
+    self.length_coverage = length_coverage
+    self.oov_id = oov_id
+    self.vocab = {}
+    self.num_buckets = num_buckets
+    self.ngram_size = ngram_size
+    self.length_counts = np.zeros(0, dtype=np.int64)
+    self._translation_table = str.maketrans('', '', filters)
+
+  @property
+  def num_ids(self):
+    """The number of distinct ids this tokenizer can produce."""
+    if self.num_buckets is not None:
+      return self.num_buckets + 1
+    return max([self.oov_id, PADDING_ID, *self.vocab.values()]) + 1
+
+  def normalize(self, dish_name: str):
+    """Lowercases a dish name and removes filtered characters from it.
+
+    Args:
+      dish_name (str): The dish name to normalize
+
+    Returns:
+      normalized_dish_name (str): The normalized dish name
+    """
+
+    return dish_name.lower().translate(self._translation_table)
+
+  def normalize_batch(self, dish_names: Iterable[str], num_workers: int = 1):
+    """Normalizes every dish name in an iterable.
+
+    Each dish name is normalized exactly like normalize does, but in chunks
+    (see lib.normalize_strings). If dish_names is a categorical pd.Series,
+    each distinct dish name is only normalized once.
+
+    Args:
+      dish_names (Iterable[str]): The dish names to normalize
+      num_workers (int): The number of threads to normalize chunks on
+
+    Returns:
+      normalized_dish_names (List[str]): The normalized dish names, in order
+    """
+
+    return lib.normalize_strings(dish_names, self.filters, num_workers)
+
+  def tokenize(self, dish_name: str):
+    """Normalizes a dish name and splits it into tokens.
+
+    Args:
+      dish_name (str): The dish name to tokenize
+
+    Returns:
+      tokens (List[str]): The tokens of the normalized dish name
+    """
+
+    return self.normalize(dish_name).split()
+
+  def subword_batch(self, dish_names: Iterable[str]):
+    """Replaces each token of normalized dish names with its n-grams.
+
+    Args:
+      dish_names (Iterable[str]): The normalized dish names
+
+    Returns:
+      subwords (List[str]): The space-separated n-grams of each dish name's
+      tokens, in order
+    """
+
+    # Dish names share most of their tokens, so each is only split once
+    token_subwords = {}
+
+    def subwords(token):
+      if token not in token_subwords:
+        token_subwords[token] = ' '.join(char_ngrams(token, self.ngram_size))
+      return token_subwords[token]
+
+    return [
+        ' '.join([subwords(token) for token in dish_name.split()])
+        for dish_name in dish_names
+    ]
+
+  def fit(self, dish_names: Iterable[str], normalize: bool = True):
+    """Builds the vocabulary from a corpus of dish names.
+
+    Every token that appears at least min_count times is given a unique id,
+    in order of first appearance, starting at 1. If max_length is None, it's
+    set to the smallest number of tokens that length_coverage of the dish
+    names have at most (so the longest dish name, by default). Hashing
+    tokenizers have no vocabulary, so only their max_length (in n-grams) is
+    fit.
+
+    Args:
+      dish_names (Iterable[str]): The corpus of dish names
+      normalize (bool): Whether dish_names still need to be normalized
+
+    Returns:
+      self (Tokenizer): This tokenizer, for chaining
+    """
+
+    if normalize:
+      dish_names = self.normalize_batch(dish_names)
+    if self.num_buckets is not None:
+      dish_names = self.subword_batch(dish_names)
+
+    return self.fit_stats(corpus_stats.compute(dish_names))
+
+  def fit_stats(self, stats: corpus_stats.CorpusStats):
+    """Builds the vocabulary from the statistics of a corpus of dish names.
+
+    This fits the tokenizer exactly like fit on the (normalized) corpus would,
+    so statistics computed in parallel (see corpus_stats.compute) or shared
+    with other consumers can be reused.
+
+    Args:
+      stats (corpus_stats.CorpusStats): The statistics of the normalized corpus
+        (or, for hashing tokenizers, of its subword_batch)
+
+    Returns:
+      self (Tokenizer): This tokenizer, for chaining
+    """
+
+    if self.num_buckets is None:
+      keep_tokens = [
+          token for token, cnt in stats.token_counts.items()
+          if cnt >= self.min_count
+      ]
+      self.vocab = {token: idx for idx, token in enumerate(keep_tokens, 1)}
+    self.length_counts = stats.length_counts.copy()
+    if self.max_length is None:
+      self.max_length = stats.percentile_length(self.length_coverage)
+
+    return self
+
+  def encode_batch(self,
+                   dish_names: Iterable[str],
+                   normalize: bool = True,
+                   out: np.ndarray = None):
+    """Encodes dish names as a matrix of token ids.
+
+    Args:
+      dish_names (Iterable[str]): The dish names to encode
+      normalize (bool): Whether dish_names still need to be normalized
+      out (np.ndarray): An optional (n, max_length) array to write ids into
+
+    Returns:
+      ids (np.ndarray): An (n, max_length) matrix of token ids, padded with
+      PADDING_ID
+      lengths (np.ndarray): An (n,) array with the number of (unpadded) ids in
+      each row of ids
+    """
+
+    if normalize:
+      dish_names = self.normalize_batch(dish_names)
+
+    vocab = self.vocab
+    if self.num_buckets is not None:
+      dish_names = self.subword_batch(dish_names)
+      # Only hash each distinct n-gram once
+      vocab = {}
+      for start in range(0, len(dish_names), lib.ENCODE_CHUNK_SIZE):
+        ngrams = ' '.join(dish_names[start:start + lib.ENCODE_CHUNK_SIZE])
+        vocab.update({
+            ngram: ngram_id(ngram, self.num_buckets)
+            for ngram in set(ngrams.split()) - vocab.keys()
+        })
+
+    return lib.encode_corpus(
+        dish_names,
+        vocab,
+        self.max_length,
+        oov_value=self.oov_id,
+        padding_value=PADDING_ID,
+        out=out)
+
+  def to_json(self):
+    """Converts this tokenizer to its JSON-serializable saved format.
+
+    Returns:
+      config (dict): This tokenizer's saved format
+    """
+
+    vocab_list = []
+    if self.num_buckets is None:
+      vocab_list = [''] * self.num_ids
+    for token, idx in self.vocab.items():
+      vocab_list[idx] = token
+
+    return {
+        'version': TOKENIZER_FORMAT_VERSION,
+        'filters': self.filters,
+        'max_length': self.max_length,
+        'oov_id': self.oov_id,
+        'vocab': vocab_list,
+        'num_buckets': self.num_buckets,
+        'ngram_size': None if self.num_buckets is None else self.ngram_size,
+    }
+
+  @classmethod
+  def from_json(cls, config: dict):
+    """Creates a tokenizer from its saved format.
+
+    Args:
+      config (dict): A tokenizer's saved format, as returned by to_json
+
+    Returns:
+      tokenizer (Tokenizer): The tokenizer
+
+    Raises:
+      ValueError: If config's version isn't between
+        MIN_TOKENIZER_FORMAT_VERSION and TOKENIZER_FORMAT_VERSION
+    """
+
+    version = config.get('version')
+    if not (isinstance(version, int) and
+            MIN_TOKENIZER_FORMAT_VERSION <= version <= TOKENIZER_FORMAT_VERSION):
+      raise ValueError(
+          f'Unsupported tokenizer format version {version}, expected '
+          f'{MIN_TOKENIZER_FORMAT_VERSION} to {TOKENIZER_FORMAT_VERSION}')
+
+    tokenizer = cls(
+        filters=config['filters'],
+        max_length=config['max_length'],
+        oov_id=config['oov_id'],
+        num_buckets=config.get('num_buckets'),
+        ngram_size=config.get('ngram_size') or NGRAM_SIZE)
+    tokenizer.vocab = {
+        token: idx for idx, token in enumerate(config['vocab']) if token
+    }
+
+    return tokenizer
+
+  def save(self, path: str):
+    """Saves this tokenizer to a JSON file.
+
+    Args:
+      path (str): The file to save this tokenizer to
+    """
+
+    with open(path, 'w') as file:
+      json.dump(self.to_json(), file, separators=(',', ':'))
+
+  @classmethod
+  def load(cls, path: str):
+    """Loads a tokenizer from a JSON file.
+
+    Args:
+      path (str): A file saved by Tokenizer.save
+
+    Returns:
+      tokenizer (Tokenizer): The loaded tokenizer
+    """
+
+    with open(path) as file:
+      return cls.from_json(json.load(file))
+
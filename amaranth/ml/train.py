@@ -2,133 +2,102 @@
 """This script is used to build and train a nutrient-prediction ML model."""
 
 # Define imports and constants
+import argparse
 import os
-import json
-from collections import defaultdict
+from typing import Sequence
 import numpy as np
-import pandas as pd
-import sklearn.model_selection
 import tensorflow as tf
 from tensorflow import keras
 
 import amaranth
+from amaranth.ml import dataset
+from amaranth.ml import instrumentation
+from amaranth.ml import layers
 from amaranth.ml import lib
+from amaranth.ml import numpy_model
+from amaranth.ml import preprocess
+from amaranth.ml import quantize
+from amaranth.ml import registry
 
 # Directories to write files to
 FDC_DATA_DIR = '../../data/fdc/'  # Data set directory
+CACHE_DIR = '../../data/fdc/cache/'  # Preprocessing stage cache directory
 MODEL_IMG_DIR = '../../docs/img/'  # Model image directory
-RESOURCES_DIR = '../resources/'  # Project resources directory
+QUANTIZED_DIR = '../resources/quantized/'  # Quantized model directory
 CHROME_EXT_DIR = 'amaranth-chrome-ext/assets'  # Chrome extension directory
 # Fraction of data that should be used for training, validation, and testing.
 # Should all sum to 1.0.
 TRAIN_FRAC = 0.6
 VALIDATION_FRAC = 0.2
 TEST_FRAC = 0.2
+# How the model combines the embeddings of a dish name's tokens: 'flatten'
+# concatenates every (padded) position's embedding, and 'average' averages the
+# unpadded tokens' embeddings, so it accepts inputs of any length
+POOLING_MODES = ('flatten', 'average')
 # Times a token needs to appear to be in model's vocab
 MIN_TOKEN_APPEARANCE = 3
+# Fraction of dish names that fit in the model's input without truncation
+# (the rest are truncated to the length that covers this fraction)
+LENGTH_COVERAGE = 0.995
+# Dish names per batch when comparing truncated and untruncated latency
+LATENCY_BATCH_SIZE = 1024
 # Chars to remove from dish names
 DISH_NAME_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
 
 
-def main():
-  print(f'Tensorflow version {tf.__version__}')
+def build_model(vocab_size: int,
+                max_length: int,
+                embedding_dim: int = None,
+                hidden_units: Sequence[int] = amaranth.HIDDEN_UNITS,
+                learning_rate: float = amaranth.LEARNING_RATE,
+                pooling: str = 'flatten'):
+  """Builds and compiles the calorie classification model.
 
-  # Get data directory path
-  current_dir = os.path.dirname(__file__)
-  abs_fdc_data_dir = os.path.join(current_dir, FDC_DATA_DIR)
+  Args:
+    vocab_size (int): The largest token id (the vocabulary size, or the number
+      of hash buckets)
+    max_length (int): The number of token ids in each encoded dish name. Models
+      with 'average' pooling also accept inputs of other lengths
+    embedding_dim (int): The size of each token's embedding. Defaults to the
+      fourth root of the vocabulary size
+    hidden_units (Sequence[int]): The number of units in each hidden (sigmoid)
+      dense layer
+    learning_rate (float): Adam's learning rate
+    pooling (str): How token embeddings are combined, one of POOLING_MODES
 
-  # Read data from disk
-  food = pd.read_csv(os.path.join(abs_fdc_data_dir, 'food.csv'))
-  nutrient = pd.read_csv(os.path.join(
-      abs_fdc_data_dir, 'nutrient.csv')).rename(columns={'id': 'nutrient_id'})
-  food_nutrient = pd.read_csv(
-      os.path.join(abs_fdc_data_dir, 'food_nutrient.csv'))
-  combined = lib.combine_dataframes('fdc_id', food, food_nutrient)
-  combined = lib.combine_dataframes('nutrient_id', combined, nutrient)
-
-  # Extract and format calorie data
-  calorie_data = lib.get_calorie_data(combined, 'kcal')
-  calorie_data = calorie_data[[
-      'description', 'data_type', 'name', 'amount', 'unit_name'
-  ]]  # Keep only relevant cols
-  calorie_data = lib.clean_data(calorie_data)
-  lib.add_calorie_labels(
-      calorie_data,
-      low_calorie_threshold=amaranth.LOW_CALORIE_THRESHOLD,
-      high_calorie_threshold=amaranth.HIGH_CALORIE_THRESHOLD)
-
-  # Normalize input strings
-  # Step 1: convert strings to lowercase
-  # Step 2: filter out characters present in DISH_NAME_FILTERS
-  # Step 3: re-combine characters back to a normal string
-  calorie_data['description'] = calorie_data['description'].apply(
-      lambda desc: desc.lower(),  # Step 1
-  ).apply(
-      lambda desc: [char for char in desc
-                    if char not in DISH_NAME_FILTERS],  # Step 2
-  ).apply(
-      ''.join,  #Step 3
-  )
-
-  # Do some preprocessing and calculations for encoding
-  corpus = calorie_data['description']
-  vocab_size = lib.num_unique_words(corpus)
-  tokenized_corpus = corpus.map(lambda desc: desc.split(' '))
-  max_corpus_length = lib.max_sequence_length(tokenized_corpus)
-
-  # Count appearances of each word in dataset
-  tokenizer_cnt = defaultdict(int)
-  for dish_name in calorie_data['description']:
-    for token in dish_name.split():
-      tokenizer_cnt[token] += 1
-
-  # Only 'remember' words that appear at least MIN_TOKEN_APPEARANCE times
-  keep_tokens = []
-  for token, cnt in tokenizer_cnt.items():
-    if cnt >= MIN_TOKEN_APPEARANCE:
-      keep_tokens.append(token)
-
-  # Assign each token a unique number and create a dict that maps those tokens
-  # to their unique value
-  rev_tokenizer_lst = enumerate(keep_tokens)
-  tokenizer_lst = [(token, idx) for idx, token in rev_tokenizer_lst]
-  tokenizer = dict(tokenizer_lst)
-
-  # The string 'OOV' denotes words that are out-of-vocabulary
-  # It's equal to zero because keras' one_hot function generates indices that
-  # are in the range [1, vocab_size], so zero is free.
-  tokenizer['OOV'] = 0
-
-  json.dump(
-      tokenizer,
-      open(os.path.join(CHROME_EXT_DIR, 'tokenizer.json'), 'w'),
-      separators=(',', ':'))
+  Returns:
+    model (keras.Sequential): The compiled, untrained model
+  """
 
-  calorie_data['input'] = calorie_data.apply(
-      lambda row: [
-          tokenizer[token] if token in tokenizer else tokenizer['OOV']
-          for token in row['description'].split()
-      ],
-      axis=1)
+  if pooling not in POOLING_MODES:
+    raise ValueError(
+        f'Unknown pooling mode {pooling}, expected one of {POOLING_MODES}')
+  if embedding_dim is None:
+    embedding_dim = int((vocab_size + 1)**(1 / 4))
 
-  # Pad 'input' column to all be the same length for embedding input
-  calorie_data['input'] = calorie_data.apply(
-      lambda row: lib.pad_list(row['input'], max_corpus_length, 0), axis=1)
+  if pooling == 'flatten':
+    embedding_layers = [
+        keras.layers.Embedding(
+            vocab_size + 1, embedding_dim, input_length=max_length),
+        keras.layers.Flatten(),
+    ]
+  else:
+    # Padding (and out-of-vocabulary tokens, which share its id) is masked out
+    # of the average
+    embedding_layers = [
+        keras.layers.Embedding(vocab_size + 1, embedding_dim, mask_zero=True),
+        layers.MaskedAveragePooling1D(),
+    ]
 
-  # Create model
   model = keras.Sequential([
-      keras.layers.Embedding(
-          vocab_size + 1,
-          int((vocab_size + 1)**(1 / 4)),
-          input_length=max_corpus_length),
-      keras.layers.Flatten(),
-      keras.layers.Dense(32, activation='sigmoid'),
-      keras.layers.Dense(10, activation='sigmoid'),
+      *embedding_layers,
+      *[keras.layers.Dense(units, activation='sigmoid')
+        for units in hidden_units],
       keras.layers.Dense(3, activation='softmax'),
   ])
 
   model.compile(
-      optimizer='adam',
+      optimizer=keras.optimizers.Adam(learning_rate),
       loss='categorical_crossentropy',
       metrics=[
           'categorical_accuracy',
@@ -136,6 +105,191 @@ def main():
           keras.metrics.Recall(),
       ])
 
+  return model
+
+
+def report_truncation(tokenizer,
+                      vocab_size: int,
+                      pooling: str,
+                      metrics: instrumentation.RunMetrics,
+                      measure_latency: bool = False):
+  """Prints how much truncating dish names to tokenizer.max_length saves.
+
+  The savings are measured against padding every dish name to the longest one:
+  the fraction of dish names and tokens truncated, the size of the encoded
+  input matrix, and optionally the latency of an untrained model on a batch of
+  LATENCY_BATCH_SIZE dish names.
+
+  Args:
+    tokenizer (amaranth.ml.tokenizer.Tokenizer): The fitted tokenizer
+    vocab_size (int): The largest token id
+    pooling (str): The model's pooling mode
+    metrics (instrumentation.RunMetrics): Records the same numbers as counts
+    measure_latency (bool): Whether to also time both input widths, which
+      builds and runs two extra models
+  """
+
+  length_counts = tokenizer.length_counts
+  max_length = tokenizer.max_length
+  longest = len(length_counts) - 1
+  num_examples = int(length_counts.sum())
+  lengths = np.arange(len(length_counts))
+  truncated_examples = int(length_counts[max_length + 1:].sum())
+  truncated_tokens = int(
+      (length_counts[max_length + 1:] * (lengths[max_length + 1:] - max_length)
+      ).sum())
+  num_tokens = int((length_counts * lengths).sum())
+
+  matrix_mb = [num_examples * width * 4 / 2**20 for width in (longest,
+                                                                max_length)]
+
+  print(f'\nTruncating dish names to {max_length} tokens (the longest has '
+        f'{longest})')
+  print(f'Truncated {truncated_examples} of {num_examples} dish names '
+        f'({truncated_examples / max(num_examples, 1):.3%}) and '
+        f'{truncated_tokens / max(num_tokens, 1):.3%} of tokens')
+  print(f'Input matrix: {matrix_mb[1]:.1f} MB instead of {matrix_mb[0]:.1f} MB')
+
+  metrics.count('longest_length', longest)
+  metrics.count('truncated_examples', truncated_examples)
+  metrics.count('truncated_tokens', truncated_tokens)
+  metrics.count('input_matrix_bytes_saved',
+                (matrix_mb[0] - matrix_mb[1]) * 2**20)
+
+  if measure_latency:
+    # Both widths are timed on untrained models, since only the shapes matter
+    latencies_ms = [
+        quantize.measure_latency(
+            build_model(vocab_size, width, pooling=pooling),
+            np.zeros((LATENCY_BATCH_SIZE, width), dtype=np.int32))
+        for width in (longest, max_length)
+    ]
+    print(f'Latency per {LATENCY_BATCH_SIZE} dish names: '
+          f'{latencies_ms[1]:.2f} ms instead of {latencies_ms[0]:.2f} ms')
+    metrics.count('batch_latency_us_saved',
+                  (latencies_ms[0] - latencies_ms[1]) * 1000)
+  print()
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Build and train the calorie classification model.')
+  parser.add_argument(
+      '--pooling',
+      choices=POOLING_MODES,
+      default='flatten',
+      help=("how to combine token embeddings: 'flatten' (what the Chrome "
+            "extension expects) or 'average', which ignores padding"))
+  parser.add_argument(
+      '--bucket-batches',
+      action='store_true',
+      help=('batch dish names of similar lengths together and only pad each '
+            "batch to its longest dish name (requires --pooling average)"))
+  parser.add_argument(
+      '--length-coverage',
+      type=float,
+      default=LENGTH_COVERAGE,
+      help=('fraction of dish names the model input fits without truncation '
+            '(1.0 pads every dish name to the longest one)'))
+  parser.add_argument(
+      '--vocab-memory-mb',
+      type=float,
+      help=('count tokens approximately in a sketch of this many MB, rather '
+            'than keeping an exact count of every token (for very large '
+            'corpora)'))
+  parser.add_argument(
+      '--hash-buckets',
+      type=int,
+      help=('encode dish names as character n-grams hashed into this many '
+            'buckets (e.g. 16384), instead of looking tokens up in a '
+            'vocabulary'))
+  parser.add_argument(
+      '--quantize',
+      action='store_true',
+      help=('also save quantized variants of the model (TFLite and NumPy) and '
+            'report how their accuracy, size, and latency compare'))
+  parser.add_argument(
+      '--metrics-file',
+      help=('JSON file to write per-stage durations, row counts, peak memory, '
+            'and epoch times to'))
+  parser.add_argument(
+      '--profile',
+      action='store_true',
+      help=('profile the run with cProfile (stats are saved next to the '
+            'metrics file, with a .prof extension)'))
+  parser.add_argument(
+      '--trace-memory',
+      action='store_true',
+      help='record the peak memory allocated during each stage (much slower)')
+
+  args = parser.parse_args(argv)
+  if (args.profile or args.trace_memory) and not args.metrics_file:
+    parser.error('--profile and --trace-memory require --metrics-file')
+  if args.bucket_batches and args.pooling != 'average':
+    parser.error('--bucket-batches requires --pooling average')
+
+  return args
+
+
+def main(argv=None):
+  args = parse_args(argv)
+  metrics = instrumentation.RunMetrics(
+      enabled=args.metrics_file is not None,
+      trace_memory=args.trace_memory,
+      profile=args.profile)
+
+  print(f'Tensorflow version {tf.__version__}')
+
+  # Get data directory path
+  current_dir = os.path.dirname(__file__)
+  abs_fdc_data_dir = os.path.join(current_dir, FDC_DATA_DIR)
+
+  # Read calorie data from disk, label it, normalize input strings, build the
+  # model's vocabulary (only 'remembering' words that appear at least
+  # MIN_TOKEN_APPEARANCE times), and encode descriptions as a padded matrix of
+  # token ids. Each of these stages is cached, and only recomputed when its
+  # inputs change. Inputs and labels are memory-mapped so they don't need to
+  # be held in memory while training.
+  with metrics.stage('preprocess'):
+    preprocessed = preprocess.preprocess(
+        abs_fdc_data_dir,
+        os.path.join(current_dir, CACHE_DIR),
+        low_calorie_threshold=amaranth.LOW_CALORIE_THRESHOLD,
+        high_calorie_threshold=amaranth.HIGH_CALORIE_THRESHOLD,
+        filters=DISH_NAME_FILTERS,
+        min_count=MIN_TOKEN_APPEARANCE,
+        length_coverage=args.length_coverage,
+        vocab_memory_bytes=(None if args.vocab_memory_mb is None else int(
+            args.vocab_memory_mb * 2**20)),
+        num_hash_buckets=args.hash_buckets,
+        metrics=metrics)
+  tokenizer = preprocessed.tokenizer
+  # Ids past the vocabulary (or the hash buckets) never appear, so they don't
+  # need embeddings
+  vocab_size = tokenizer.num_ids - 1
+  max_corpus_length = tokenizer.max_length
+  inputs = preprocessed.inputs
+  calorie_classes = preprocessed.calorie_classes
+  metrics.count('examples', len(inputs))
+  metrics.count('unique_words', preprocessed.unique_words)
+  metrics.count('vocab_size', vocab_size)
+  metrics.count('max_length', max_corpus_length)
+  # Timing the input widths is only worth its cost when the run is measured
+  report_truncation(
+      tokenizer,
+      vocab_size,
+      args.pooling,
+      metrics,
+      measure_latency=args.metrics_file is not None)
+
+  # Save tokenizer for the Chrome extension, which reads the model's input
+  # length from its max_length (Python inference loads the tokenizer published
+  # with the model, below)
+  tokenizer.save(os.path.join(CHROME_EXT_DIR, 'tokenizer.json'))
+
+  # Create model
+  model = build_model(vocab_size, max_corpus_length, pooling=args.pooling)
+
   # Model stats
   model.summary()
   model._layers = [  # Workaround for bug in keras.util.plot_model pylint: disable=protected-access
@@ -147,44 +301,111 @@ def main():
       show_layer_names=False,
       show_shapes=True)
 
-  # Split dataset
-  train_set, test_set = sklearn.model_selection.train_test_split(
-      calorie_data,
-      train_size=TRAIN_FRAC + VALIDATION_FRAC,
-      test_size=TEST_FRAC)
+  # Split dataset. If bucketing, batches of short dish names are only padded
+  # to the longest dish name in the batch
+  bucketing = {}
+  if args.bucket_batches:
+    bucketing = {
+        'lengths': preprocessed.input_lengths,
+        'bucket_boundaries': dataset.BUCKET_BOUNDARIES
+    }
+  train_indices, validation_indices, test_indices = lib.split_indices(
+      len(inputs), [TRAIN_FRAC, VALIDATION_FRAC, TEST_FRAC])
+  train_set = dataset.make_dataset(
+      inputs,
+      calorie_classes,
+      train_indices,
+      shuffle=True,
+      **bucketing)
+  validation_set = dataset.make_dataset(inputs, calorie_classes,
+                                        validation_indices, **bucketing)
+  # Predictions need to stay in order, so the test set is trimmed but not
+  # bucketed
+  test_set = dataset.make_dataset(
+      inputs, calorie_classes, test_indices, lengths=bucketing.get('lengths'))
+
+  metrics.count('train_examples', len(train_indices))
+  metrics.count('validation_examples', len(validation_indices))
+  metrics.count('test_examples', len(test_indices))
 
   # Train model
-  model.fit(
-      np.stack(train_set['input']),
-      np.stack(train_set['calorie_label']),
-      epochs=10,
-      validation_split=VALIDATION_FRAC / (TRAIN_FRAC + VALIDATION_FRAC),
-      callbacks=[keras.callbacks.TensorBoard()],
-  )
+  with metrics.stage('fit') as stage:
+    stage['rows'] = len(train_indices) * amaranth.NUM_EPOCHS
+    model.fit(
+        train_set,
+        epochs=amaranth.NUM_EPOCHS,
+        validation_data=validation_set,
+        callbacks=[keras.callbacks.TensorBoard(),
+                   metrics.epoch_callback()],
+    )
 
   # Evaluate model
-  results = model.evaluate(
-      np.stack(test_set['input']),
-      np.stack(test_set['calorie_label']),
-  )
+  with metrics.stage('evaluate') as stage:
+    stage['rows'] = len(test_indices)
+    results = model.evaluate(test_set, return_dict=True)
 
   print('\nResults:')
   print(results)
 
   # Save test set predictions, generate confusion matrix
-  predictions = model.predict(np.stack(test_set['input']))
+  with metrics.stage('predict') as stage:
+    stage['rows'] = len(test_indices)
+    predictions = model.predict(test_set)
   predictions = tf.argmax(predictions, axis=-1)
 
-  confusion = tf.math.confusion_matrix(
-      tf.argmax(np.stack(test_set['calorie_label']), axis=-1), predictions)
+  confusion = tf.math.confusion_matrix(calorie_classes[test_indices],
+                                       predictions)
 
   print('\nConfusion matrix')
   print('x-axis: prediction')
   print('y-axis: actual value')
   print(confusion)
 
-  # Save model to file
-  model.save(os.path.join(current_dir, RESOURCES_DIR, 'model'))
+  # Publish the model as a new version in the model registry, along with a
+  # NumPy export of its weights for fast inference without TensorFlow, its
+  # tokenizer, and how it was trained and scored
+  def write_artifacts(version_dir):
+    model.save(os.path.join(version_dir, registry.KERAS_MODEL_DIR))
+    numpy_model.export_keras_model(
+        model, os.path.join(version_dir, registry.NUMPY_MODEL_FILE))
+    tokenizer.save(os.path.join(version_dir, registry.TOKENIZER_FILE))
+
+  with metrics.stage('save_model'):
+    version = registry.ModelRegistry().publish(
+        write_artifacts, {
+            'low_calorie_threshold': amaranth.LOW_CALORIE_THRESHOLD,
+            'high_calorie_threshold': amaranth.HIGH_CALORIE_THRESHOLD,
+            'max_length': max_corpus_length,
+            'vocab_size': vocab_size,
+            'pooling': args.pooling,
+            'hash_buckets': args.hash_buckets,
+            'epochs': amaranth.NUM_EPOCHS,
+            'train_examples': len(train_indices),
+            'test_metrics': {
+                name: float(value) for name, value in results.items()
+            },
+        })
+  print(f'\nPublished and activated model version {version}')
+
+  if args.quantize:
+    with metrics.stage('quantize'):
+      report = quantize.export_quantized_models(
+          model,
+          os.path.join(current_dir, QUANTIZED_DIR),
+          inputs,
+          calorie_classes,
+          calibration_indices=train_indices,
+          test_indices=test_indices)
+
+    print('\nQuantized models')
+    print(quantize.format_report(report))
+
+  if args.metrics_file:
+    metrics.close()
+    metrics.save(args.metrics_file)
+    print(f'\nRun metrics written to {args.metrics_file}')
+    if args.profile:
+      print(metrics.profile_stats())
 
 
 if __name__ == '__main__':